@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+
+"""Benchmarks for the release pipeline; they run offline.
+
+Each measurement happens in a throwaway git repository whose ``origin``
+is a local bare repository. Fake ``poetry`` and ``twine`` executables
+are put first in the PATH, uploads go to a local stand-in index
+(see *fake_index.py*), and the interactive prompts are answered
+automatically. Run it from the root of the releaser checkout::
+
+    python benchmarks/bench_release.py --repeat 5
+
+Per-step timings come from the tracer of each release.
+"""
+
+import argparse
+import builtins
+import io
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager, redirect_stdout
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import releaser  # noqa: E402
+import releaser.steps  # noqa: E402
+from releaser import Releaser  # noqa: E402
+from releaser.artifacts import find_artifacts  # noqa: E402
+from releaser.git_steps import *  # noqa: E402,F403
+from releaser.regex import version_in_python_source_file  # noqa: E402
+from releaser.steps import *  # noqa: E402,F403
+from releaser.upload import Uploader  # noqa: E402
+from releaser.version import TagIndex  # noqa: E402
+
+from fake_ci import FakeCI  # noqa: E402
+from fake_index import FakeIndex  # noqa: E402
+
+FAKE_POETRY = """#!{python}
+import io, re, sys, os, tarfile, zipfile
+text = open("pyproject.toml").read()
+version = re.search(r'version = "(.+?)"', text).group(1)
+meta = "Metadata-Version: 2.1\\nName: fixture\\nVersion: %s\\n" % version
+modules = ["fixture/__init__.py", "fixture/data.bin"]
+os.makedirs("dist", exist_ok=True)
+with tarfile.open("dist/fixture-%s.tar.gz" % version, "w:gz") as tar:
+    info = tarfile.TarInfo("fixture-%s/PKG-INFO" % version)
+    info.size = len(meta)
+    tar.addfile(info, io.BytesIO(meta.encode()))
+    for name in ["pyproject.toml"] + modules:
+        tar.add(name, "fixture-%s/%s" % (version, name))
+with zipfile.ZipFile("dist/fixture-%s-py3-none-any.whl" % version, "w") as whl:
+    whl.writestr("fixture-%s.dist-info/METADATA" % version, meta)
+    for name in modules:
+        whl.write(name)
+print("Built fixture", version)
+"""
+
+FAKE_TWINE = """#!{python}
+import sys
+print("Uploading", sys.argv[-1])
+print("Server response (200): OK")
+"""
+
+PYPROJECT = """[tool.poetry]
+name = "fixture"
+version = "1.0.0.dev1"
+"""
+
+GIT_ENV = dict(
+    GIT_AUTHOR_NAME="Bench",
+    GIT_AUTHOR_EMAIL="bench@example.com",
+    GIT_COMMITTER_NAME="Bench",
+    GIT_COMMITTER_EMAIL="bench@example.com",
+)
+
+
+def sh(*args, cwd=None):
+    subprocess.run(
+        args,
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+@contextmanager
+def fixture_repo(n_rst=3):
+    """Create a git repo with a bare "origin"; chdir into it meanwhile."""
+    top = tempfile.mkdtemp(prefix="releaser-bench-")
+    origin, work, bin_dir = (os.path.join(top, d) for d in ("origin", "work", "bin"))
+    os.mkdir(bin_dir)
+    for name, template in (("poetry", FAKE_POETRY), ("twine", FAKE_TWINE)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as stream:
+            stream.write(template.format(python=sys.executable))
+        os.chmod(path, 0o755)
+    sh("git", "init", "--quiet", "--bare", "--initial-branch=master", origin)
+    sh("git", "clone", "--quiet", origin, work)
+    sh("git", "checkout", "--quiet", "-B", "master", cwd=work)
+    with open(os.path.join(work, "pyproject.toml"), "w") as stream:
+        stream.write(PYPROJECT)
+    for i in range(n_rst):
+        with open(os.path.join(work, "doc{0}.rst".format(i)), "w") as stream:
+            stream.write("Title {0}\n========\n\nSome *text*.\n".format(i))
+    os.mkdir(os.path.join(work, "fixture"))
+    with open(os.path.join(work, "fixture", "__init__.py"), "w") as stream:
+        stream.write('"""The package being released."""\n')
+    with open(os.path.join(work, "fixture", "data.bin"), "wb") as stream:
+        stream.write(os.urandom(1 << 16))
+    with open(os.path.join(work, ".gitignore"), "w") as stream:
+        stream.write("dist/\n*.tmp\n.releaser_cache/\n")
+    sh("git", "add", ".", cwd=work)
+    sh("git", "commit", "--quiet", "-m", "Initial", cwd=work)
+    sh("git", "push", "--quiet", "origin", "master", cwd=work)
+    old_cwd, old_path = os.getcwd(), os.environ["PATH"]
+    os.environ["PATH"] = bin_dir + os.pathsep + old_path
+    os.chdir(work)
+    try:
+        yield work
+    finally:
+        os.chdir(old_cwd)
+        os.environ["PATH"] = old_path
+        shutil.rmtree(top, ignore_errors=True)
+
+
+@contextmanager
+def unattended(version="1.0.0"):
+    """Answer "yes" to every question and ``version`` to input()."""
+
+    def yes(*args, **kw):
+        return True
+
+    saved = (releaser.bool_input, releaser.steps.bool_input, builtins.input)
+    releaser.bool_input = releaser.steps.bool_input = yes
+    builtins.input = lambda *a: version
+    try:
+        yield
+    finally:
+        releaser.bool_input, releaser.steps.bool_input, builtins.input = saved
+
+
+def make_releaser(*steps, **settings):
+    config = dict(
+        github_user="bench",
+        github_repository="fixture",
+        branch="master",
+        version_file="pyproject.toml",
+        version_keyword="version",
+        log_file="release.log.utf-8.tmp",
+        trace_file="",
+        verbosity="critical",
+    )
+    config.update(settings)
+    return Releaser(config, *steps)
+
+
+def reset_logging():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        handler.close()
+        root.removeHandler(handler)
+
+
+FULL_RELEASE = (
+    CheckRstFiles,  # noqa: F405
+    EnsureGitClean,  # noqa: F405
+    EnsureGitBranch,  # noqa: F405
+    SetVersionNumberInteractively,  # noqa: F405
+    CheckVersionConflicts,  # noqa: F405
+    Shell("poetry build"),  # noqa: F405
+    VerifyPackages,  # noqa: F405
+    GitCommitVersionNumber,  # noqa: F405
+    GitTag,  # noqa: F405
+    UploadPackages,  # noqa: F405
+    SetFutureVersion,  # noqa: F405
+    GitCommitVersionNumber(  # noqa: F405
+        "future_version", msg="Bump version to {0} after release"
+    ),
+    GitPush,  # noqa: F405
+    GitPushTags,  # noqa: F405
+)
+
+ROLLED_BACK_RELEASE = (
+    EnsureGitClean,  # noqa: F405
+    SetVersionNumberInteractively,  # noqa: F405
+    GitCommitVersionNumber,  # noqa: F405
+    GitTag,  # noqa: F405
+    GitPushTags,  # noqa: F405
+    ErrorStep,  # noqa: F405
+)
+
+
+def run_release(steps, **settings):
+    """Run a release in a fresh fixture; return its tracer."""
+    with fixture_repo(), unattended(), redirect_stdout(io.StringIO()):
+        rel = make_releaser(*steps, **settings)
+        try:
+            rel.release()
+        except SystemExit:
+            pass
+        finally:
+            reset_logging()
+        return rel.tracer
+
+
+def bench_release(results: Dict[str, List[float]]):
+    index = FakeIndex().start()
+    start = time.perf_counter()
+    try:
+        tracer = run_release(
+            FULL_RELEASE,
+            repository_url=index.url + "/legacy/",
+            index_url=index.url + "/pypi",
+        )
+    finally:
+        index.stop()
+    results.setdefault("release: end to end", []).append(time.perf_counter() - start)
+    for span in tracer.spans:
+        if span.category == "step":
+            results.setdefault("step: " + span.name, []).append(span.wall)
+
+
+def bench_rollback(results: Dict[str, List[float]]):
+    tracer = run_release(ROLLED_BACK_RELEASE)
+    spans = [s for s in tracer.spans if s.category == "rollback"]
+    results.setdefault("rollback: total", []).append(sum(s.wall for s in spans))
+    for span in spans:
+        results.setdefault("rollback: " + span.name, []).append(span.wall)
+
+
+def bench_version_file(results: Dict[str, List[float]], lines=200_000):
+    top = tempfile.mkdtemp(prefix="releaser-bench-")
+    path = os.path.join(top, "generated.py")
+    try:
+        with open(path, "w", encoding="utf-8") as stream:
+            for i in range(lines):
+                stream.write("CONSTANT_{0} = {0}  # generated\n".format(i))
+            stream.write('__version__ = "1.2.3"\n')
+        for label, kw in (("find", {}), ("replace", {"replace": "1.2.4"})):
+            start = time.perf_counter()
+            version_in_python_source_file(path, **kw)
+            key = "version_in_python_source_file: {0} ({1} lines)".format(label, lines)
+            results.setdefault(key, []).append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(top, ignore_errors=True)
+
+
+def bench_upload(results: Dict[str, List[float]], wheels=12, size=1 << 20):
+    """Upload many platform wheels to a slow, flaky stand-in index."""
+    top = tempfile.mkdtemp(prefix="releaser-bench-")
+    meta = "Metadata-Version: 2.1\nName: fixture\nVersion: 1.0.0\n"
+    for i in range(wheels):
+        name = "fixture-1.0.0-cp3{0}-cp3{0}-manylinux1_x86_64.whl".format(i)
+        with zipfile.ZipFile(os.path.join(top, name), "w") as whl:
+            whl.writestr("fixture-1.0.0.dist-info/METADATA", meta)
+            whl.writestr("fixture/blob", os.urandom(size))
+    paths = find_artifacts(top, "1.0.0")
+    log = logging.getLogger("bench_upload")
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+    try:
+        for workers in (1, 4):
+            index = FakeIndex(delay=0.05, flaky=1).start()
+            uploader = Uploader(
+                log,
+                repository_url=index.url + "/legacy/",
+                index_url=index.url + "/pypi",
+                workers=workers,
+                backoff=0.01,
+            )
+            start = time.perf_counter()
+            try:
+                uploader.upload_all(paths, "fixture", "1.0.0")
+            finally:
+                index.stop()
+            key = "upload: {0} wheels, {1} worker(s)".format(wheels, workers)
+            results.setdefault(key, []).append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(top, ignore_errors=True)
+
+
+def bench_ci(results: Dict[str, List[float]], pending=1.0):
+    """Wait for a CI build while running the tests, or before them."""
+    tests = Shell(sys.executable + " -c 'import time; time.sleep(1)'")  # noqa
+    for label, check in (("blocking", CheckTravis), ("background", CheckCI)):  # noqa
+        ci = FakeCI(pending=pending).start()
+        start = time.perf_counter()
+        try:
+            run_release(
+                (check, tests, SetVersionNumberInteractively),  # noqa: F405
+                ci_api_url=ci.url,
+                ci_interval=0.1,
+            )
+        finally:
+            ci.stop()
+        key = "ci: {0} check + 1s tests, build done after {1}s".format(label, pending)
+        results.setdefault(key, []).append(time.perf_counter() - start)
+
+
+def bench_log(results: Dict[str, List[float]], lines=300_000):
+    """Run a step whose command prints a lot, with and without the queue."""
+    noisy = Shell(  # noqa: F405
+        sys.executable + ' -c "for i in range({0}): '
+        "print('line %d of a noisy build' % i)\"".format(lines)
+    )
+    for label, settings in (("synchronous", {"log_async": False}), ("queued", {})):
+        tracer = run_release((noisy,), **settings)
+        key = "log: {0} lines of output, {1}".format(lines, label)
+        results.setdefault(key, []).extend(
+            s.wall for s in tracer.spans if s.category == "step"
+        )
+
+
+def bench_tags(results: Dict[str, List[float]], count=5000):
+    """Index thousands of packed release tags; cold, then warm cache."""
+    with fixture_repo(n_rst=0) as work:
+        head = subprocess.run(
+            ["git", "rev-parse", "HEAD"], check=True, capture_output=True, text=True
+        ).stdout.strip()
+        refs = "".join(
+            "{0} refs/tags/v{1}.{2}.{3}\n".format(head, i // 400, i // 20 % 20, i % 20)
+            for i in range(count)
+        )
+        with open(os.path.join(work, ".git", "packed-refs"), "a") as stream:
+            stream.write(refs)
+        config = {"cache_dir": os.path.join(work, ".releaser_cache")}
+        git = make_releaser().git
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            index = TagIndex.load(git, config)
+            key = "TagIndex.load: {0} ({1} tags)".format(label, count)
+            results.setdefault(key, []).append(time.perf_counter() - start)
+        start = time.perf_counter()
+        for i in range(count):
+            index.exists("{0}.{1}.{2}".format(i // 400, i // 20 % 20, 99))
+        index.latest()
+        key = "TagIndex: {0} lookups".format(count)
+        results.setdefault(key, []).append(time.perf_counter() - start)
+        reset_logging()
+
+
+BENCHMARKS: Dict[str, Callable] = {
+    "release": bench_release,
+    "rollback": bench_rollback,
+    "version_file": bench_version_file,
+    "upload": bench_upload,
+    "ci": bench_ci,
+    "log": bench_log,
+    "tags": bench_tags,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="also write raw timings to this file")
+    parser.add_argument("only", nargs="*", help=", ".join(BENCHMARKS))
+    args = parser.parse_args(argv)
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error("Unknown benchmarks: " + ", ".join(sorted(unknown)))
+    os.environ.update(GIT_ENV)
+    results: Dict[str, List[float]] = {}
+    for name, bench in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        for _ in range(args.repeat):
+            bench(results)
+    print("{0:<60} {1:>10} {2:>10}".format("Benchmark", "median (s)", "min (s)"))
+    for key, times in results.items():
+        print(
+            "{0:<60} {1:>10.4f} {2:>10.4f}".format(
+                key[:60], statistics.median(times), min(times)
+            )
+        )
+    if args.json:
+        with open(args.json, "w") as stream:
+            json.dump(results, stream, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Fail if importing releaser is too slow or loads heavy dependencies.
+
+Release scripts run many times a day in short-lived containers, so
+``import releaser.steps`` must stay cheap. Heavy libraries must only be
+imported when a step that needs them actually runs. Usage::
+
+    python benchmarks/check_import_time.py [--budget 0.3] [--runs 5]
+
+Exits with status 1 when the budget is exceeded.
+Note that *bag* itself imports ``pkg_resources``, so that cost is
+included in the measurement but not forbidden.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+STATEMENT = "import releaser, releaser.steps, releaser.git_steps"
+# These must not be imported merely by importing releaser:
+FORBIDDEN = (
+    "requests",
+    "docutils",
+    "bag.check_rst",
+    "multiprocessing",
+    "concurrent.futures.process",
+)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure():
+    """Import releaser in a fresh interpreter.
+
+    Return the cumulative import time in seconds and the set of modules.
+    """
+    code = STATEMENT + "; import sys; print('\\n'.join(sys.modules))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[0].startswith("import time:"):
+            continue
+        name = parts[2][1:].rstrip()  # nested imports are further indented
+        if not name.startswith("releaser"):
+            continue  # only top level imports made by STATEMENT
+        total += int(parts[1])
+    return total / 1e6, set(proc.stdout.split())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--budget", type=float, default=0.3, help="seconds")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+    timings = []
+    for _ in range(args.runs):
+        seconds, modules = measure()
+        timings.append(seconds)
+    best = min(timings)
+    print(
+        "Import time of releaser: {0:.3f}s (budget {1:.3f}s)".format(best, args.budget)
+    )
+    problems = []
+    loaded = sorted(m for m in FORBIDDEN if m in modules)
+    if loaded:
+        problems.append("Heavy modules imported eagerly: " + ", ".join(loaded))
+    if best > args.budget:
+        problems.append("Import time budget exceeded.")
+    for problem in problems:
+        print(problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
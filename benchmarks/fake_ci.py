@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+"""A local stand-in for the Travis and GitHub Actions build APIs.
+
+The latest build stays pending for ``--pending`` seconds after the
+server starts, then finishes with the chosen result. Responses carry an
+ETag and conditional requests get ``304 Not Modified``::
+
+    python benchmarks/fake_ci.py --port 8766 --pending 30
+
+then set ``ci_api_url="http://127.0.0.1:8766"`` in the release config.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeCI(ThreadingHTTPServer):
+    """Serves one branch whose latest build finishes after a while."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, branch="master", pending=0.0, passed=True):  # noqa
+        super().__init__(("127.0.0.1", port), Handler)
+        self.branch = branch
+        self.finish_at = time.monotonic() + pending
+        self.passed = passed
+        self.requests = 0
+        self.not_modified = 0
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}".format(self.server_address[1])
+
+    @property
+    def finished(self):
+        return time.monotonic() >= self.finish_at
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):  # noqa
+        server = self.server
+        server.requests += 1
+        finished = server.finished
+        if "/actions/runs" in self.path:
+            body = {
+                "workflow_runs": [
+                    {
+                        "name": "tests",
+                        "status": "completed" if finished else "in_progress",
+                        "conclusion": (
+                            ("success" if server.passed else "failure")
+                            if finished
+                            else None
+                        ),
+                    }
+                ]
+            }
+        elif self.path.endswith("/builds"):
+            body = [
+                {
+                    "number": "2",
+                    "branch": server.branch,
+                    "state": "finished" if finished else "started",
+                    "result": (0 if server.passed else 1) if finished else None,
+                    "message": "Latest commit",
+                },
+                {"number": "1", "branch": "other", "state": "finished", "result": 0},
+            ]
+        else:
+            self.send_error(404)
+            return
+        etag = '"{0}"'.format(int(finished))
+        if self.headers.get("If-None-Match") == etag:
+            server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--branch", default="master")
+    parser.add_argument("--pending", type=float, default=30.0)
+    parser.add_argument("--fail", action="store_true")
+    args = parser.parse_args(argv)
+    ci = FakeCI(args.port, args.branch, args.pending, passed=not args.fail)
+    print("Serving on", ci.url)
+    try:
+        ci.serve_forever()
+    except KeyboardInterrupt:
+        ci.server_close()
+
+
+if __name__ == "__main__":
+    main()
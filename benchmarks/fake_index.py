@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""A local stand-in for a package index, for testing and benchmarking uploads.
+
+It accepts the legacy upload API (POST to ``/legacy/``) and answers the
+JSON API (``/pypi/<name>/<version>/json``) with the files received so
+far. It can delay every upload and fail the first attempts of each
+file with HTTP 503, to exercise concurrency and retries::
+
+    python benchmarks/fake_index.py --port 8765 --delay 0.2 --flaky 1
+
+then set ``repository_url="http://127.0.0.1:8765/legacy/"`` and
+``index_url="http://127.0.0.1:8765/pypi"`` in the release config.
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeIndex(ThreadingHTTPServer):
+    """Keeps uploaded files in memory: {(name, version): {filename: sha256}}."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, delay=0.0, flaky=0):  # noqa
+        super().__init__(("127.0.0.1", port), Handler)
+        self.delay = delay
+        self.flaky = flaky  # failures before each file is accepted
+        self.releases = {}
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}".format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body):
+        data = body.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # noqa
+        parts = self.path.strip("/").split("/")  # pypi, name, version, json
+        if len(parts) != 4 or parts[0] != "pypi" or parts[3] != "json":
+            return self._reply(404, "Not Found")
+        files = self.server.releases.get((parts[1], parts[2]))
+        if files is None:
+            return self._reply(404, "Not Found")
+        urls = [{"filename": n, "digests": {"sha256": d}} for n, d in files.items()]
+        self._reply(200, json.dumps({"urls": urls}))
+
+    def do_POST(self):  # noqa
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        head = "Content-Type: {0}\r\n\r\n".format(self.headers["Content-Type"])
+        message = BytesParser(policy=HTTP).parsebytes(head.encode("ascii") + body)
+        fields, content, filename = {}, None, None
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "content":
+                filename = part.get_filename()
+                content = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_content()
+        server = self.server
+        with server.lock:
+            tries = server.attempts[filename] = server.attempts.get(filename, 0) + 1
+        time.sleep(server.delay)
+        if tries <= server.flaky:
+            return self._reply(503, "Service Unavailable")
+        if hashlib.sha256(content).hexdigest() != fields.get("sha256_digest"):
+            return self._reply(400, "Digest mismatch")
+        with server.lock:
+            files = server.releases.setdefault((fields["name"], fields["version"]), {})
+            if filename in files:
+                return self._reply(400, "File already exists.")
+            files[filename] = fields["sha256_digest"]
+        self._reply(200, "OK")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--flaky", type=int, default=0)
+    args = parser.parse_args(argv)
+    index = FakeIndex(args.port, delay=args.delay, flaky=args.flaky)
+    print("Serving on", index.url)
+    try:
+        index.serve_forever()
+    except KeyboardInterrupt:
+        index.server_close()
+
+
+if __name__ == "__main__":
+    main()
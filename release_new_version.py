@@ -11,43 +11,71 @@ config = dict(
     github_user="nandoflorestan",
     github_repository="releaser",
     branch="master",  # Only release new versions in this git branch
+    remote="origin",  # The git remote to push to
     changes_file="CHANGES.rst",
     version_file="pyproject.toml",  # Read and write version number on this file
     version_keyword="version",  # Part of the variable name in that file
+    # To keep the version in several files, list them all instead:
+    # version_files=["pyproject.toml", ("mypkg/__init__.py", "version")],
     log_file="release.log.utf-8.tmp",
     verbosity="info",  # debug | info | warn | error
+    parallel_steps=True,  # Run adjacent read-only checks at the same time
+    cache_dir=".releaser_cache",  # Remembers work done in previous runs
+    trace_file="release.trace.json.tmp",  # Timings; open in ui.perfetto.dev
+    ci_provider="github",  # or "travis"; used by CheckCI
+    journal=True,  # Record completed steps, so you can run again with --resume
+    # step_timeout=900,  # Seconds any step may take before it is stopped
+    # release_timeout=3600,  # ...and the whole release
 )
 
 # You can customize your release process below.
 # Comment out any steps you don't desire and add your own steps.
-Releaser(
+releaser = Releaser(
     config,
     # ==================  Before releasing, do some checks  ===================
     # Shell("py.test -s --tb=native tests"),  # First of all ensure tests pass
+    # or run the checks side by side, stopping them all at the first failure:
+    # ParallelShell("flake8", "mypy releaser", "py.test -n0 tests"),
     # CheckRstFiles,  # Documentation: recursively verify ALL .rst files, or:
     CheckRstFiles("README.rst", "CHANGES.rst", "LICENSE.rst"),  # just a few.
     EnsureGitClean,  # There are no uncommitted changes in tracked files.
     EnsureGitBranch,  # I must be in the branch specified in config
     InteractivelyEnsureChangesDocumented,  # Did you update CHANGES.rst?
     # Shell("poetry install")  # Ensure the package can be installed
-    # CheckTravis,  # We run this late, so travis-ci has had more time to build
+    # CompileAndVerifyTranslations,  # .po to .mo, checking the placeholders
+    # CheckCI,  # Waits for the CI build in the background while we continue
     # ======================  All checks pass. RELEASE!  ======================
     SetVersionNumberInteractively,  # Ask for version and write to source code
+    CheckVersionConflicts,  # Is the version on the remote or PyPI? (background)
+    # UpdateChangelog,  # Put new commits in CHANGES.rst, under the new version
     # Shell("./build_sphinx_documentation.sh"),  # You can write it easily
-    Shell("poetry build"),  # Build sdist + wheel with poetry
+    CachedBuild("poetry build"),  # Build sdist + wheel, or reuse a cached build
+    # WorktreeBuild("poetry build"),  # ...or build in the background, elsewhere
     # Shell("python setup.py sdist"),  # Build source distribution with setuptools
     # Shell("python setup.py bdist_wheel"),  # Build binary wheel with setuptools
-    InteractivelyApprovePackage,  # Ask user to manually verify wheel content
+    VerifyPackages,  # Compare the sdist and wheel contents with git ls-files
+    # InteractivelyApprovePackage,  # Or ask the user to verify them by hand
     GitCommitVersionNumber,
     GitTag,  # Locally tag the current commit with the new version number
-    Shell("poetry publish"),  # Upload source and wheel to https://pypi.org
+    Shell(
+        "poetry publish", irreversible=True
+    ),  # Upload source and wheel to https://pypi.org, or:
+    # UploadPackages,  # Upload everything in dist/ concurrently, with retries
     # TwineUploadSource,  # Upload a source .tar.gz to https://pypi.org with Twine
     # TwineUploadWheel,  # Upload wheel to https://pypi.org with Twine
     # ===========  Post-release: set development version and push  ============
     SetFutureVersion,  # Writes incremented version, now with 'dev1' suffix
     GitCommitVersionNumber("future_version", msg="Bump version to {0} after release"),
     # ErrorStep,  # You can use this step while testing - it causes a rollback.
-    GitPush,  # Cannot be undone. If successful, previous steps won't roll back
-    GitPushTags,
+    GitPush,  # Pushes branch and tags atomically. Cannot be undone; if successful,
+    # previous steps won't roll back.
+    GitPushTags,  # Pushes any tags GitPush did not; deletes them on rollback
     Warn("Do not forget to upload the documentation now!"),
-).release()
+)
+
+# Worker processes (e.g. of CheckRstFiles) may import this script again,
+# so only release when it is executed.
+if __name__ == "__main__":
+    # Pass --resume to continue after the last completed step, or
+    # "plan" to see what would run and how long it should take.
+    releaser.run()
@@ -1,23 +1,52 @@
 """Framework for releasing Python software without forgetting steps."""
 
-import subprocess
-from sys import platform
-from pkg_resources import parse_version
+import threading
+import time
+
 from bag.console import bool_input, screen_header
-from bag.log import setup_log
-from .regex import error_in_version
+from .logs import current_step, open_release_log, setup_release_log
+from .process import run_command
+from .scheduler import plan_batches
+from .tracing import Tracer
 
 
 class StopRelease(RuntimeError):
     """Release steps should raise this exception to stop the whole program."""
 
 
+class StepTimeout(StopRelease):
+    """A step ran out of time: its own ``timeout`` or the release's."""
+
+
 class ReleaseStep:
     """Abstract base class for release steps."""
 
     ERROR_CODE = 1
     success = None
     stop_on_failure = True
+    # Read-only steps may set this to True so they can run concurrently
+    # with neighbouring parallel-safe steps. See the *scheduler* module.
+    parallel_safe = False
+    needs = ()  # names of resources consumed, e.g. "the_version", "dist"
+    provides = ()  # names of resources this step produces
+    # A background step starts in its turn, but the following steps do not
+    # wait for it; the release joins it before a step that needs what it
+    # provides, before any irreversible step (e.g. an upload) and at the end.
+    background = False
+    irreversible = False
+    # In a batch release (see the *monorepo* module), a step that concerns
+    # a single package runs once for each package; concurrently, unless
+    # it asks the user something.
+    per_package = False
+    interactive = False
+    # Seconds the step may take; by default the "step_timeout" setting
+    # (which does not apply to interactive steps). Commands still running
+    # when the time is up are stopped, and so is the release.
+    timeout = None
+    deadline = None  # a time.perf_counter(), set when the step starts
+    # Set while the step runs in the background: its commands are stopped
+    # as soon as this threading.Event is.
+    stop = None
 
     def __call__(self):
         """Override this method to do the main work of the release step.
@@ -36,29 +65,56 @@ class ReleaseStep:
         else:
             self.log.warning(msg + "\nContinuing anyway.")
 
-    def _execute(self, command, input="", shell=True):
-        p = subprocess.Popen(
+    def _time_left(self):
+        """Return the seconds left before the deadline, or None if none.
+
+        Raise StepTimeout if there are none left.
+        """
+        if self.deadline is None:
+            return None
+        left = self.deadline - time.perf_counter()
+        if left <= 0:
+            raise StepTimeout("{0} ran out of time.".format(self))
+        return left
+
+    last_result = None  # CommandResult of the latest _execute() call
+
+    def _execute(self, command, input="", shell=True, cwd=None):
+        """Run ``command``, streaming its output to the log.
+
+        It runs in ``cwd``, by default the "cwd" setting (the package
+        directory in a batch release) or the current directory.
+
+        Return a tuple (return_code, text) where ``text`` is the tail
+        of the standard output followed by the tail of standard error.
+        Timing and byte counts are available in ``self.last_result``.
+        If the step runs out of time, the command is stopped and
+        StepTimeout is raised. It is also stopped, raising StopRelease,
+        when the ``stop`` event is set (see ``_stop_background()``).
+        """
+        timeout = self._time_left()
+        result = run_command(
             command,
+            self.log,
+            input=input,
             shell=shell,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            close_fds=not platform.startswith("win"),
+            cwd=cwd or self.config.get("cwd"),
+            tail_lines=self.config.get("output_tail_lines", 500),
+            timeout=timeout,
+            grace=self.config.get("kill_grace", 5.0),
+            stop=self.stop,
         )
-        i, o, e = (p.stdin, p.stdout, p.stderr)
-        if input:
-            i.write(input)
-        i.close()
-        return_code = p.wait()
-        normal_output = o.read().strip().decode("utf-8")
-        error_output = e.read().strip().decode("utf-8")
-        o.close()
-        e.close()
-        if normal_output:
-            self.log.debug(normal_output)
-        if error_output:
-            self.log.error(error_output)
-        return return_code, normal_output + error_output
+        self.last_result = result
+        self.releaser.tracer.add_command(result)
+        if result.stopped:
+            raise StopRelease("{0} was stopped with the release.".format(self))
+        if result.timed_out:
+            raise StepTimeout(
+                "{0} ran out of time ({1:.0f}s left) running: {2}".format(
+                    self, timeout, command
+                )
+            )
+        return result.return_code, result.text
 
     def _execute_or_complain(
         self,
@@ -94,6 +150,10 @@ class ReleaseStep:
             self._fail(msg.format(code=return_code, cmd=command))
         return text
 
+    def describe(self):
+        """Say what the step would do; shown by ``Releaser.plan()``."""
+        return (type(self).__doc__ or str(self)).strip().split("\n")[0]
+
     def __str__(self):
         return type(self).__name__  # good default identifier for most steps
 
@@ -104,64 +164,383 @@ class CommandStep(ReleaseStep):
     def __call__(self):
         self._execute_or_complain(self.COMMAND)  # sets self.success
 
+    def describe(self):
+        command = getattr(self, "COMMAND", None)
+        if command is None:
+            return super().describe()
+        return "$ " + (command if isinstance(command, str) else " ".join(command))
+
 
 class Releaser:
     """Class that manages the whole release process."""
 
     def __init__(self, config, *steps):
-        self.created_tags = []
+        self.created_tags = []  # tag names, e.g. "v1.0.0"
+        self.pushed_tags = []  # those created_tags already on the remote
         self.config = config
-        # Configure logging
-        path = config.get("log_file", "release.log.utf-8.tmp")
-        screen_level = config.get("verbosity", "info")
-        self.log = setup_log(
-            path=path,
-            rotating=False,
-            file_mode="w",
-            disk_level="debug",
-            screen_level=screen_level,
-        )
+        self.tracer = Tracer()
+        self.stopping = threading.Event()  # tells background steps to give up
+        self.log = setup_release_log(config)  # the screen; see the *logs* module
         # Convert steps provided by the user into real instances
         self.instances = []
         for step in steps:
             if isinstance(step, type):
                 step = step()  # Instantiate the ReleaseStep subclass
-            step.config = config
-            step.releaser = self
-            step.log = self.log
-            self.instances.append(step)
+            self.instances.append(self._bind(step))
         # Now that all steps are correctly instantiated,
         # it is safe to start running them by calling release().
 
-    def release(self):
+    def _bind(self, step):
+        step.config = self.config
+        step.releaser = self
+        step.log = self.log
+        return step
+
+    journal = None  # a Journal, unless disabled by config
+    _log_file = None  # the handler writing the log file, once released
+
+    def run(self, argv=None):
+        """Parse the command line, then release. Call this from your script."""
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Release a new version.")
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the previous release after its last completed step.",
+        )
+        parser.add_argument(
+            "command",
+            nargs="?",
+            default="release",
+            choices=("release", "plan", "log", "changelog"),
+            help='"plan" shows what each step would do and how long it should '
+            'take, without running anything. "log STEP" prints the part of '
+            'the last log written by one step. "changelog" adds the new git '
+            "commits to the top of CHANGES.rst.",
+        )
+        parser.add_argument("step", nargs="?", help="a step name, for log")
+        args = parser.parse_args(argv)
+        if args.command == "plan":
+            self.plan()
+        elif args.command == "log":
+            self.print_step_log(args.step)
+        elif args.command == "changelog":
+            self.update_changelog()
+        else:
+            self.release(resume=args.resume)
+
+    def update_changelog(self):
+        """Add the new git commits to the changes file, outside a release."""
+        from .steps import UpdateChangelog
+
+        self._bind(UpdateChangelog())()
+
+    def release(self, resume=None):
+        """Run all the steps, rolling back if one of them fails.
+
+        If ``resume`` is true, skip the steps that the journal says were
+        completed in a previous run (see the *journal* module).
+        """
         self.rewindable = []
         self.non_rewindable = []
-        for step in self.instances:
-            self.log.info(screen_header(step))
-            try:
-                step()
-            except StopRelease as e:
-                self.log.critical(
-                    "Release process stopped at step {0}:\n{1}".format(step, e)
-                )
-                self.rewind()
-                from sys import exit
-
-                exit(step.ERROR_CODE)
-            except Exception:
-                self.log.debug("Noooo!!!", exc_info=True)
-                self.rewind()
-                raise
-            else:
-                if step.success and hasattr(step, "no_rollback"):
-                    self.non_rewindable.append(step.no_rollback)
-                elif step.success and hasattr(step, "rollback"):
-                    self.rewindable.append(step)
+        if self._log_file is None:  # only now, not to overwrite it in vain
+            self._log_file = open_release_log(self.log, self.config)
+        if resume is None:
+            resume = self.config.get("resume", False)
+        first = self._open_journal(resume)
+        parallel = self.config.get("parallel_steps", True)
+        self._background = {}  # step: future
+        self.stopping.clear()
+        release_timeout = self.config.get("release_timeout")
+        if release_timeout:
+            self.deadline = time.perf_counter() + release_timeout
+        finished = False
+        try:
+            for batch in plan_batches(self.instances[first:], parallel=parallel):
+                self._join_background(batch)
+                if parallel:
+                    for step in [s for s in batch if s.background]:
+                        self._start_background(step)
+                        batch.remove(step)
+                outcomes = self._run_batch(batch) if batch else []
+                # Register successes in the user's order, so rollback order
+                # is the same as if the steps had run one after another...
+                for step, error in outcomes:
+                    if error is None:
+                        self._register(step)
+                        if self.journal:
+                            self.journal.record(step)
+                # ...then stop at the first failure, if any.
+                for step, error in outcomes:
+                    if error is not None:
+                        self._abort(step, error)
+            self._join_background()
+            finished = True
+        finally:
+            self._stop_background()
+            self._report(success=finished)
+        if self.journal:
+            self.journal.discard()
         self.log.info(
             "Successfully released version {0}. "
             "Sorry for the convenience, mcdonc!".format(self.the_version)
         )
 
+    def _open_journal(self, resume):
+        """Start a new journal or resume from the old one.
+
+        Return the index of the first step to run.
+        """
+        from .journal import Journal
+
+        if self.config.get("journal", True):
+            self.journal = Journal(self)
+        try:
+            if resume and not self.journal:
+                raise StopRelease("Resuming requires the journal to be enabled.")
+            if resume:
+                return self.journal.resume()
+        except StopRelease as e:
+            self.log.critical(str(e))
+            from sys import exit
+
+            exit(1)
+        if self.journal:
+            self.journal.start()
+        return 0
+
+    def _report(self, success):
+        """Write the trace file, log a summary of the time spent and
+        store the timings in the history database.
+        """
+        path = self.config.get("trace_file", "release.trace.json.tmp")
+        if path:
+            self.tracer.write(path)
+        self.log.info("Time spent:\n" + self.tracer.summary())
+        if self.config.get("history", True):
+            from .history import History
+
+            try:
+                History(self.config).record(
+                    self.tracer,
+                    [str(s) for s in self.instances],
+                    self.the_version,
+                    success,
+                )
+            except Exception as e:  # never let bookkeeping hide the outcome
+                self.log.warning("Could not record the timings: {0}".format(e))
+
+    def print_step_log(self, step):
+        """Print what ``step`` wrote to the log of the previous release."""
+        from .logs import step_log
+
+        path = self.config.get("log_file", "release.log.utf-8.tmp")
+        if self.config.get("log_compress", False):
+            path += ".gz"
+        try:
+            print(step_log(path, step or ""))
+        except FileNotFoundError:
+            print("No log index found at {0}.index.json".format(path))
+        except KeyError:
+            print(
+                "Step not in the log. Steps: "
+                + ", ".join(str(s) for s in self.instances)
+            )
+
+    def plan(self):
+        """Log what each step would do and how long it should take.
+
+        Nothing is executed. Estimates are medians of the durations
+        recorded in previous runs (see the *history* module). Return the
+        estimated total in seconds, which leaves out unmeasured steps.
+        """
+        from .history import History
+
+        parallel = self.config.get("parallel_steps", True)
+        if self.config.get("history", True):
+            estimates = History(self.config).estimates([str(s) for s in self.instances])
+        else:
+            estimates = [None] * len(self.instances)
+        estimate_of = {id(s): e for s, e in zip(self.instances, estimates)}
+        lines, total, number = [], 0.0, 0
+        for batch in plan_batches(self.instances, parallel=parallel):
+            longest = 0.0
+            for step in batch:
+                number += 1
+                estimate = estimate_of[id(step)]
+                flags = []
+                if len(batch) > 1:
+                    flags.append("concurrent")
+                if step.background and parallel:
+                    flags.append("background")
+                if step.irreversible:
+                    flags.append("irreversible")
+                if estimate is None:
+                    seconds = "?"
+                else:
+                    seconds = "{0:.2f}".format(estimate.median)
+                    if estimate.regressed:
+                        flags.append("SLOWER last time: {0:.2f}s".format(estimate.last))
+                    if not (step.background and parallel):
+                        longest = max(longest, estimate.median)
+                row = "{0:>3}. {1:<40} {2:>9}  {3}".format(
+                    number, str(step)[:40], seconds, ", ".join(flags)
+                )
+                lines.extend((row.rstrip(), "       " + step.describe()))
+            total += longest
+        unknown = estimates.count(None)
+        lines.append(
+            "Estimated duration: {0:.1f}s{1}".format(
+                total,
+                " (plus {0} step(s) never measured)".format(unknown) if unknown else "",
+            )
+        )
+        self.log.info("Release plan:\n" + "\n".join(lines))
+        return total
+
+    def _run_step(self, step):
+        """Run one step; return the exception it raised, or None."""
+        token = current_step.set(str(step))  # tags the log records
+        self.log.info(screen_header(step))
+        step.deadline = self._deadline_for(step)
+        try:
+            with self.tracer.span(str(step), "step") as args:
+                args["position"] = self.instances.index(step)  # for the history
+                try:
+                    step._time_left()  # the release may be out of time already
+                    step()
+                except Exception as e:
+                    args["error"] = str(e)
+                    return e
+                finally:
+                    args["success"] = step.success
+            return None
+        finally:
+            current_step.reset(token)
+
+    deadline = None  # of the whole release, from the "release_timeout" setting
+
+    def _deadline_for(self, step, rollback=False):
+        """Return the time.perf_counter() by which ``step`` must finish.
+
+        A rollback gets the time of the step, even if the release is out
+        of time.
+        """
+        timeout = step.timeout
+        if timeout is None and not step.interactive:
+            timeout = self.config.get("step_timeout")
+        limits = [] if rollback or self.deadline is None else [self.deadline]
+        if timeout:
+            limits.append(time.perf_counter() + timeout)
+        return min(limits) if limits else None
+
+    def _run_batch(self, batch):
+        """Run a batch of steps; return a list of (step, error) tuples."""
+        if len(batch) == 1:
+            return [(batch[0], self._run_step(batch[0]))]
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.log.debug(
+            "Running concurrently: {0}".format(", ".join(str(s) for s in batch))
+        )
+        with ThreadPoolExecutor(max_workers=self.config.get("max_workers")) as executor:
+            errors = list(executor.map(self._run_step, batch))
+        return list(zip(batch, errors))
+
+    _executor = None  # runs the background steps
+
+    def _start_background(self, step):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.config.get("max_workers"),
+                thread_name_prefix="releaser-background",
+            )
+        self.log.debug("Starting in the background: {0}".format(step))
+        step.stop = self.stopping
+        self._background[step] = self._executor.submit(self._run_step, step)
+
+    def _join_background(self, batch=None):
+        """Wait for the background steps that ``batch`` depends on.
+
+        Without a batch, wait for all of them. Steps that have finished
+        already are collected too, so that a failure stops the release
+        as early as possible.
+        """
+        for step, future in list(self._background.items()):
+            if (
+                batch is not None
+                and not future.done()
+                and not any(
+                    other.irreversible or set(other.needs) & set(step.provides)
+                    for other in batch
+                )
+            ):
+                continue
+            if not future.done():
+                self.log.info("Waiting for {0} to finish...".format(step))
+            error = future.result()
+            del self._background[step]
+            if error is None:
+                self._register(step)
+                if self.journal:
+                    self.journal.record(step)
+            else:
+                if self.journal:  # Resuming must not skip the failed step
+                    self.journal.forget_from(self.instances.index(step))
+                self._abort(step, error)
+
+    def _stop_background(self):
+        """Stop the background steps still running, e.g. after a failure.
+
+        The commands they run are stopped, and the release waits for them
+        to return. Those that had succeeded already are registered, so
+        that they can be rolled back. They never completed as far as the
+        journal is concerned, so resuming must not start after any of them.
+        """
+        self.stopping.set()
+        for future in self._background.values():
+            future.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for step, future in self._background.items():
+            if not future.cancelled() and future.result() is None:
+                self._register(step)
+        if self.journal and self._background:
+            self.journal.forget_from(
+                min(self.instances.index(step) for step in self._background)
+            )
+        self._background = {}
+
+    def _register(self, step):
+        if step.success and hasattr(step, "no_rollback"):
+            self.non_rewindable.append(step.no_rollback)
+        elif step.success and hasattr(step, "rollback"):
+            self.rewindable.append(step)
+
+    def _abort(self, step, error):
+        """Roll back because ``step`` raised ``error``; then exit or reraise.
+
+        Background steps are stopped first, so that none of them is still
+        working while its predecessors are rolled back.
+        """
+        self._stop_background()
+        if isinstance(error, StopRelease):
+            self.log.critical(
+                "Release process stopped at step {0}:\n{1}".format(step, error)
+            )
+            self.rewind()
+            from sys import exit
+
+            exit(step.ERROR_CODE)
+        else:
+            self.log.debug("Noooo!!!", exc_info=error)
+            self.rewind()
+            raise error
+
     def rewind(self):
         say = self.log.critical
         say("\n" + screen_header("ROLLBACK", decor="*"))
@@ -180,12 +559,59 @@ class Releaser:
             return
         for step in steps:
             self.log.critical(screen_header("ROLLBACK {0}".format(step)))
-            try:
-                step.rollback()
-            except Exception as e:
-                self.log.error(
-                    "Could not roll back step {0}:\n{1}".format(step, str(e))
-                )
+            token = current_step.set("ROLLBACK {0}".format(step))
+            step.deadline = self._deadline_for(step, rollback=True)
+            step.stop = None  # the rollback must run, although we are stopping
+            with self.tracer.span(str(step), "rollback") as args:
+                try:
+                    step.rollback()
+                except Exception as e:
+                    args["error"] = str(e)
+                    self.log.error(
+                        "Could not roll back step {0}:\n{1}".format(step, str(e))
+                    )
+            current_step.reset(token)
+        if self.journal:  # The undone steps must run again if resumed
+            self.journal.forget_from(min(self.instances.index(s) for s in steps))
+
+    _git = None
+
+    @property
+    def git(self):
+        """The GitRepository shared by all steps, created on first use."""
+        if self._git is None:
+            from .git import GitRepository
+
+            self._git = GitRepository(self.log, tracer=self.tracer)
+        return self._git
+
+    _tags = None
+
+    @property
+    def tags(self):
+        """The TagIndex of the release tags, read on first use."""
+        if self._tags is None:
+            from .version import TagIndex
+
+            self._tags = TagIndex.load(self.git, self.config, self.tag_prefix())
+        return self._tags
+
+    def tag_name(self, version: str) -> str:
+        """The tag of a release, following the ``tag_format`` setting."""
+        return self.config.get("tag_format", "v{version}").format(
+            version=version, name=self.config.get("github_repository", "")
+        )
+
+    def tag_prefix(self) -> str:
+        """What the names of release tags start with, e.g. "v"."""
+        return self.tag_name("\0").split("\0")[0]
+
+    def new_tags(self):
+        """Return the (name, message) of each tag this release creates."""
+        if self.the_version is None:
+            return []
+        version = self.the_version
+        return [(self.tag_name(version), "Version {0}".format(version))]
 
     _old_version = None  # 0.1.2dev (exists when the program starts)
     _the_version = None  # 0.1.2    (the version being released)
@@ -205,19 +631,41 @@ class Releaser:
 
     @the_version.setter
     def the_version(self, val):
+        from .regex import error_in_version
+        from .version import InvalidVersion, parse_version
+
         val = val.strip()
-        e = error_in_version(val, allow_dev=False)
-        if e:
-            raise StopRelease(e)
-        if parse_version(self.old_version) >= parse_version(val):
+        error = error_in_version(val, allow_dev=False)
+        if error:
+            raise StopRelease(error)
+        version = parse_version(val)
+        old = None  # unknown or unparseable; nothing to compare with
+        if self.old_version is not None:
+            try:
+                old = parse_version(self.old_version)
+            except InvalidVersion:
+                pass
+        if old is not None and old >= version:
             raise StopRelease(
                 "No, the version number must be higher than the current one!"
             )
+        tag = self.tags.tag_for(version)
+        if tag:
+            raise StopRelease(
+                "Version {0} was already released; the tag {1} exists.".format(val, tag)
+            )
+        newer = self.tags.newer_than(version)
+        if newer:
+            self.log.warning(
+                "Higher versions were tagged already: {0}".format(
+                    ", ".join(str(v) for v in newer[-3:])
+                )
+            )
         self._the_version = val
         self.log.debug("Version being released: {0}".format(val))
 
     @property
     def future_version(self):  # 0.1.3.dev1 (development version after release)
-        parts = self.the_version.split(".")
-        parts[-1] = str(int(parts[-1]) + 1)
-        return ".".join(parts) + ".dev1"
+        from .version import parse_version
+
+        return str(parse_version(self.the_version).next_dev())
@@ -0,0 +1,146 @@
+"""A local, content-addressed cache of built packages.
+
+The key of a build is a hash of the git tree at HEAD, of the contents of
+the tracked files that differ from it (typically the freshly stamped
+version files) and of the build command. If the same key was built
+before, its artifacts are simply put back into ``dist/``.
+
+Old entries are evicted by age (``build_cache_max_age`` days, default 30)
+and then, oldest first, by total size (``build_cache_max_bytes``,
+default 2 GiB). Untracked files do not take part in the key.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .cache import cache_dir, file_digest
+
+
+def snapshot(directory: str) -> Dict[str, Tuple[int, int]]:
+    """Map each file in ``directory`` to its (size, mtime_ns)."""
+    if not os.path.isdir(directory):
+        return {}
+    found = {}
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            info = entry.stat()
+            found[entry.name] = (info.st_size, info.st_mtime_ns)
+    return found
+
+
+def find_artifacts(dist: str, version: str) -> List[str]:
+    """Return the paths of the sdists and wheels of ``version``, sorted."""
+    found = []
+    for name in sorted(os.listdir(dist)) if os.path.isdir(dist) else []:
+        if name.endswith(".whl") and "-{0}-".format(version) in name:
+            found.append(os.path.join(dist, name))
+        elif name.endswith(("-{0}.tar.gz".format(version), "-{0}.zip".format(version))):
+            found.append(os.path.join(dist, name))
+    return found
+
+
+def _place(source: str, target: str) -> None:
+    """Put a copy of ``source`` at ``target``, by hard link if possible."""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:  # e.g. another file system
+        shutil.copy2(source, target)
+
+
+class BuildCache:
+    """Stores and restores the artifacts of builds, keyed by content."""
+
+    META = "meta.json"
+
+    def __init__(self, config):  # noqa
+        self.root = cache_dir(config, "builds")
+        self.max_bytes = config.get("build_cache_max_bytes", 2 << 30)
+        self.max_age = config.get("build_cache_max_age", 30) * 86400
+
+    @staticmethod
+    def key(git, command: str, cwd: str = "") -> str:
+        """Compute the key of building the work tree with ``command``.
+
+        ``cwd`` is the directory (relative to the top of the repository)
+        where the command runs.
+        """
+        hasher = hashlib.sha256()
+        hasher.update(command.encode("utf-8") + b"\0")
+        if cwd:
+            hasher.update(b"cwd:" + cwd.encode("utf-8") + b"\0")
+        hasher.update(git.tree_id().encode("ascii") + b"\0")
+        for path in sorted(git.dirty_files()):
+            hasher.update(path.encode("utf-8") + b"\0")
+            full = os.path.join(git.root, path)
+            digest = file_digest(full) if os.path.exists(full) else "deleted"
+            hasher.update(digest.encode("ascii") + b"\0")
+        return hasher.hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def restore(self, key: str, dist: str) -> Optional[List[str]]:
+        """Put the cached artifacts into ``dist``; return their names.
+
+        Return None on a cache miss.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, self.META), encoding="utf-8") as f:
+                names = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            return None
+        if not all(os.path.isfile(os.path.join(entry, n)) for n in names):
+            return None
+        os.makedirs(dist, exist_ok=True)
+        for name in names:
+            _place(os.path.join(entry, name), os.path.join(dist, name))
+        os.utime(os.path.join(entry, self.META))  # recently used
+        return names
+
+    def store(self, key: str, dist: str, names: List[str]) -> None:
+        """Copy the artifacts ``names`` from ``dist`` into the cache."""
+        entry = self._entry(key)
+        temp = entry + ".tmp"
+        shutil.rmtree(temp, ignore_errors=True)
+        os.makedirs(temp)
+        for name in names:
+            shutil.copy2(os.path.join(dist, name), os.path.join(temp, name))
+        with open(os.path.join(temp, self.META), "w", encoding="utf-8") as f:
+            json.dump({"files": names, "created": time.time()}, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(temp, entry)
+        self.evict()
+
+    def evict(self) -> List[str]:
+        """Remove entries that are too old or exceed the size budget.
+
+        Return the keys of the removed entries.
+        """
+        entries = []  # (last used, size, key)
+        for item in os.scandir(self.root):
+            if not item.is_dir():
+                continue
+            try:
+                used = os.stat(os.path.join(item.path, self.META)).st_mtime
+            except OSError:
+                used = 0  # incomplete entry
+            size = sum(f.stat().st_size for f in os.scandir(item.path))
+            entries.append((used, size, item.name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        oldest_allowed = time.time() - self.max_age
+        removed = []
+        for used, size, key in entries:
+            if used >= oldest_allowed and total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
@@ -0,0 +1,61 @@
+"""Small on-disk caches that persist between runs of the release script.
+
+They all live in the directory given by the ``cache_dir`` setting
+(by default ``.releaser_cache``), which you probably want to gitignore.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict
+
+
+def cache_dir(config: Dict[str, Any], *parts: str) -> str:
+    """Return (and create) a directory inside the releaser cache."""
+    path = os.path.join(config.get("cache_dir", ".releaser_cache"), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_digest(path: str, algorithm: str = "sha256", chunk=1 << 20) -> str:
+    """Return the hex digest of the contents of a file, read in chunks."""
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(chunk), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def write_atomically(path: str, data: bytes) -> None:
+    """Write ``data`` to a temporary file, then rename it onto ``path``."""
+    fd, temp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-"
+    )
+    try:
+        with os.fdopen(fd, "wb") as stream:
+            stream.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class JsonCache(dict):
+    """A dictionary that is loaded from, and saved to, a JSON file.
+
+    A missing or corrupt file simply yields an empty cache.
+    """
+
+    def __init__(self, path: str):  # noqa
+        super().__init__()
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as stream:
+                self.update(json.load(stream))
+        except (OSError, TypeError, ValueError):
+            pass
+
+    def save(self) -> None:
+        text = json.dumps(self, indent=1, sort_keys=True)
+        write_atomically(self.path, text.encode("utf-8"))
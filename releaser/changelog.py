@@ -0,0 +1,206 @@
+"""Adds the subjects of new git commits to the top of the changelog.
+
+Commits are read with ``git log``, streamed, from the commit processed
+by the previous run (remembered in ``changelog.json`` in the
+``cache_dir``) -- or, on the first run, from the latest release tag --
+up to HEAD. Repeated runs therefore only read the commits made since.
+
+Subjects in the Conventional Commits style ("fix(parser): ...") are
+grouped under headings such as "Bug fixes"; the rest go under "Other
+changes". They are merged into an "Unreleased" section at the top of
+the file, which is renamed "Version X (YYYY-MM)" upon release.
+
+Settings (all optional):
+
+- ``changes_file``: default "CHANGES.rst"
+- ``changelog_skip``: regex of subjects to leave out; by default the
+  version commits that releaser makes itself
+- ``changelog_max_commits``: how far back to look when there is no
+  tag to start from; default 500
+"""
+
+import re
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+GROUPS = {  # conventional type: heading
+    "feat": "Features",
+    "fix": "Bug fixes",
+    "perf": "Performance",
+    "refactor": "Refactoring",
+    "docs": "Documentation",
+    "test": "Tests",
+    "build": "Build",
+    "ci": "Continuous integration",
+    "style": "Style",
+    "chore": "Chores",
+    "revert": "Reverts",
+}
+BREAKING = "Breaking changes"
+OTHER = "Other changes"
+ORDER = [BREAKING] + list(GROUPS.values()) + [OTHER]
+UNRELEASED = "Unreleased"
+CONVENTIONAL_RE = re.compile(r"^(\w+)(?:\(([^)]*)\))?(!)?:\s*(.+)$")
+DEFAULT_SKIP = r"^(Version \d|Bump version )"
+
+
+def classify(subject: str) -> Tuple[str, str]:
+    """Return the heading a commit subject belongs under, and its text."""
+    match = CONVENTIONAL_RE.match(subject)
+    if not match or match.group(1).lower() not in GROUPS:
+        return OTHER, subject
+    kind, scope, bang, text = match.groups()
+    if scope:
+        text = "**{0}**: {1}".format(scope, text)
+    return (BREAKING if bang else GROUPS[kind.lower()]), text
+
+
+def new_commits(
+    git, since: Optional[str], max_count: int, path: Optional[str] = None
+) -> Iterator[Tuple[str, str]]:
+    """Yield (commit id, subject) from HEAD back to ``since``, newest first.
+
+    With ``path``, only the commits that touch it.
+    """
+    args = ["log", "--no-merges", "--format=%H %s"]
+    if since:
+        args.append(since + "..HEAD")
+    else:
+        args.extend(["--max-count", str(max_count), "HEAD"])
+    if path:
+        args.extend(["--", path])
+    for line in git.stream(*args):
+        commit, _, subject = line.partition(" ")
+        yield commit, subject
+
+
+def start_point(git, last: Optional[str], tag_prefix: str = "v") -> Optional[str]:
+    """The commit after which to start: the last one processed, if it is
+    still in the history, else the latest release tag, else None.
+    """
+    if last:
+        check = git.run("merge-base", "--is-ancestor", last, "HEAD", check=False)
+        if check.return_code == 0:
+            return last
+    found = git.run(
+        "describe",
+        "--tags",
+        "--abbrev=0",
+        "--match",
+        tag_prefix + "[0-9]*",
+        check=False,
+    )
+    return found.stdout if found.return_code == 0 and found.stdout else None
+
+
+def _is_underline(line: str, char: str, title: str) -> bool:
+    return bool(line) and line == char * len(line) and len(line) >= len(title)
+
+
+class ChangesDocument:
+    """The text of CHANGES.rst, with its "Unreleased" section parsed."""
+
+    def __init__(self, text: str):  # noqa
+        self.lines = text.split("\n")
+        self.start, self.end = self._find_section(UNRELEASED)
+        self.groups: Dict[str, List[str]] = {}
+        if self.start is not None:
+            self._parse(self.lines[self.start + 2 : self.end])
+
+    def _find_section(self, title):
+        """Return the line range (start, end) of a top level section."""
+        lines, start = self.lines, None
+        for i in range(len(lines) - 1):
+            if not _is_underline(lines[i + 1], "=", lines[i]) or not lines[i]:
+                continue
+            if i > 0 and lines[i - 1] == lines[i + 1]:
+                continue  # the document title, with an overline
+            if start is not None:
+                return start, i
+            if lines[i].strip() == title:
+                start = i
+        return start, len(lines)
+
+    def _parse(self, body: List[str]):
+        group = OTHER
+        for i, line in enumerate(body):
+            if i + 1 < len(body) and _is_underline(body[i + 1], "-", line) and line:
+                group = line.strip()
+                self.groups.setdefault(group, [])
+            elif line.startswith("- "):
+                self.groups.setdefault(group, []).append(line[2:])
+            elif line.startswith("  ") and self.groups.get(group):
+                self.groups[group][-1] += "\n" + line  # a continuation line
+            # Blank lines and underlines are recreated by render()
+
+    def add(self, entries: Dict[str, List[str]]) -> None:
+        """Put new entries above the existing ones in each group."""
+        for group, items in entries.items():
+            self.groups[group] = items + self.groups.get(group, [])
+
+    def _render_section(self, title: str) -> List[str]:
+        out = [title, "=" * len(title), ""]
+        names = [g for g in ORDER if g in self.groups]
+        names += [g for g in self.groups if g not in ORDER]
+        for name in names:
+            if not self.groups[name]:
+                continue
+            out += [name, "-" * len(name), ""]
+            out += ["- " + item for item in self.groups[name]]
+            out.append("")
+        return out + [""]
+
+    def render(self, title: str = UNRELEASED) -> str:
+        lines = self.lines
+        if self.start is not None:
+            before, after = lines[: self.start], lines[self.end :]
+        else:  # new section, after the document title if there is one
+            top = 0
+            if len(lines) > 2 and _is_underline(lines[0], "=", lines[1]):
+                top = 3
+                while top < len(lines) and not lines[top].strip():
+                    top += 1
+                before = lines[:3] + ["", ""]
+            else:
+                before = []
+            after = lines[top:]
+        return "\n".join(before + self._render_section(title) + after)
+
+
+def update_changelog(
+    git, config, log, cache, version: Optional[str] = None, tag_prefix: str = "v"
+):
+    """Add new commits to the changes file; name the section if ``version``.
+
+    ``cache`` is a JsonCache; return the number of commits added. In a
+    batch release, only the commits touching the package directory count.
+    """
+    path = config.get("changes_file", "CHANGES.rst")
+    encoding = config.get("encoding", "utf-8")
+    skip = re.compile(config.get("changelog_skip", DEFAULT_SKIP))
+    since = start_point(git, cache.get("last_commit"), tag_prefix)
+    entries: Dict[str, List[str]] = {}
+    head, count = None, 0
+    for commit, subject in new_commits(
+        git, since, config.get("changelog_max_commits", 500), config.get("cwd")
+    ):
+        head = head or commit
+        if skip.search(subject):
+            continue
+        group, text = classify(subject)
+        entries.setdefault(group, []).append(text)
+        count += 1
+    with open(path, encoding=encoding, newline="") as stream:
+        doc = ChangesDocument(stream.read())
+    doc.add(entries)
+    title = UNRELEASED
+    if version:
+        title = "Version {0} ({1})".format(version, date.today().strftime("%Y-%m"))
+    if doc.start is not None or count:  # else there is nothing to write
+        with open(path, "w", encoding=encoding, newline="") as stream:
+            stream.write(doc.render(title))
+    if head:
+        cache["last_commit"] = head
+        cache.save()
+    log.info("Added {0} commit(s) to {1}".format(count, path))
+    return count
@@ -0,0 +1,241 @@
+"""Polls a continuous integration service until the latest build finishes.
+
+A CIProvider knows one service: the URL of its build list and how to
+read the status of the latest build of a branch out of the response.
+The CIPoller does the HTTP work for any provider: it reuses one pooled
+session, sends ``If-None-Match`` so unchanged answers cost no quota,
+backs off exponentially while the build is pending and gives up at a
+deadline. Settings (all optional):
+
+- ``ci_provider``: "travis" (the default) or "github"
+- ``ci_api_url``: base URL of the API, e.g. of a local stub server
+- ``ci_deadline``: seconds to wait for a pending build; default 900
+- ``ci_interval``: seconds before the first new poll; default 10
+- ``ci_max_interval``: longest wait between polls; default 120
+
+The GitHub provider sends the ``GITHUB_TOKEN`` environment variable,
+if present, to raise the rate limit.
+"""
+
+import os
+import time
+from typing import Dict, Optional, Type
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import StopRelease
+
+
+class CIProvider:
+    """Abstract base class for a continuous integration service."""
+
+    name = "CI"
+    API_URL = ""
+
+    def __init__(self, config):  # noqa
+        self.config = config
+        self.api_url = config.get("ci_api_url", self.API_URL).rstrip("/")
+        self.branch = config.get("branch", "master")
+
+    def url(self) -> str:
+        """URL of the (first page of the) list of builds."""
+        raise NotImplementedError()
+
+    def headers(self) -> Dict[str, str]:
+        return {}
+
+    def status(self, payload) -> Optional[dict]:
+        """Find the latest build of the branch in a decoded response.
+
+        Return None if it is not in this page; otherwise a dict with
+        ``finished`` and ``passed`` booleans and a ``description``.
+        """
+        raise NotImplementedError()
+
+    def next_page(self, payload) -> Optional[str]:
+        """URL of the next page of builds, or None if there is none."""
+        return None
+
+
+class TravisProvider(CIProvider):
+    """travis-ci, through its v2 API."""
+
+    name = "Travis"
+    API_URL = "https://api.travis-ci.org"
+
+    def url(self):
+        return "{0}/repos/{1}/{2}/builds".format(
+            self.api_url,
+            self.config["github_user"],
+            self.config["github_repository"],
+        )
+
+    def status(self, payload):
+        for build in payload:
+            if build["branch"] == self.branch:
+                return {
+                    "finished": build["state"] == "finished",
+                    "passed": build.get("result") == 0,
+                    "description": build.get("message"),
+                }
+        return None
+
+    def next_page(self, payload):
+        if not payload:
+            return None
+        return self.url() + "?after_number={0}".format(payload[-1]["number"])
+
+
+class GitHubActionsProvider(CIProvider):
+    """GitHub Actions workflow runs."""
+
+    name = "GitHub Actions"
+    API_URL = "https://api.github.com"
+
+    def url(self):
+        return "{0}/repos/{1}/{2}/actions/runs?branch={3}&per_page=20".format(
+            self.api_url,
+            self.config["github_user"],
+            self.config["github_repository"],
+            self.branch,
+        )
+
+    def headers(self):
+        headers = {"Accept": "application/vnd.github+json"}
+        token = os.environ.get("GITHUB_TOKEN")
+        if token:
+            headers["Authorization"] = "Bearer " + token
+        return headers
+
+    def status(self, payload):
+        runs = payload.get("workflow_runs", [])
+        if not runs:
+            return None
+        latest = runs[0]
+        return {
+            "finished": latest["status"] == "completed",
+            "passed": latest.get("conclusion") == "success",
+            "description": latest.get("display_title") or latest.get("name"),
+        }
+
+
+PROVIDERS: Dict[str, Type[CIProvider]] = {
+    "travis": TravisProvider,
+    "github": GitHubActionsProvider,
+}
+
+
+class CIPoller:
+    """Waits for the latest build of a provider; see the module docs."""
+
+    def __init__(
+        self,
+        provider: CIProvider,
+        log,
+        deadline=900.0,
+        interval=10.0,
+        max_interval=120.0,
+        timeout=30.0,
+        stopping=None,
+    ):  # noqa
+        self.provider = provider
+        self.log = log
+        self.deadline = deadline
+        self.interval = interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.stopping = stopping  # a threading.Event that cancels the wait
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=1))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=1))
+        self.session.headers.update(provider.headers())
+        self._cache: Dict[str, tuple] = {}  # url: (etag, payload)
+
+    @classmethod
+    def from_config(cls, config, log, stopping=None):
+        name = config.get("ci_provider", "travis")
+        try:
+            provider = PROVIDERS[name](config)
+        except KeyError:
+            raise StopRelease("Unknown CI provider: {0}".format(name))
+        return cls(
+            provider,
+            log,
+            deadline=config.get("ci_deadline", 900),
+            interval=config.get("ci_interval", 10),
+            max_interval=config.get("ci_max_interval", 120),
+            stopping=stopping,
+        )
+
+    def get(self, url: str):
+        """GET ``url`` as JSON, conditionally if it was fetched before."""
+        etag, payload = self._cache.get(url, (None, None))
+        headers = {"If-None-Match": etag} if etag else {}
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return payload
+        if resp.status_code in (403, 429) and "Retry-After" in resp.headers:
+            raise _RateLimited(float(resp.headers["Retry-After"]))
+        resp.raise_for_status()
+        payload = resp.json()
+        if resp.headers.get("ETag"):
+            self._cache[url] = (resp.headers["ETag"], payload)
+        return payload
+
+    def latest(self) -> Optional[dict]:
+        """Return the status of the latest build, walking pages as needed."""
+        url: Optional[str] = self.provider.url()
+        for _ in range(10):  # pages
+            payload = self.get(url)
+            status = self.provider.status(payload)
+            if status is not None:
+                return status
+            url = self.provider.next_page(payload)
+            if url is None:
+                break
+        return None
+
+    def _sleep(self, seconds: float) -> None:
+        if self.stopping is None:
+            time.sleep(seconds)
+        elif self.stopping.wait(seconds):
+            raise StopRelease("Stopped waiting for the CI build.")
+
+    def wait(self) -> dict:
+        """Poll until the latest build finishes; return its status.
+
+        Raise StopRelease if there is no build or the deadline passes.
+        """
+        name, branch = self.provider.name, self.provider.branch
+        give_up = time.monotonic() + self.deadline
+        delay = self.interval
+        while True:
+            try:
+                status = self.latest()
+                if status is None:
+                    problem = '{0} has not built branch "{1}" yet.'.format(name, branch)
+                elif status["finished"]:
+                    return status
+                else:
+                    problem = '{0} is still building branch "{1}".'.format(name, branch)
+                wait = delay
+                delay = min(delay * 2, self.max_interval)
+            except _RateLimited as e:
+                problem = "{0} asks us to slow down.".format(name)
+                wait = e.seconds
+            except (requests.RequestException, ValueError) as e:
+                problem = "Could not reach {0}: {1}".format(name, e)
+                wait = delay
+                delay = min(delay * 2, self.max_interval)
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                raise StopRelease(problem + " Gave up waiting.")
+            wait = min(wait, remaining)
+            self.log.info("{0} Checking again in {1:.0f}s.".format(problem, wait))
+            self._sleep(wait)
+
+
+class _RateLimited(Exception):
+    def __init__(self, seconds):  # noqa
+        self.seconds = seconds
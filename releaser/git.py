@@ -0,0 +1,282 @@
+"""A shared, mostly process-free view of the git repository being released.
+
+Read-only questions (which ref HEAD points to, the current branch,
+existing tags) are answered by reading files inside ``.git`` directly.
+Commands that must run git do so without an intermediate shell, and
+several ref updates are batched into a single ``git update-ref --stdin``.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import StopRelease
+from .process import CommandResult, run_command
+
+
+class GitError(StopRelease):
+    """A git command failed."""
+
+
+def parse_status(output: str) -> List[str]:
+    """Return the paths in the output of ``git status --porcelain=v2 -z``.
+
+    Paths are not quoted in this format, whatever characters they have.
+    """
+    paths = []
+    entries = iter(output.split("\0"))
+    for entry in entries:
+        kind = entry[:2]
+        if kind == "1 ":  # 1 XY sub mH mI mW hH hI path
+            paths.append(entry.split(" ", 8)[8])
+        elif kind == "2 ":  # 2 XY sub mH mI mW hH hI Xscore path, then origPath
+            paths.append(entry.split(" ", 9)[9])
+            next(entries, None)
+        elif kind == "u ":  # u XY sub m1 m2 m3 mW h1 h2 h3 path
+            paths.append(entry.split(" ", 10)[10])
+    return paths
+
+
+class GitRepository:
+    """Access to the git repository containing ``path``.
+
+    One instance lives on the Releaser (as ``releaser.git``) and is
+    shared by all the steps.
+    """
+
+    def __init__(
+        self, log, path: str = ".", executable: str = "git", tracer=None
+    ):  # noqa
+        self.log = log
+        self.tracer = tracer
+        self.path = os.path.abspath(path)
+        self.executable = executable
+        self.root, self.git_dir = self._find_git_dir(self.path)
+        self.common_dir = self._find_common_dir(self.git_dir)
+        # Repositories using the newer "reftable" backend cannot be read
+        # as plain files, so we fall back to running git for them.
+        self.reftable = os.path.isdir(os.path.join(self.common_dir, "reftable"))
+
+    @staticmethod
+    def _find_git_dir(path: str) -> Tuple[str, str]:
+        """Return the top of the work tree and the git directory."""
+        while True:
+            candidate = os.path.join(path, ".git")
+            if os.path.isdir(candidate):
+                return path, candidate
+            if os.path.isfile(candidate):  # a worktree or a submodule
+                with open(candidate, encoding="utf-8") as stream:
+                    content = stream.read().strip()
+                if content.startswith("gitdir:"):
+                    return path, os.path.normpath(
+                        os.path.join(path, content[len("gitdir:") :].strip())
+                    )
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise GitError("Not inside a git repository.")
+            path = parent
+
+    @staticmethod
+    def _find_common_dir(git_dir: str) -> str:
+        try:
+            with open(os.path.join(git_dir, "commondir"), encoding="utf-8") as f:
+                return os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        except FileNotFoundError:
+            return git_dir
+
+    # ==============================  Commands  ==============================
+    def run(self, *args, input="", check=True, tail_lines=500):
+        """Run git (without a shell) and return a CommandResult.
+
+        If ``check`` is true, GitError is raised when git fails.
+        Pass ``tail_lines=None`` to keep all of the output.
+        """
+        result = run_command(
+            [self.executable, *args],
+            self.log,
+            input=input,
+            shell=False,
+            cwd=self.path,
+            tail_lines=tail_lines,
+        )
+        if self.tracer:
+            self.tracer.add_command(result)
+        if check and result.return_code != 0:
+            raise GitError(
+                "git {0} failed with code {1}:\n{2}".format(
+                    " ".join(args), result.return_code, result.text
+                )
+            )
+        return result
+
+    def stream(self, *args) -> Iterator[str]:
+        """Run git and yield the lines of its output as they arrive.
+
+        The output is never held in memory as a whole, so this suits
+        commands such as ``git log`` on a long history. If the consumer
+        stops early, git is terminated. GitError is raised when git fails.
+        """
+        command = [self.executable, *args]
+        started = time.perf_counter()
+        with tempfile.TemporaryFile() as errors:  # cannot fill up and block
+            process = subprocess.Popen(
+                command, cwd=self.path, stdout=subprocess.PIPE, stderr=errors
+            )
+            completed = False
+            try:
+                for raw in process.stdout:
+                    yield raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                completed = True
+            finally:
+                if not completed:
+                    process.kill()
+                process.stdout.close()
+                code = process.wait()
+                errors.seek(0)
+                message = errors.read().decode("utf-8", errors="replace").strip()
+                if self.tracer:
+                    self.tracer.add_command(
+                        CommandResult(
+                            command,
+                            code,
+                            "",
+                            message,
+                            started=started,
+                            duration=time.perf_counter() - started,
+                        )
+                    )
+            if code != 0:
+                raise GitError(
+                    "git {0} failed with code {1}:\n{2}".format(
+                        " ".join(args), code, message
+                    )
+                )
+
+    def update_refs(self, instructions: Iterable[str]) -> None:
+        """Apply many ref changes in one atomic ``git update-ref`` process.
+
+        Each instruction is a line such as ``delete refs/tags/v1.0``.
+        """
+        lines = "".join(line + "\n" for line in instructions)
+        if lines:
+            self.run("update-ref", "--stdin", input=lines)
+
+    def delete_tags(self, names: Iterable[str]) -> None:
+        """Delete local tags, all at once."""
+        self.update_refs("delete refs/tags/" + name for name in names)
+
+    @contextmanager
+    def worktree(self, rev: str = "HEAD") -> Iterator[str]:
+        """Check out ``rev`` in a temporary, detached work tree.
+
+        Yield the path of the work tree, which is removed afterwards.
+        """
+        path = tempfile.mkdtemp(prefix="releaser-worktree-")
+        try:
+            self.run("worktree", "add", "--quiet", "--detach", path, rev)
+            yield path
+        finally:
+            self.run("worktree", "remove", "--force", path, check=False)
+            shutil.rmtree(path, ignore_errors=True)
+            self.run("worktree", "prune", check=False)
+
+    # ==============================  Queries  ===============================
+    def _read(self, *parts) -> Optional[str]:
+        try:
+            with open(os.path.join(*parts), encoding="utf-8") as stream:
+                return stream.read().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+
+    def symbolic_ref(self) -> Optional[str]:
+        """Return what HEAD points to, e.g. "refs/heads/master".
+
+        Return None when HEAD is detached (e.g. a tag is checked out).
+        """
+        if self.reftable:
+            result = self.run("symbolic-ref", "--quiet", "HEAD", check=False)
+            return result.stdout or None
+        head = self._read(self.git_dir, "HEAD") or ""
+        return head[4:].strip() if head.startswith("ref:") else None
+
+    def current_branch(self) -> Optional[str]:
+        """Return the name of the checked out branch, or None if detached."""
+        ref = self.symbolic_ref()
+        if ref and ref.startswith("refs/heads/"):
+            return ref[len("refs/heads/") :]
+        return None
+
+    def refs(self, prefix: str = "refs/") -> Dict[str, str]:
+        """Return a dict mapping ref names under ``prefix`` to object ids."""
+        if self.reftable:
+            result = self.run(
+                "for-each-ref", "--format=%(objectname) %(refname)", prefix
+            )
+            return dict(
+                reversed(line.split(" ", 1)) for line in result.stdout.splitlines()
+            )
+        found = {}
+        packed = self._read(self.common_dir, "packed-refs") or ""
+        for line in packed.splitlines():
+            if line[:1] in ("#", "^", ""):
+                continue  # header, peeled object id or empty line
+            oid, name = line.split(" ", 1)
+            if name.startswith(prefix):
+                found[name] = oid
+        # Loose refs take precedence over packed ones
+        top = os.path.join(self.common_dir, *prefix.rstrip("/").split("/"))
+        if os.path.isfile(top):  # prefix is the full name of a ref
+            oid = self._read(top)
+            if oid:
+                found[prefix] = oid
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.common_dir).replace(os.sep, "/")
+                oid = self._read(path)
+                if oid and not filename.endswith(".lock"):
+                    found[name] = oid
+        return found
+
+    def head_commit(self) -> Optional[str]:
+        """Return the object id of the commit HEAD points to."""
+        if self.reftable:
+            result = self.run("rev-parse", "--verify", "--quiet", "HEAD", check=False)
+            return result.stdout or None
+        ref = self.symbolic_ref()
+        if ref is None:  # detached HEAD contains the object id itself
+            return self._read(self.git_dir, "HEAD")
+        return self.refs(ref).get(ref)
+
+    def tree_id(self, rev: str = "HEAD") -> str:
+        """Return the object id of the tree of a commit."""
+        return self.run("rev-parse", "--verify", rev + "^{tree}").stdout
+
+    def tags(self) -> List[str]:
+        """Return the names of all local tags (without "refs/tags/")."""
+        return sorted(name[len("refs/tags/") :] for name in self.refs("refs/tags/"))
+
+    def tracked_files(self) -> List[str]:
+        """Return the paths of all files in the index, relative to the root."""
+        result = self.run(
+            "-c", "core.quotePath=false", "ls-files", "--full-name", tail_lines=None
+        )
+        return result.stdout.splitlines()
+
+    def dirty_files(self) -> List[str]:
+        """Return tracked files that have uncommitted changes.
+
+        Paths are relative to the top of the work tree (``self.root``).
+
+        Comparing the work tree to the index requires hashing file
+        contents, so this runs one git process (but no shell).
+        A renamed file is given by its new path.
+        """
+        result = self.run(
+            "status", "--porcelain=v2", "-z", "--untracked-files=no", tail_lines=None
+        )
+        return parse_status(result.stdout)
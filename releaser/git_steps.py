@@ -1,6 +1,6 @@
 """Release steps involving git."""
 
-from . import ReleaseStep, CommandStep, StopRelease
+from . import ReleaseStep, StopRelease
 
 __all__ = (
     "EnsureGitClean",
@@ -20,17 +20,15 @@ class EnsureGitClean(ReleaseStep):
     """
 
     ERROR_CODE = 52
+    parallel_safe = True
 
     def __call__(self):
-        head = self._execute_or_complain("git symbolic-ref --quiet HEAD")
-        # This returns something like 'refs/heads/master' or nothing.
-        # Nothing is bad, indicating a detached head: likely a tag checkout
-        if not head:
+        git = self.releaser.git
+        # This returns something like 'refs/heads/master' or None.
+        # None is bad, indicating a detached head: likely a tag checkout
+        if not git.symbolic_ref():
             raise StopRelease("Wait, are you on a detached head?")
-        changes = self._execute_or_complain(
-            "git status --short --untracked-files=no"
-        )  # sets self.success
-        if changes:
+        if git.dirty_files():
             raise StopRelease("There are uncommitted changes in tracked files.")
         self._succeed()
 
@@ -39,10 +37,10 @@ class EnsureGitBranch(ReleaseStep):
     """I must be in the branch specified in config."""
 
     ERROR_CODE = 51
+    parallel_safe = True
 
     def _get_current_branch(self):
-        branch = self._execute_or_complain("git rev-parse --abbrev-ref HEAD")
-        return None if branch == "HEAD" else branch
+        return self.releaser.git.current_branch()  # None if detached
 
     def __call__(self):
         required = self.config.get("branch", "master")
@@ -61,55 +59,86 @@ class GitCommitVersionNumber(ReleaseStep):
     Can rollback().
     """
 
-    COMMAND = 'git commit -a -m "{0}"'
+    COMMAND = ("git", "commit", "-a", "-m", "{0}")
     ERROR_CODE = 53
 
     def __init__(self, which="the_version", msg="Version {0}", stop_on_failure=True):
         assert which in ("the_version", "future_version")
         self.which = which
-        self.msg = msg.replace('"', '"')  # escape quotes for shell
+        self.needs = (which,)
+        self.msg = msg  # no escaping needed: git runs without a shell
         self.stop_on_failure = stop_on_failure
 
+    def describe(self):
+        return "$ git commit -a -m '{0}'".format(
+            self.msg.format("<" + self.which + ">")
+        )
+
     def __call__(self):
         msg = self.msg.format(getattr(self.releaser, self.which))
-        self._execute_or_complain(self.COMMAND.format(msg))  # sets success
+        command = [arg.format(msg) for arg in self.COMMAND]
+        self._execute_or_complain(command, shell=False)  # sets success
 
     def rollback(self):
-        self._execute_or_complain("git reset --hard HEAD^")
+        self._execute_or_complain(["git", "reset", "--hard", "HEAD^"], shell=False)
 
 
 class GitTag(ReleaseStep):
     """Tags the current git commit with the new version number.
 
-    Can rollback().
+    The tag is named after the ``tag_format`` setting (default
+    "v{version}"). Can rollback().
     """
 
-    COMMAND = 'git tag -a v{0} -m "Version {0}"'
+    COMMAND = ("git", "tag", "-a", "{0}", "-m", "{1}")
     ERROR_CODE = 54
+    needs = ("the_version",)
+    provides = ("tags",)
     stop_on_failure = False
 
+    def describe(self):
+        return "$ git tag -a " + self.releaser.tag_name("<the_version>")
+
     def __call__(self):
-        version = self.releaser.the_version
-        if version is None:
+        tags = self.releaser.new_tags()
+        if not tags:
             self.log.warning(
                 "Skipping the GitTag step. It can only run AFTER "
                 "some other step sets *the_version* on the releaser."
             )
             return
-        self._execute_or_complain(self.COMMAND.format(version))  # sets success
-        if self.success:
-            self.releaser.created_tags.append(version)
+        for name, message in tags:
+            command = [arg.format(name, message) for arg in self.COMMAND]
+            self._execute_or_complain(command, shell=False)  # sets success
+            if not self.success:
+                break
+            self.releaser.created_tags.append(name)
 
     def rollback(self):
-        self._execute_or_complain('git tag -d "v{0}"'.format(self.releaser.the_version))
+        created = self.releaser.created_tags
+        self.releaser.git.delete_tags(
+            [name for name, _ in self.releaser.new_tags() if name in created]
+        )
+
+
+def _push_command(remote, refs, delete=False):
+    """Command that pushes (or deletes) all ``refs`` in one atomic push."""
+    command = ["git", "push", "--atomic", remote]
+    if delete:
+        command.append("--delete")
+    return command + list(refs)
 
 
 class GitPush(ReleaseStep):
-    """Does ``git push``. This critical step has no rollback."""
+    """Pushes the current branch and the new tags. This step has no rollback.
+
+    The branch and the tags created so far travel in a single atomic
+    ``git push`` to the remote set in config (default "origin").
+    """
 
-    COMMAND = "git push"
     ERROR_CODE = 55
     stop_on_failure = False  # It should be easy to 'git push' afterwards
+    irreversible = True
     no_rollback = (
         "One should never try to undo a git push. Really.\n"
         "This release process went far -- the push succeeded -- but\n"
@@ -118,9 +147,23 @@ class GitPush(ReleaseStep):
         "so I will NOT roll back any of the steps that preceded the push."
     )
 
+    def describe(self):
+        return "$ git push --atomic {0} <current branch> <new tags>".format(
+            self.config.get("remote", "origin")
+        )
+
     def __call__(self):
-        self._execute_or_complain(self.COMMAND)  # sets success
+        releaser = self.releaser
+        branch = releaser.git.current_branch()
+        if branch is None:
+            self._fail("Cannot push from a detached head.")
+            return
+        tags = [t for t in releaser.created_tags if t not in releaser.pushed_tags]
+        refs = ["refs/heads/" + branch] + ["refs/tags/" + t for t in tags]
+        remote = self.config.get("remote", "origin")
+        self._execute_or_complain(_push_command(remote, refs), shell=False)
         if self.success:
+            releaser.pushed_tags.extend(tags)
             # Erase history so all steps before the push won't be rolled back
             self.log.debug("GitPush successful; erasing rollback history.")
             # self.releaser.rewindable.clear()
@@ -129,13 +172,43 @@ class GitPush(ReleaseStep):
             self.releaser.non_rewindable[:] = []  # Python 2.6 has no clear()
 
 
-class GitPushTags(CommandStep):
-    """Pushes local tags to the remote repository. Can rollback()."""
+class GitPushTags(ReleaseStep):
+    """Pushes the new tags to the remote repository. Can rollback().
+
+    Tags already pushed by GitPush are skipped; the rest go in a single
+    atomic push, and rollback deletes them all in a single push, too.
+    """
 
-    COMMAND = "git push --tags"
     ERROR_CODE = 56
+    needs = ("tags",)
     stop_on_failure = False
+    pushed = ()  # tags pushed by this step, for rollback
+
+    def describe(self):
+        return "$ git push --atomic {0} <new tags not pushed yet>".format(
+            self.config.get("remote", "origin")
+        )
+
+    def __call__(self):
+        releaser = self.releaser
+        tags = [t for t in releaser.created_tags if t not in releaser.pushed_tags]
+        if not tags:
+            self.log.info("No tags left to push.")
+            self._succeed()
+            return
+        remote = self.config.get("remote", "origin")
+        refs = ["refs/tags/" + t for t in tags]
+        self._execute_or_complain(_push_command(remote, refs), shell=False)
+        if self.success:
+            releaser.pushed_tags.extend(tags)
+            self.pushed = tags
 
     def rollback(self):
-        for tag in self.releaser.created_tags:
-            self._execute_or_complain('git push --delete origin "v{0}"'.format(tag))
+        if not self.pushed:
+            return
+        remote = self.config.get("remote", "origin")
+        refs = ["refs/tags/" + t for t in self.pushed]
+        self._execute_or_complain(_push_command(remote, refs, delete=True), shell=False)
+        self.releaser.pushed_tags[:] = [
+            t for t in self.releaser.pushed_tags if t not in self.pushed
+        ]
@@ -0,0 +1,145 @@
+"""Remembers how long each step took in previous releases.
+
+After every release (successful or not), the duration of each step is
+stored in a small SQLite database, ``history.sqlite3`` in the
+``cache_dir``. ``Releaser.plan()`` uses the median of the latest runs
+as the estimate for each step and flags steps whose last run was much
+slower than that -- a regression worth a look.
+
+A step is identified by its name (``str(step)``) and by its occurrence,
+since the same step (e.g. GitCommitVersionNumber) may appear twice.
+Set ``history=False`` in the config to record nothing.
+"""
+
+import os
+import sqlite3
+import statistics
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    version TEXT,
+    success INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS step_times (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    step TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    wall REAL NOT NULL,
+    cpu REAL,
+    success INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS step_times_by_step
+    ON step_times (step, occurrence, run_id);
+"""
+
+
+class Estimate(NamedTuple):
+    median: float  # seconds
+    runs: int  # number of successful runs the median comes from
+    last: float  # seconds taken the last time
+
+    @property
+    def regressed(self) -> bool:
+        """The last run took more than 50% (and 1 s) longer than usual."""
+        return self.runs >= 3 and self.last > max(self.median * 1.5, self.median + 1)
+
+
+def keys(names: Sequence[str]) -> List[Tuple[str, int]]:
+    """Pair each step name with its occurrence number (1 for the first)."""
+    seen: Dict[str, int] = {}
+    result = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        result.append((name, seen[name]))
+    return result
+
+
+class History:
+    """The database of step timings; see the module docs."""
+
+    def __init__(self, config, path: Optional[str] = None):  # noqa
+        self.path = path or os.path.join(cache_dir(config), "history.sqlite3")
+        self.recent = config.get("history_runs", 10)  # runs in each estimate
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.executescript(SCHEMA)
+        return db
+
+    def record(
+        self, tracer, names: Sequence[str], version: Optional[str], success: bool
+    ) -> None:
+        """Store the durations of the steps measured by ``tracer``.
+
+        ``names`` are those of all the steps of the release, in order;
+        each step span holds the ``position`` of its step among them, so
+        occurrences are counted the same way as in estimates(), whatever
+        order the steps ran in and wherever a resumed release started.
+        """
+        occurrences = keys(names)
+        steps = [
+            s
+            for s in tracer.spans
+            if s.category == "step" and s.args.get("position") is not None
+        ]
+        if not steps:
+            return
+        cpu: Dict[int, float] = {}  # commands run by each step
+        for span in tracer.spans:
+            if span.category == "command" and span.parent is not None:
+                cpu[id(span.parent)] = cpu.get(id(span.parent), 0) + (span.cpu or 0)
+        rows = [
+            occurrences[span.args["position"]]
+            + (
+                span.wall,
+                (span.cpu or 0) + cpu.get(id(span), 0),
+                int(bool(span.args.get("success")) and "error" not in span.args),
+            )
+            for span in steps
+        ]
+        db = self._connect()
+        try:
+            with db:
+                run_id = db.execute(
+                    "INSERT INTO runs (started, version, success) VALUES (?, ?, ?)",
+                    (time.time(), version, int(success)),
+                ).lastrowid
+                db.executemany(
+                    "INSERT INTO step_times (run_id, step, occurrence, wall, cpu,"
+                    " success) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(run_id,) + row for row in rows],
+                )
+        finally:
+            db.close()
+
+    def estimates(self, names: Sequence[str]) -> List[Optional[Estimate]]:
+        """Return an Estimate (or None, if never measured) for each step."""
+        if not os.path.exists(self.path):
+            return [None] * len(names)
+        db = self._connect()
+        try:
+            result = []
+            for name, occurrence in keys(names):
+                walls = [
+                    row[0]
+                    for row in db.execute(
+                        "SELECT wall FROM step_times WHERE step = ? AND"
+                        " occurrence = ? AND success = 1 ORDER BY run_id DESC"
+                        " LIMIT ?",
+                        (name, occurrence, self.recent),
+                    )
+                ]
+                result.append(
+                    Estimate(statistics.median(walls), len(walls), walls[0])
+                    if walls
+                    else None
+                )
+            return result
+        finally:
+            db.close()
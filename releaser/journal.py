@@ -0,0 +1,182 @@
+"""A journal of completed steps, so a failed release can be resumed.
+
+After each successful step, the Releaser records in a JSON file the
+step, what it produced (``old_version``, ``the_version``,
+``created_tags``) and a fingerprint of the repository: the commit at
+HEAD, the created tags, the contents of the version files and the
+hashes of the artifacts in ``dist/``.
+
+Running the release script with ``--resume`` (or ``resume=True`` in the
+config) finds the latest journal entry whose fingerprint matches the
+current state of the repository and continues from the following step.
+When rollback undoes some steps, their entries are dropped. Background
+steps are recorded when the release joins them; one that was still
+running when the release stopped has no entry, and the release never
+resumes after it.
+"""
+
+import json
+import os
+from typing import Any, Dict, Optional
+
+from . import StopRelease
+from .cache import cache_dir, file_digest, write_atomically
+
+
+class Journal:
+    """The on-disk journal of one release script; see the module docs."""
+
+    def __init__(self, releaser, path: Optional[str] = None):  # noqa
+        self.releaser = releaser
+        self.path = path or os.path.join(cache_dir(releaser.config), "journal.json")
+        self.data: Dict[str, Any] = {"steps": [], "completed": []}
+        self._digests: Dict[tuple, str] = {}  # memo keyed by path, size, mtime
+
+    # =============================  Fingerprint  ============================
+    def _digest(self, path: str) -> str:
+        info = os.stat(path)
+        key = (os.path.abspath(path), info.st_size, info.st_mtime_ns)
+        if key not in self._digests:
+            self._digests[key] = file_digest(path)
+        return self._digests[key]
+
+    def _version_files(self):
+        from .stamping import VersionStamper
+
+        config = self.releaser.config
+        if not (config.get("version_files") or config.get("version_file")):
+            return []
+        return VersionStamper.from_config(config).paths
+
+    def fingerprint(self) -> Dict[str, Any]:
+        """Describe the current state of the repository."""
+        releaser = self.releaser
+        git = releaser.git
+        tags = git.refs("refs/tags/")
+        dist = releaser.config.get("dist_dir", "dist")
+        artifacts = sorted(os.listdir(dist)) if os.path.isdir(dist) else []
+        return {
+            "head": git.head_commit(),
+            "tags": {t: tags.get("refs/tags/" + t) for t in releaser.created_tags},
+            "files": {
+                p: self._digest(p) for p in self._version_files() if os.path.exists(p)
+            },
+            "dist": {
+                name: self._digest(os.path.join(dist, name))
+                for name in artifacts
+                if os.path.isfile(os.path.join(dist, name))
+            },
+        }
+
+    # ===============================  Writing  ==============================
+    def _save(self):
+        text = json.dumps(self.data, indent=1, sort_keys=True)
+        write_atomically(self.path, text.encode("utf-8"))
+
+    def start(self):
+        """Begin a new journal for this release, replacing any old one."""
+        self.data = {
+            "steps": [str(step) for step in self.releaser.instances],
+            "completed": [],
+        }
+        self._save()
+
+    def record(self, step):
+        """Append an entry for ``step``, which has just succeeded."""
+        releaser = self.releaser
+        self.data["completed"].append(
+            {
+                "index": releaser.instances.index(step),
+                "step": str(step),
+                "state": self.fingerprint(),
+                "outputs": {
+                    "old_version": releaser.old_version,
+                    "the_version": releaser.the_version,
+                    "created_tags": list(releaser.created_tags),
+                },
+                # Rollback history, since GitPush can erase it:
+                "rewindable": [
+                    releaser.instances.index(s) for s in releaser.rewindable
+                ],
+                "non_rewindable": list(releaser.non_rewindable),
+            }
+        )
+        self._save()
+
+    def forget_from(self, index: int):
+        """Drop the entries of steps from ``index`` on (they were undone)."""
+        self.data["completed"] = [
+            e for e in self.data["completed"] if e["index"] < index
+        ]
+        self._save()
+
+    def discard(self):
+        """Delete the journal; the release is complete."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # ===============================  Reading  ==============================
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as stream:
+                self.data = json.load(stream)
+        except FileNotFoundError:
+            raise StopRelease("There is no journal, so nothing to resume.")
+        names = [str(step) for step in self.releaser.instances]
+        if self.data.get("steps") != names:
+            raise StopRelease(
+                "Cannot resume: the steps in the journal differ from "
+                "the steps in the release script."
+            )
+
+    def resume(self) -> int:
+        """Restore the state after the latest matching entry.
+
+        Return the index of the first step that must run.
+        """
+        self.load()
+        releaser = self.releaser
+        # Background steps are recorded when they finish, possibly after
+        # later steps, so entries are taken in the order of the steps.
+        # A background step without an entry never finished: resume
+        # before it, at the latest.
+        done = {e["index"] for e in self.data["completed"]}
+        limit = min(
+            (
+                i
+                for i, step in enumerate(releaser.instances)
+                if step.background and i not in done
+            ),
+            default=len(releaser.instances),
+        )
+        entries = sorted(
+            (e for e in self.data["completed"] if e["index"] < limit),
+            key=lambda e: e["index"],
+        )
+        for entry in reversed(entries):
+            releaser.created_tags[:] = entry["outputs"]["created_tags"]
+            if entry["state"] == self.fingerprint():
+                break
+        else:
+            releaser.created_tags[:] = []
+            raise StopRelease(
+                "Cannot resume: the repository no longer matches any "
+                "completed step in the journal. Run without --resume."
+            )
+        outputs = entry["outputs"]
+        releaser._old_version = outputs["old_version"]
+        releaser._the_version = outputs["the_version"]
+        releaser.rewindable[:] = [releaser.instances[i] for i in entry["rewindable"]]
+        releaser.non_rewindable[:] = entry["non_rewindable"]
+        index = entry["index"]
+        for step in releaser.instances[: index + 1]:
+            step.success = True
+        # Entries after the resume point are about to be redone
+        self.data["completed"] = [
+            e for e in self.data["completed"] if e["index"] <= index
+        ]
+        self._save()
+        releaser.log.info(
+            "Resuming after step {0}: {1}".format(index + 1, entry["step"])
+        )
+        return index + 1
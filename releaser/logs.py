@@ -0,0 +1,196 @@
+"""The release log, written to disk by a background thread.
+
+Steps (and the subprocesses they run) only put log records on a queue;
+a QueueListener thread formats them into the log file, so tens of MB of
+build output do not slow the steps down. Messages for the screen are
+still shown synchronously.
+
+Each record is tagged with the step that produced it -- also when it
+comes from a thread the step started, such as the threads that read the
+output of a command -- and the byte ranges each step occupies in the
+log are saved in an index next to it (``<log_file>.index.json``).
+``release_new_version.py log <step>`` prints the log of one step.
+
+Settings (all optional):
+
+- ``log_async``: use the background writer; default True
+- ``log_compress``: write the log with gzip (".gz" is appended to the
+  file name); with rotation, only the rotated files are compressed
+- ``log_max_bytes``: rotate the log when it reaches this size; by
+  default it is never rotated. Rotated logs have no index.
+- ``log_backups``: how many rotated files to keep; default 3
+"""
+
+import atexit
+import contextvars
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    WatchedFileHandler,
+)
+from typing import Dict, List, Optional
+
+from bag.log import setup_log
+
+# The step currently running; see Releaser._run_step() and process.py
+current_step: contextvars.ContextVar = contextvars.ContextVar(
+    "releaser_step", default=None
+)
+
+
+class _StepFilter(logging.Filter):
+    """Tags each record with the step running in its context."""
+
+    def filter(self, record):
+        record.step = current_step.get()
+        return True
+
+
+class IndexedFileHandler(logging.FileHandler):
+    """Writes the log, optionally gzipped, remembering where each step is.
+
+    Records below INFO are buffered instead of flushed one by one.
+    """
+
+    def __init__(self, path, mode="w", encoding="utf-8", compress=False):  # noqa
+        self.compress = compress
+        self.offset = 0  # in the uncompressed text, in bytes
+        self.ranges: Dict[str, List[List[int]]] = {}
+        super().__init__(path, mode=mode, encoding=encoding, delay=True)
+
+    def _open(self):
+        if self.compress:
+            return gzip.open(self.baseFilename, self.mode + "t", encoding=self.encoding)
+        return super()._open()
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            text = self.format(record) + self.terminator
+            self.stream.write(text)
+            end = self.offset + len(text.encode(self.encoding))
+            step = getattr(record, "step", None)
+            if step:
+                ranges = self.ranges.setdefault(step, [])
+                if ranges and ranges[-1][1] == self.offset:
+                    ranges[-1][1] = end  # contiguous with the previous record
+                else:
+                    ranges.append([self.offset, end])
+            self.offset = end
+            if record.levelno >= logging.INFO:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def write_index(self):
+        data = {
+            "log": os.path.basename(self.baseFilename),
+            "compressed": self.compress,
+            "steps": self.ranges,
+        }
+        with open(self.baseFilename + ".index.json", "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+
+    def close(self):
+        with_index = self.stream is not None
+        super().close()
+        if with_index:
+            self.write_index()
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class _BackgroundHandler(QueueHandler):
+    """Hands records to a QueueListener; stops it (flushing all) on close."""
+
+    def __init__(self, handlers):  # noqa
+        super().__init__(queue.SimpleQueue())
+        self.addFilter(_StepFilter())
+        self.targets = handlers
+        self.listener: Optional[QueueListener] = QueueListener(
+            self.queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.close)  # runs before logging's own shutdown
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()  # writes whatever is still in the queue
+            self.listener = None
+            for handler in self.targets:
+                handler.close()
+        super().close()
+
+
+def setup_release_log(config) -> logging.Logger:
+    """Configure the root logger to show messages on the screen.
+
+    Nothing is written to the log file until open_release_log(), so
+    commands other than "release" (such as "plan") leave the log of the
+    last release alone.
+    """
+    log = setup_log(disk_level=None, screen_level=config.get("verbosity", "info"))
+    log.setLevel(logging.DEBUG)
+    return log
+
+
+def open_release_log(log: logging.Logger, config) -> logging.Handler:
+    """Start writing ``log`` to the log file (truncating it), as described
+    above. Return the new handler.
+    """
+    path = config.get("log_file", "release.log.utf-8.tmp")
+    if not config.get("log_async", True):
+        handler: logging.Handler = WatchedFileHandler(path, mode="w", encoding="utf-8")
+        handler.setLevel(logging.DEBUG)
+        log.addHandler(handler)
+        return handler
+    compress = config.get("log_compress", False)
+    max_bytes = config.get("log_max_bytes")
+    if max_bytes:
+        # With maxBytes, RotatingFileHandler always appends, so truncate here
+        open(path, "w").close()
+        handler = RotatingFileHandler(
+            path,
+            encoding="utf-8",
+            maxBytes=max_bytes,
+            backupCount=config.get("log_backups", 3),
+        )
+        if compress:
+            handler.namer = lambda name: name + ".gz"
+            handler.rotator = _gzip_rotator
+    else:
+        handler = IndexedFileHandler(
+            path + ".gz" if compress else path, compress=compress
+        )
+    handler.setLevel(logging.DEBUG)
+    background = _BackgroundHandler([handler])
+    log.addHandler(background)
+    return background
+
+
+def step_log(path: str, step: str) -> str:
+    """Return the lines that ``step`` wrote to the indexed log at ``path``."""
+    with open(path + ".index.json", encoding="utf-8") as f:
+        index = json.load(f)
+    ranges = index["steps"].get(step)
+    if ranges is None:
+        raise KeyError(step)
+    opener = gzip.open if index["compressed"] else open
+    pieces = []
+    with opener(path, "rb") as stream:
+        for start, end in ranges:
+            stream.seek(start)
+            pieces.append(stream.read(end - start))
+    return b"".join(pieces).decode("utf-8")
@@ -0,0 +1,286 @@
+"""Releases many packages of one repository in a single run.
+
+A BatchReleaser takes the usual steps, plus a ``packages`` setting: a
+list of dicts, each with the ``name`` of a package, its ``path`` (the
+directory, relative to the top of the repository) and any settings
+that differ from the shared ones, such as ``version_file``::
+
+    BatchReleaser(
+        dict(
+            config,
+            packages=[
+                dict(name="foo", path="packages/foo", version_file="pyproject.toml"),
+                dict(name="bar", path="packages/bar", version_file="pyproject.toml"),
+            ],
+        ),
+        EnsureGitClean,
+        EnsureGitBranch,
+        SetVersionNumberInteractively,
+        CachedBuild,
+        UploadPackages,
+        GitCommitVersionNumber,
+        GitTag,
+        GitPush,
+    ).run()
+
+Steps that concern a single package (``per_package``: setting the
+version, building, verifying, uploading...) run once for each package
+-- concurrently, unless they ask the user something -- in the package
+directory, with paths such as ``version_file``, ``dist_dir`` and
+``changes_file`` taken as relative to it. Other steps -- the git checks,
+the commit, the push -- run once for all packages. Wrap any other step
+in ForEachPackage to run it for each package.
+
+Each package is tagged following ``tag_format``, by default
+"{name}-v{version}", and all tags are created by the one GitTag step
+and pushed together by GitPush. If a step fails for some packages,
+what it did for the others is rolled back at once; rewinding the
+release then rolls back the earlier steps of every package.
+
+Resuming with ``--resume`` is not available in batch mode.
+"""
+
+import copy
+import os
+from typing import Any, Dict, List
+
+from . import Releaser, ReleaseStep, StopRelease
+from .logs import current_step
+
+# Settings that hold a path, and their defaults
+PATH_SETTINGS = {
+    "version_file": None,
+    "dist_dir": "dist",
+    "changes_file": "CHANGES.rst",
+}
+
+
+def package_config(config: Dict[str, Any], package: Dict[str, Any]) -> Dict:
+    """Combine the shared ``config`` with the settings of one package."""
+    path = package["path"]
+    result = {k: v for k, v in config.items() if k != "packages"}
+    result.update(package)
+    result["github_repository"] = package.get("github_repository", package["name"])
+    result.setdefault("tag_format", "{name}-v{version}")
+    result["cwd"] = path
+    result["cache_dir"] = os.path.join(
+        config.get("cache_dir", ".releaser_cache"), "packages", package["name"]
+    )
+    for key, default in PATH_SETTINGS.items():
+        value = result.get(key, default)
+        if value is not None:
+            result[key] = os.path.join(path, value)
+    entries = []
+    for entry in result.get("version_files") or ():
+        if isinstance(entry, str):
+            entries.append(os.path.join(path, entry))
+        else:  # (path, keyword or locator)
+            entries.append((os.path.join(path, entry[0]),) + tuple(entry[1:]))
+    if entries:
+        result["version_files"] = entries
+    return result
+
+
+class PackageReleaser(Releaser):
+    """The state of one package in a batch: its config and versions.
+
+    It runs no steps of its own; the BatchReleaser binds the copies of
+    per-package steps to it.
+    """
+
+    def __init__(self, batch: "BatchReleaser", config):  # noqa
+        self.batch = batch
+        self.name = config["name"]
+        self.config = config
+        self.log = batch.log
+        self.tracer = batch.tracer
+        self.stopping = batch.stopping
+        self.created_tags = batch.created_tags
+        self.pushed_tags = batch.pushed_tags
+        self.instances: List[ReleaseStep] = []
+
+    @property
+    def git(self):
+        return self.batch.git
+
+
+class ForEachPackage(ReleaseStep):
+    """Runs a copy of a step for each package of a BatchReleaser."""
+
+    def __init__(self, step):  # noqa
+        self.step = step() if isinstance(step, type) else step
+        for attr in (
+            "ERROR_CODE",
+            "needs",
+            "provides",
+            "irreversible",
+            "background",
+            "interactive",
+            "timeout",
+        ):
+            setattr(self, attr, getattr(self.step, attr))
+        self.parallel_safe = self.step.parallel_safe
+        self.stop_on_failure = self.step.stop_on_failure
+        if hasattr(self.step, "no_rollback"):
+            self.no_rollback = self.step.no_rollback
+        self.done: List = []  # (package, copy of the step) that succeeded
+
+    def __str__(self):
+        return "{0} (each package)".format(self.step)
+
+    def describe(self):
+        return "For each package: " + self.step.describe()
+
+    def copies(self):
+        """Bind a copy of the step to each package; return the pairs."""
+        pairs = [
+            (package, package._bind(copy.copy(self.step)))
+            for package in self.releaser.packages
+        ]
+        for _, step in pairs:
+            step.deadline = self.deadline
+            step.stop = self.stop
+        return pairs
+
+    def _run_one(self, package, step):
+        token = current_step.set("{0} [{1}]".format(step, package.name))
+        try:
+            with self.releaser.tracer.span(
+                "{0} [{1}]".format(step, package.name), "package"
+            ) as args:
+                try:
+                    step()
+                except Exception as e:
+                    args["error"] = str(e)
+                    return e
+                finally:
+                    args["success"] = step.success
+            return None
+        finally:
+            current_step.reset(token)
+
+    def __call__(self):  # noqa
+        pairs = self.copies()
+        if self.step.interactive or not self.config.get("parallel_steps", True):
+            errors = []
+            for package, step in pairs:
+                self.log.info("Package {0}:".format(package.name))
+                errors.append(self._run_one(package, step))
+                if errors[-1] is not None:
+                    break
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(
+                max_workers=self.config.get("max_workers")
+            ) as executor:
+                errors = list(executor.map(lambda p: self._run_one(*p), pairs))
+        self.done = [
+            pair
+            for pair, error in zip(pairs, errors)
+            if error is None and pair[1].success
+        ]
+        failed = [(package, e) for (package, _), e in zip(pairs, errors) if e]
+        if failed:
+            self.rollback()  # the packages for which the step succeeded
+            for _, error in failed:
+                if not isinstance(error, StopRelease):
+                    raise error
+            raise StopRelease(
+                "\n".join("{0}: {1}".format(p.name, e) for p, e in failed)
+            )
+        self.success = all(step.success for _, step in pairs)
+
+    def rollback(self):
+        deadline = self.releaser._deadline_for(self, rollback=True)
+        for package, step in reversed(self.done):
+            step.deadline = deadline
+            step.stop = None
+            if not hasattr(step, "rollback") or hasattr(step, "no_rollback"):
+                continue
+            self.log.critical("Rolling back {0} for {1}".format(step, package.name))
+            try:
+                step.rollback()
+            except Exception as e:
+                self.log.error(
+                    "Could not roll back {0} for {1}:\n{2}".format(
+                        step, package.name, e
+                    )
+                )
+        self.done = []
+
+
+class BatchReleaser(Releaser):
+    """Releases all the packages in the ``packages`` setting at once."""
+
+    def __init__(self, config, *steps):  # noqa
+        super().__init__(config, *steps)
+        if not config.get("packages"):
+            raise ValueError('The "packages" setting is required in a batch.')
+        self.packages = [
+            PackageReleaser(self, package_config(config, package))
+            for package in config["packages"]
+        ]
+        self.instances = [
+            self._bind(ForEachPackage(step)) if step.per_package else step
+            for step in self.instances
+        ]
+
+    def tag_name(self, version: str) -> str:
+        return self.config.get("tag_format", "{name}-v{version}").format(
+            version=version, name="<name>"
+        )
+
+    def update_changelog(self):
+        """Update the changes file of each package, outside a release."""
+        from .steps import UpdateChangelog
+
+        self._bind(ForEachPackage(UpdateChangelog()))()
+
+    def _register(self, step):
+        if (
+            isinstance(step, ForEachPackage)
+            and not hasattr(step.step, "rollback")
+            and not hasattr(step, "no_rollback")
+        ):
+            return  # nothing to roll back
+        super()._register(step)
+
+    def _open_journal(self, resume):
+        if resume:
+            self.log.critical("Resuming is not available in batch mode.")
+            from sys import exit
+
+            exit(1)
+        return 0
+
+    def _versions(self, attr):
+        pairs = [
+            (p.name, getattr(p, attr))
+            for p in self.packages
+            if p.the_version is not None or attr == "old_version"
+        ]
+        if all(v is None for _, v in pairs):
+            return None
+        return ", ".join("{0} {1}".format(name, v) for name, v in pairs)
+
+    @property
+    def old_version(self):
+        return self._versions("old_version")
+
+    @property
+    def the_version(self):  # e.g. "foo 1.2, bar 0.4", for the commit message
+        return self._versions("the_version")
+
+    @property
+    def future_version(self):
+        return self._versions("future_version")
+
+    def new_tags(self):
+        tags = []
+        for package in self.packages:
+            tags.extend(
+                (name, "{0} {1}".format(package.name, message))
+                for name, message in package.new_tags()
+            )
+        return tags
@@ -0,0 +1,393 @@
+"""Runs commands, streaming their output to the log as it arrives.
+
+Both pipes of the child process are drained concurrently, a chunk at a
+time, so a command that writes a lot can never deadlock on a full pipe buffer.
+Only the last lines of each stream are kept in memory.
+
+A command may be given a ``timeout``. It then runs in a session of its
+own, and when the time is up the whole session -- the command and
+every child it started -- receives SIGTERM and, if still running after
+a grace period, SIGKILL. Such a command cannot prompt on the terminal
+(e.g. for a password), which is what one wants in an unattended release.
+A ``stop`` event (a threading.Event) ends the command the same way as
+soon as it is set; background steps use it when the release fails.
+"""
+
+import contextvars
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from sys import platform
+from typing import List, Optional, Sequence, Tuple
+
+MAX_LINE = 65536  # longer lines are split into chunks of this many bytes
+CHUNK = 65536  # bytes read from a pipe at a time
+STOP_POLL = 0.1  # seconds between looks at a stop event
+
+
+class CommandResult:
+    """Everything we remember about a finished command."""
+
+    def __init__(self, command, return_code, stdout, stderr, **stats):  # noqa
+        self.command = command
+        self.return_code = return_code
+        self.stdout = stdout  # the tail of standard output, stripped
+        self.stderr = stderr  # the tail of standard error, stripped
+        self.started = stats.get("started", 0.0)  # time.perf_counter()
+        self.duration = stats.get("duration", 0.0)  # wall time in seconds
+        self.cpu_time = stats.get("cpu_time")  # user + system; None if unknown
+        self.stdout_bytes = stats.get("stdout_bytes", 0)
+        self.stderr_bytes = stats.get("stderr_bytes", 0)
+        self.truncated = stats.get("truncated", False)  # lines were dropped
+        self.timed_out = stats.get("timed_out", False)  # killed at the timeout
+        self.stopped = stats.get("stopped", False)  # killed by the stop event
+
+    @property
+    def text(self):
+        """Output in the format historically returned by ``_execute()``."""
+        return self.stdout + self.stderr
+
+    @property
+    def output_bytes(self):
+        return self.stdout_bytes + self.stderr_bytes
+
+    def __repr__(self):
+        return "<CommandResult {0!r} code={1} {2:.3f}s {3} bytes>".format(
+            self.command, self.return_code, self.duration, self.output_bytes
+        )
+
+
+class StreamingProcess:
+    """A child process whose output is logged line by line as it arrives.
+
+    Standard output goes to ``log.debug()`` and standard error to
+    ``log.error()``. Each line may be preceded by ``prefix``, which helps
+    when several processes share the log. At most ``tail_lines`` lines
+    of each stream are kept in memory for the CommandResult. With
+    ``new_session``, terminate() and kill() also stop the children of
+    the command.
+    """
+
+    timed_out = False
+    stopped = False
+
+    def __init__(
+        self,
+        command,
+        log,
+        input="",
+        shell=True,
+        cwd=None,
+        tail_lines=500,
+        prefix="",
+        new_session=False,
+    ):  # noqa
+        self.command = command
+        self.log = log
+        self.prefix = prefix
+        self.tails = {
+            "stdout": deque(maxlen=tail_lines),
+            "stderr": deque(maxlen=tail_lines),
+        }
+        self.counts = {"stdout": 0, "stderr": 0}  # bytes
+        self.lines = {"stdout": 0, "stderr": 0}
+        self.started = time.perf_counter()
+        # In a session of its own, the command and all its children
+        # (the shell runs the command in a child) can be stopped together.
+        self.new_session = new_session and hasattr(os, "killpg")
+        self.process = subprocess.Popen(
+            command,
+            shell=shell,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=not platform.startswith("win"),
+            start_new_session=self.new_session,
+        )
+        self.threads = [
+            self._thread(self._pump, "stdout", self.process.stdout, log.debug),
+            self._thread(self._pump, "stderr", self.process.stderr, log.error),
+            self._thread(self._feed, input),
+        ]
+
+    @staticmethod
+    def _thread(target, *args):
+        # Run in a copy of the caller's context, so the log records of the
+        # threads are still attributed to the step that started them.
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(target, *args), daemon=True)
+        thread.start()
+        return thread
+
+    def _feed(self, input):
+        stream = self.process.stdin
+        if isinstance(input, str):
+            input = input.encode("utf-8")
+        try:
+            if input:
+                stream.write(input)
+        except (BrokenPipeError, OSError):
+            pass  # The child exited without reading its input
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _pump(self, name, stream, emit):
+        """Read whatever output is available and log its lines together.
+
+        One log record per chunk of output, rather than per line, keeps
+        the cost of logging low when a command prints a lot.
+        """
+        pending = b""
+        for chunk in iter(lambda: stream.read1(CHUNK), b""):
+            self.counts[name] += len(chunk)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            if any(len(line) > MAX_LINE for line in lines):
+                lines = [
+                    line[i : i + MAX_LINE]
+                    for line in lines
+                    for i in range(0, max(len(line), 1), MAX_LINE)
+                ]
+            while len(pending) > MAX_LINE:
+                lines.append(pending[:MAX_LINE])
+                pending = pending[MAX_LINE:]
+            self._take(name, lines, emit)
+        if pending:
+            self._take(name, [pending], emit)
+        stream.close()
+
+    def _take(self, name, raw_lines, emit):
+        tail = self.tails[name]
+        shown = []
+        for raw in raw_lines:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            tail.append(line)
+            if line.strip():
+                shown.append(self.prefix + line)
+        self.lines[name] += len(raw_lines)
+        if shown:
+            emit("\n".join(shown))
+
+    def terminate(self):
+        """Ask the process to stop, if it is still running."""
+        if self.process.poll() is not None:
+            return
+        if self.new_session:
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        else:
+            self.process.terminate()
+
+    def kill(self):
+        """Kill the process (and, with ``new_session``, its children)."""
+        if self.new_session:
+            try:  # even if the command is gone, its children may remain
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        elif self.process.poll() is None:
+            self.process.kill()
+
+    def _reap(self, deadline=None, stop=None):
+        """Wait for the process until ``deadline`` (a time.perf_counter()).
+
+        Return (return_code, cpu_time), or None if the deadline passed or
+        the ``stop`` event was set first.
+        """
+        if stop is not None:
+            while True:  # wait in slices, looking at the event in between
+                limit = time.perf_counter() + STOP_POLL
+                if deadline is not None and deadline < limit:
+                    return self._reap(deadline)
+                if stop.is_set():
+                    return None
+                reaped = self._reap(limit)
+                if reaped is not None:
+                    return reaped
+        if hasattr(os, "wait4"):  # POSIX: also get the resource usage
+            flags = 0 if deadline is None else os.WNOHANG
+            delay = 0.001
+            while True:
+                try:
+                    pid, status, usage = os.wait4(self.process.pid, flags)
+                except ChildProcessError:  # Someone else reaped it already
+                    break
+                if pid:
+                    if os.WIFSIGNALED(status):
+                        code = -os.WTERMSIG(status)
+                    else:
+                        code = os.WEXITSTATUS(status)
+                    self.process.returncode = code
+                    return code, usage.ru_utime + usage.ru_stime
+                left = deadline - time.perf_counter()
+                if left <= 0:
+                    return None
+                time.sleep(min(delay, left))
+                delay = min(delay * 2, 0.05)
+        try:
+            if deadline is None:
+                return self.process.wait(), None
+            return self.process.wait(max(deadline - time.perf_counter(), 0)), None
+        except subprocess.TimeoutExpired:
+            return None
+
+    def stop(self, grace=5.0):
+        """Terminate the process; kill it if still running after ``grace``.
+
+        Return (return_code, cpu_time) like _reap().
+        """
+        self.terminate()
+        reaped = self._reap(time.perf_counter() + grace)
+        if reaped is None:
+            self.log.error("{0}Still running; killing it.".format(self.prefix))
+        self.kill()
+        return reaped or self._reap()
+
+    def wait(self, timeout=None, grace=5.0, stop=None) -> CommandResult:
+        """Wait for the process to finish, then return a CommandResult.
+
+        If it runs for more than ``timeout`` seconds, or the ``stop``
+        event is set, terminate it; if it is still running ``grace``
+        seconds later, kill it.
+        """
+        deadline = None if timeout is None else self.started + timeout
+        try:
+            reaped = self._reap(deadline, stop)
+            if reaped is None:
+                if stop is not None and stop.is_set():
+                    self.stopped = True
+                    self.log.error("{0}Stopping: {1}".format(self.prefix, self.command))
+                else:
+                    self.timed_out = True
+                    self.log.error(
+                        "{0}Timed out after {1:.1f}s: {2}".format(
+                            self.prefix, timeout, self.command
+                        )
+                    )
+                reaped = self.stop(grace)
+        except BaseException:  # e.g. KeyboardInterrupt: leave nothing behind
+            self.terminate()
+            raise
+        return_code, cpu_time = reaped
+        for thread in self.threads:
+            # A child that escaped the session may keep the pipes open
+            thread.join(grace if self.timed_out or self.stopped else None)
+        tails = self.tails
+        return CommandResult(
+            self.command,
+            return_code,
+            "\n".join(tails["stdout"]).strip(),
+            "\n".join(tails["stderr"]).strip(),
+            started=self.started,
+            duration=time.perf_counter() - self.started,
+            cpu_time=cpu_time,
+            stdout_bytes=self.counts["stdout"],
+            stderr_bytes=self.counts["stderr"],
+            truncated=any(self.lines[k] > len(tails[k]) for k in tails),
+            timed_out=self.timed_out,
+            stopped=self.stopped,
+        )
+
+
+def run_command(
+    command, log, timeout=None, grace=5.0, stop=None, **kw
+) -> CommandResult:
+    """Run ``command`` to completion; see StreamingProcess for arguments.
+
+    With a ``timeout`` (in seconds) or a ``stop`` event, the command runs
+    in a session of its own and is stopped, with all its children, when
+    the time is up or the event is set.
+    """
+    if timeout is not None or stop is not None:
+        kw["new_session"] = True
+    return StreamingProcess(command, log, **kw).wait(timeout, grace, stop)
+
+
+def run_concurrently(
+    commands: Sequence[Tuple[str, str]],
+    log,
+    max_workers: Optional[int] = None,
+    fail_fast: bool = True,
+    timeout: Optional[float] = None,
+    grace: float = 5.0,
+    **kw
+) -> List[Optional[CommandResult]]:
+    """Run several commands, given as (prefix, command), at the same time.
+
+    At most ``max_workers`` (by default, the number of CPUs) run at once;
+    the output of each is logged with its prefix. With ``fail_fast``, the
+    first command that fails stops the running ones (their results are
+    marked ``stopped``) and the pending ones never start. If all of them
+    have not finished after ``timeout`` seconds, the running ones are
+    stopped (and marked ``timed_out``) and the pending ones never start.
+    Stopping means SIGTERM, then SIGKILL if still running ``grace``
+    seconds later. Return a CommandResult for each command, or None for
+    those that did not start.
+    """
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    kill_at = None  # when the processes told to stop get SIGKILL
+    limit = max(max_workers or os.cpu_count() or 1, 1)
+    pending = deque(enumerate(commands))
+    running = {}
+    results: List[Optional[CommandResult]] = [None] * len(commands)
+    finished: queue.SimpleQueue = queue.SimpleQueue()
+
+    def start():
+        index, (prefix, command) = pending.popleft()
+        process = StreamingProcess(command, log, prefix=prefix, new_session=True, **kw)
+        running[index] = process
+        StreamingProcess._thread(lambda: finished.put((index, process.wait())))
+
+    def stop_all(reason):
+        nonlocal kill_at
+        pending.clear()
+        for process in running.values():
+            if process.process.poll() is None:
+                setattr(process, reason, True)
+            process.terminate()
+        kill_at = time.perf_counter() + grace
+
+    try:
+        while pending and len(running) < limit:
+            start()
+        while running:
+            limits = [t for t in (deadline, kill_at) if t is not None]
+            try:
+                if not limits:
+                    index, result = finished.get()
+                else:
+                    index, result = finished.get(
+                        timeout=max(min(limits) - time.perf_counter(), 0)
+                    )
+            except queue.Empty:
+                if kill_at is not None and kill_at <= time.perf_counter():
+                    for process in running.values():  # the grace period is over
+                        process.kill()
+                    kill_at = deadline = None
+                elif deadline is not None and deadline <= time.perf_counter():
+                    log.error("Timed out after {0:.1f}s".format(timeout))
+                    stop_all("timed_out")
+                    deadline = None
+                continue
+            del running[index]
+            results[index] = result
+            if fail_fast and result.return_code != 0 and kill_at is None:
+                stop_all("stopped")
+                deadline = None  # they are being stopped already
+            while pending and len(running) < limit:
+                start()
+    except BaseException:  # e.g. KeyboardInterrupt: leave nothing behind
+        for process in running.values():
+            process.terminate()
+        raise
+    return results
@@ -2,9 +2,14 @@
 
 import codecs
 import re
+from functools import lru_cache
+from typing import Match, Optional, Pattern
+
 from bag.text import content_of
 from grimace import RE  # https://github.com/benlast/grimace/wiki/Documentation
 
+from .version import InvalidVersion, parse_version
+
 
 VERSION_NUMBER = str(
     RE().one_or_more.digits.dot.one_or_more.digits.then.any_number_of.any_of(
@@ -17,54 +22,105 @@ VERSION_VALIDATOR_RE = re.compile(VERSION_VALIDATOR)
 
 
 def error_in_version(val, allow_dev=True):
-    """Validate a version number. Returns None if valid."""
-    if not VERSION_VALIDATOR_RE.match(val):
-        return '"{0}" is not a valid version number.'.format(val)
-    if not allow_dev:
-        for x in ("svn", "dev", "("):
-            if x in val:
-                return '"{0}" is a development version number.'.format(val)
+    """Validate a version number. Returns None if valid, else the problem.
+
+    The number must be valid PEP 440 with at least MAJOR.MINOR and no
+    local label, and it must match VERSION_NUMBER so it can be written
+    to the version file.
+    """
+    try:
+        version = parse_version(val)
+    except InvalidVersion as e:
+        return str(e)
+    if not allow_dev and version.is_dev:
+        return '"{0}" is a development version number.'.format(val)
+    if version.local:
+        return (
+            '"{0}" has a local version label, which package indexes '
+            "reject.".format(val)
+        )
+    if len(version.release) < 2:
+        return '"{0}" is too short; use at least MAJOR.MINOR, e.g. "{0}.0".'.format(
+            val
+        )
+    if not VERSION_VALIDATOR_RE.match(val):  # e.g. an epoch such as "1!2.0"
+        return '"{0}" cannot be written to the version file.'.format(val)
+    return None
 
 
 SOME_QUOTE = r'["\']'  # single or double quote
 QUOTED_VERSION = SOME_QUOTE + "(" + VERSION_NUMBER + ")" + SOME_QUOTE
 
 
+# A name such as "python_version" must not be mistaken for "version":
+NOT_AFTER_A_WORD_CHARACTER = r"(?<!\w)"
+
+
+@lru_cache(maxsize=None)
+def version_line_re(keyword: str = "version") -> Pattern:
+    """Return the compiled regex that matches a version assignment.
+
+    The version number itself is in group 1. Compiled patterns are cached
+    per ``keyword``.
+    """
+    return re.compile(
+        NOT_AFTER_A_WORD_CHARACTER
+        + str(
+            RE()
+            .between(0, 2)
+            .underscore.then(keyword)
+            .then.between(0, 2)
+            .underscore.then.zero_or_more.whitespace.then("=")
+            .then.zero_or_more.whitespace.then.regex(QUOTED_VERSION)
+            .then.zero_or_more.whitespace
+        )
+    )
+
+
+def find_version(
+    text: str, keyword: str = "version", pos: int = 0, endpos: Optional[int] = None
+) -> Optional[Match]:
+    """Return the match of the first version assignment in ``text``.
+
+    Like in ``Pattern.search()``, ``pos`` and ``endpos`` can limit the
+    search to a slice of ``text``.
+
+    A regex search starting at every position of a large file is slow, so
+    we jump from one occurrence of ``keyword`` to the next with the fast
+    ``str.find()`` and only try to match the regex there.
+    """
+    regex = version_line_re(keyword)
+    if endpos is None:
+        endpos = len(text)
+    floor = pos
+    pos = text.find(keyword, pos, endpos)
+    while pos >= 0:
+        start = pos
+        while start > floor and pos - start < 2 and text[start - 1] == "_":
+            start -= 1  # include up to 2 leading underscores
+        match = regex.match(text, start, endpos)
+        if match:
+            return match
+        pos = text.find(keyword, pos + 1, endpos)
+    return None
+
+
 def version_in_python_source(
     text: str, replace: str = "", keyword: str = "version"
 ) -> str:
     """Given a string, find or replace the version number in it.
 
-    If ``replace`` is None, return the version number found in ``text``.
+    If ``replace`` is empty, return the version number found in ``text``.
     Else, return an updated ``text`` (with the version number specified in
-    the ``replace`` argument).
+    the ``replace`` argument). Only the first assignment is considered; it
+    is found in a single pass and replaced using the match offsets.
     """
-    PYTHON_VERSION_LINE = str(
-        RE()
-        .zero_or_more.whitespace.between(0, 2)
-        .underscore.then(keyword)
-        .then.between(0, 2)
-        .underscore.then.zero_or_more.whitespace.then("=")
-        .then.zero_or_more.whitespace.then.regex(QUOTED_VERSION)
-        .then.zero_or_more.whitespace
-    )
-    PYTHON_VERSION_LINE_RE = re.compile(PYTHON_VERSION_LINE)
-    match = PYTHON_VERSION_LINE_RE.search(text)
+    match = find_version(text, keyword)
     assert match, "Could not find version number in Python source code."
-    version = match.groups()[0]
-    if replace:
-        alist = []
-        found = False
-        for line in text.splitlines(True):  # True keeps line endings
-            match = PYTHON_VERSION_LINE_RE.match(line)
-            if not found and match:
-                found = True
-                line = line.replace(version, replace)
-            alist.append(line)
-        assert found, "Could not replace version number in Python source code."
-        return "".join(alist)
-    else:
-        return version
+    if not replace:
+        return match.group(1)
+    start, end = match.span(1)
+    return text[:start] + replace + text[end:]
 
 
 def version_in_python_source_file(
@@ -82,12 +138,12 @@ def version_in_python_source_file(
         content_of(path, encoding=encoding), replace=replace, keyword=keyword
     )
     if replace:
+        # Test the change in memory, before writing the file
+        assert replace == version_in_python_source(
+            ret, keyword=keyword
+        ), "Could not replace version number in Python source code."
         with codecs.open(path, "w", encoding=encoding) as stream:
             stream.write(ret)
-        # Test the change we just did by reading the file we just wrote
-        assert replace == version_in_python_source_file(
-            path, keyword=keyword, encoding=encoding
-        )
         return replace
     else:
         return ret
@@ -0,0 +1,41 @@
+"""Groups release steps into batches that may run at the same time.
+
+A step opts into concurrency by setting ``parallel_safe = True``.
+It may also declare, in ``needs`` and ``provides``, the names of the
+resources it consumes and produces -- for instance ``"the_version"`` or
+``"dist"`` (the built artifacts). Steps that are not parallel-safe
+(interactive steps, shell commands, anything that changes the repository)
+are barriers: each one runs alone, in the order given by the user.
+"""
+
+from typing import List, Sequence
+
+
+def plan_batches(steps: Sequence, parallel: bool = True) -> List[list]:
+    """Split ``steps`` into consecutive batches, keeping their order.
+
+    All steps in a batch may run concurrently: they are parallel-safe
+    and none of them needs (or also provides) something that another
+    member of the batch provides. Concatenating the batches gives back
+    the original sequence of steps.
+    """
+    batches: List[list] = []
+    current: list = []
+    provided: set = set()
+    for step in steps:
+        if not (parallel and step.parallel_safe):
+            if current:
+                batches.append(current)
+            batches.append([step])
+            current, provided = [], set()
+            continue
+        needs = set(step.needs)
+        provides = set(step.provides)
+        if current and (needs & provided or provides & provided):
+            batches.append(current)
+            current, provided = [], set()
+        current.append(step)
+        provided |= provides
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,247 @@
+"""Reads and writes the version number in all the files that contain it.
+
+Configure the files in the ``version_files`` setting, for instance::
+
+    version_files=[
+        "pyproject.toml",
+        ("mypackage/__init__.py", "version"),  # finds __version__ = "..."
+        "frontend/package.json",
+        "docs/conf.py",  # sets both ``release`` and ``version``
+    ],
+
+Each entry is a path or a tuple (path, keyword) or (path, locator).
+Without a keyword, the format is inferred from the file name.
+If ``version_files`` is absent, ``version_file`` and ``version_keyword``
+are used. The first file is the one the current version is read from.
+
+Every file is read once. All new contents are first written to
+temporary files, which are then renamed over the originals; if any of
+that fails, the files already replaced are restored.
+"""
+
+import os
+import re
+import stat
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from . import StopRelease
+from .regex import QUOTED_VERSION, find_version
+
+
+class VersionLocator:
+    """Finds the version number in the text of one kind of file.
+
+    Subclasses implement ``_matches()``, returning the regex matches whose
+    group 1 must be replaced, and may override ``_value()``.
+    """
+
+    def _matches(self, text: str) -> list:
+        raise NotImplementedError()
+
+    def _value(self, match, version: str) -> str:
+        """Return the text to put in place of group 1 of ``match``."""
+        return version
+
+    def find(self, text: str) -> str:
+        matches = self._matches(text)
+        if not matches:
+            raise StopRelease("Could not find the version number.")
+        return matches[0].group(1)
+
+    def replace(self, text: str, version: str) -> str:
+        return self._splice(text, self._matches(text), version)
+
+    def _splice(self, text: str, matches: list, version: str) -> str:
+        """Replace group 1 of each match; ``matches`` must be in order."""
+        if not matches:
+            raise StopRelease("Could not find the version number.")
+        pieces, pos = [], 0
+        for match in matches:
+            start, end = match.span(1)
+            pieces.extend((text[pos:start], self._value(match, version)))
+            pos = end
+        pieces.append(text[pos:])
+        return "".join(pieces)
+
+    def __repr__(self):
+        return type(self).__name__
+
+
+class PythonLocator(VersionLocator):
+    """An assignment such as ``__version__ = "1.0"``; also works for TOML."""
+
+    def __init__(self, keyword: str = "version"):  # noqa
+        self.keyword = keyword
+
+    def _matches(self, text):
+        match = find_version(text, self.keyword)
+        return [match] if match else []
+
+
+class TomlLocator(VersionLocator):
+    """The ``version`` key in the [project] or [tool.poetry] table."""
+
+    TABLE_RE = re.compile(r"^\[(?:project|tool\.poetry)\][ \t\r]*$", re.MULTILINE)
+
+    def _matches(self, text):
+        for table in self.TABLE_RE.finditer(text):
+            end = text.find("\n[", table.end())
+            match = find_version(
+                text, "version", table.end(), len(text) if end < 0 else end
+            )
+            if match:
+                return [match]
+        return PythonLocator()._matches(text)
+
+
+class JsonLocator(VersionLocator):
+    """The first ``"version": "..."`` member, as in package.json."""
+
+    VERSION_RE = re.compile(r'"version"\s*:\s*"([^"]+)"')
+
+    def _matches(self, text):
+        match = self.VERSION_RE.search(text)
+        return [match] if match else []
+
+
+class SphinxConfLocator(VersionLocator):
+    """``release`` (the full version) and ``version`` (X.Y) in conf.py."""
+
+    ASSIGNMENT_RE = re.compile(
+        r"^(?:release|version)\s*=\s*" + QUOTED_VERSION, re.MULTILINE
+    )
+
+    def _matches(self, text):
+        found = {}
+        for match in self.ASSIGNMENT_RE.finditer(text):
+            found.setdefault(match.group(0).split("=")[0].strip(), match)
+        # find() must see "release" first, since it holds the full version
+        return [found[k] for k in ("release", "version") if k in found]
+
+    def replace(self, text, version):
+        matches = sorted(self._matches(text), key=lambda m: m.start())
+        return self._splice(text, matches, version)
+
+    def _value(self, match, version):
+        if match.group(0).startswith("version"):
+            return ".".join(version.split(".")[:2])
+        return version
+
+
+def locator_for(path: str, keyword: Optional[str] = None) -> VersionLocator:
+    """Return the appropriate VersionLocator for the file at ``path``."""
+    name = os.path.basename(path)
+    if keyword and keyword != "version":
+        return PythonLocator(keyword)
+    if name == "pyproject.toml":
+        return TomlLocator()
+    if name.endswith(".json"):
+        return JsonLocator()
+    if name == "conf.py":
+        return SphinxConfLocator()
+    return PythonLocator()
+
+
+class VersionStamper:
+    """Reads the version from, and writes it to, a group of files."""
+
+    def __init__(
+        self, files: Sequence[Tuple[str, VersionLocator]], encoding="utf-8"
+    ):  # noqa
+        assert files, "At least one version file is necessary."
+        self.files = list(files)
+        self.encoding = encoding
+
+    @classmethod
+    def from_config(cls, config):
+        entries = config.get("version_files") or [
+            (config["version_file"], config.get("version_keyword"))
+        ]
+        files = []
+        for entry in entries:
+            path, extra = (entry, None) if isinstance(entry, str) else entry
+            if isinstance(extra, VersionLocator):
+                files.append((path, extra))
+            else:
+                files.append((path, locator_for(path, extra)))
+        return cls(files, encoding=config.get("encoding", "utf-8"))
+
+    @property
+    def paths(self) -> List[str]:
+        return [path for path, _ in self.files]
+
+    def _read(self, path: str) -> str:
+        with open(path, "rb") as stream:  # bytes, to preserve line endings
+            return stream.read().decode(self.encoding)
+
+    def _locate(self, path, locator, method, *args):
+        try:
+            return getattr(locator, method)(*args)
+        except StopRelease as e:
+            raise StopRelease("{0}: {1}".format(path, e)) from e
+
+    def read(self) -> Dict[str, str]:
+        """Return a dict mapping each path to the version found in it."""
+        return {
+            path: self._locate(path, locator, "find", self._read(path))
+            for path, locator in self.files
+        }
+
+    def current(self) -> str:
+        """Return the version found in the first file."""
+        path, locator = self.files[0]
+        return self._locate(path, locator, "find", self._read(path))
+
+    def stamp(self, version: str) -> List[str]:
+        """Write ``version`` onto all the files, atomically as a group.
+
+        Return the list of paths that were changed.
+        """
+        changes = []
+        for path, locator in self.files:
+            old = self._read(path)
+            new = self._locate(path, locator, "replace", old, version)
+            # Verify in memory before writing anything
+            if self._locate(path, locator, "find", new) != version:
+                raise StopRelease("{0}: could not write the version.".format(path))
+            if new != old:
+                changes.append((path, old, new))
+        self._commit(changes)
+        return [path for path, _, _ in changes]
+
+    def _commit(self, changes):
+        temps = []
+        try:  # Phase 1: write every new content into a temporary file
+            for path, _, new in changes:
+                temps.append(self._write_temp(path, new))
+        except BaseException:
+            for temp in temps:
+                os.unlink(temp)
+            raise
+        done = []
+        try:  # Phase 2: rename them all over the originals
+            for (path, old, _), temp in zip(changes, temps):
+                os.replace(temp, path)
+                done.append((path, old))
+        except BaseException:
+            for temp in temps[len(done) :]:
+                if os.path.exists(temp):
+                    os.unlink(temp)
+            for path, old in done:  # restore the whole group
+                os.replace(self._write_temp(path, old), path)
+            raise
+
+    def _write_temp(self, path: str, text: str) -> str:
+        """Write ``text`` next to ``path``, with the same permissions."""
+        fd, temp = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)), prefix=".tmp-version-"
+        )
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                stream.write(text.encode(self.encoding))
+            os.chmod(temp, stat.S_IMODE(os.stat(path).st_mode))
+        except BaseException:
+            os.unlink(temp)
+            raise
+        return temp
@@ -1,23 +1,32 @@
 """The most common steps in the release of a Python package."""
 
-import requests
+import os
 
-from bag.check_rst import check_rst_file
 from bag.console import bool_input
 from bag.pathlib_complement import Path
 
-from . import ReleaseStep, StopRelease, CommandStep
-from .regex import version_in_python_source_file
+from . import ReleaseStep, StepTimeout, StopRelease, CommandStep
+from .cache import JsonCache, cache_dir, file_digest
+from .stamping import VersionStamper
 
 __all__ = (
     "Shell",
+    "ParallelShell",
+    "CachedBuild",
+    "WorktreeBuild",
     "CheckRstFiles",
+    "CompileAndVerifyTranslations",
     "InteractivelyApprovePackage",
+    "VerifyPackages",
+    "CheckCI",
     "CheckTravis",
     "InteractivelyEnsureChangesDocumented",
+    "UpdateChangelog",
     "SetVersionNumberInteractively",
+    "CheckVersionConflicts",
     "TwineUploadSource",
     "TwineUploadWheel",
+    "UploadPackages",
     "SetFutureVersion",
     "ErrorStep",
     "Warn",
@@ -29,9 +38,13 @@ class Shell(ReleaseStep):
 
     ERROR_CODE = 2
 
-    def __init__(self, command, stop_on_failure=True):  # noqa
+    def __init__(
+        self, command, stop_on_failure=True, irreversible=False, timeout=None
+    ):  # noqa
         self.COMMAND = command
         self.stop_on_failure = stop_on_failure
+        self.irreversible = irreversible  # e.g. for "poetry publish"
+        self.timeout = timeout  # seconds
         self.no_rollback = "Unable to roll back the step {0}".format(self)
 
     def __call__(self):  # noqa
@@ -40,36 +53,460 @@ class Shell(ReleaseStep):
     def __str__(self):
         return "[" + self.COMMAND + "]"
 
+    def describe(self):
+        return "$ " + self.COMMAND
+
+
+class ParallelShell(ReleaseStep):
+    """Run several shell commands at the same time, e.g. tests and linters.
+
+    Each command is a string or a (name, command) pair; the name prefixes
+    its lines in the log (by default, the first word of the command).
+    At most ``max_workers`` commands run at once -- by default the
+    ``shell_workers`` setting, or the number of CPUs.
+
+    With ``shards=N``, a command containing "{shard}" runs N times, with
+    "{shard}" replaced by 1, 2... N and "{shards}" by N, as in
+    ``"pytest --splits {shards} --group {shard}"``.
+
+    Unless ``fail_fast=False``, the first command to fail stops the others
+    (SIGTERM, then SIGKILL after the ``kill_grace`` setting) and the
+    commands not started yet never run.
+    """
+
+    ERROR_CODE = 14
+
+    def __init__(
+        self,
+        *commands,
+        shards=1,
+        max_workers=None,
+        fail_fast=True,
+        stop_on_failure=True,
+        irreversible=False,
+        timeout=None,
+    ):  # noqa
+        self.commands = [
+            c if isinstance(c, tuple) else (c.split(None, 1)[0], c) for c in commands
+        ]
+        self.shards = shards
+        self.max_workers = max_workers
+        self.fail_fast = fail_fast
+        self.stop_on_failure = stop_on_failure
+        self.irreversible = irreversible
+        self.timeout = timeout  # seconds, for all the commands together
+        self.no_rollback = "Unable to roll back the step {0}".format(self)
+
+    def jobs(self):
+        """Return the list of (name, command) to run, shards expanded."""
+        jobs = []
+        for name, command in self.commands:
+            if self.shards > 1 and "{shard}" in command:
+                jobs.extend(
+                    (
+                        "{0}#{1}".format(name, n),
+                        command.replace("{shards}", str(self.shards)).replace(
+                            "{shard}", str(n)
+                        ),
+                    )
+                    for n in range(1, self.shards + 1)
+                )
+            else:
+                jobs.append((name, command))
+        seen = {}
+        for i, (name, command) in enumerate(jobs):  # make the names unique
+            seen[name] = seen.get(name, 0) + 1
+            if seen[name] > 1:
+                jobs[i] = ("{0}({1})".format(name, seen[name]), command)
+        return jobs
+
+    def _workers(self):
+        return self.max_workers or self.config.get("shell_workers") or os.cpu_count()
+
+    def __call__(self):  # noqa
+        from .process import run_concurrently
+
+        jobs = self.jobs()
+        timeout = self._time_left()
+        results = run_concurrently(
+            [("[{0}] ".format(name), command) for name, command in jobs],
+            self.log,
+            max_workers=self._workers(),
+            fail_fast=self.fail_fast,
+            timeout=timeout,
+            grace=self.config.get("kill_grace", 5.0),
+            tail_lines=self.config.get("output_tail_lines", 500),
+        )
+        failed, stopped = [], []
+        for (name, command), result in zip(jobs, results):
+            if result is None:
+                self.log.info("[{0}] did not start".format(name))
+                continue
+            self.releaser.tracer.add_command(result)
+            if result.timed_out:
+                self.log.warning("[{0}] ran out of time".format(name))
+            elif result.stopped or result.return_code < 0:  # e.g. by fail_fast
+                stopped.append(name)
+                self.log.warning("[{0}] was stopped".format(name))
+            elif result.return_code == 0:
+                self.log.info("[{0}] passed in {1:.1f}s".format(name, result.duration))
+            else:
+                failed.append(name)
+                self.log.error(
+                    "[{0}] exited with code {1}:\n{2}".format(
+                        name, result.return_code, result.text
+                    )
+                )
+        late = [name for (name, _), r in zip(jobs, results) if r and r.timed_out]
+        if late:
+            raise StepTimeout(
+                "{0} ran out of time ({1:.0f}s left); stopped: {2}".format(
+                    self, timeout, ", ".join(late)
+                )
+            )
+        if failed:
+            msg = "Failed: " + ", ".join(failed)
+            if stopped:
+                msg += " (then stopped: {0})".format(", ".join(stopped))
+            self._fail(msg)
+        elif stopped:
+            self._fail("Stopped: " + ", ".join(stopped))
+        else:
+            self._succeed()
+
+    def __str__(self):
+        return "ParallelShell[" + ", ".join(name for name, _ in self.commands) + "]"
+
+    def describe(self):
+        return "$ {0}  ({1} at a time)".format(
+            " & ".join(command for _, command in self.jobs()), self._workers()
+        )
+
+
+def _process_pool(config):
+    """Return a ProcessPoolExecutor that is safe to start from any thread.
+
+    A forked child inherits the locks other threads (parallel steps, the
+    log writer) happen to hold, and may hang on them. So the workers come
+    from a fork server, or are spawned where there is none. The server
+    preloads this module, not ``__main__``. Each worker still imports the
+    release script as ``__mp_main__``, so the script must only call
+    ``run()`` under ``if __name__ == "__main__":``.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(
+        max_workers=config.get("max_workers"), mp_context=context
+    )
+
+
+def _docutils_version() -> str:
+    """Return the version of docutils, without importing it."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("docutils")
+    except PackageNotFoundError:
+        return ""
+
+
+def _check_rst(path: str) -> list:
+    """Check one .rst file; runs in a worker process of CheckRstFiles."""
+    from bag.check_rst import check_rst_file  # imports docutils
+
+    return [str(w) for w in check_rst_file(path)]
+
+
+class CachedBuild(Shell):
+    """Run a build command, such as "poetry build", or restore its artifacts.
+
+    The artifacts of previous builds are kept in a content-addressed cache
+    (see the *artifacts* module). If the git tree and the modified tracked
+    files (e.g. the new version number) are the same as in a cached build,
+    the artifacts are put back in ``dist/`` instead of building again.
+    """
+
+    ERROR_CODE = 7
+    provides = ("dist",)
+    per_package = True
+
+    def __init__(self, command="poetry build", stop_on_failure=True):  # noqa
+        super().__init__(command, stop_on_failure=stop_on_failure)
+
+    def describe(self):
+        return "$ {0}  (or restore its artifacts from the build cache)".format(
+            self.COMMAND
+        )
+
+    def __call__(self):  # noqa
+        from .artifacts import BuildCache, snapshot
+
+        dist = self.config.get("dist_dir", "dist")
+        cache = BuildCache(self.config)
+        key = cache.key(self.releaser.git, self.COMMAND, self.config.get("cwd", ""))
+        if self._restore(cache, key, dist):
+            return
+        before = snapshot(dist)
+        self._execute_or_complain(self.COMMAND)  # sets self.success
+        if self.success:
+            after = snapshot(dist)
+            built = sorted(n for n in after if before.get(n) != after[n])
+            cache.store(key, dist, built)
+            self.log.debug("Stored in the build cache: " + ", ".join(built))
+
+    def _restore(self, cache, key, dist):
+        """Put the artifacts of a cached build in ``dist``, if there is one."""
+        names = cache.restore(key, dist)
+        if names is None:
+            return False
+        self.log.info(
+            "Build cache hit; restored {0}".format(", ".join(names) or "nothing")
+        )
+        self._succeed()
+        return True
+
+
+class WorktreeBuild(CachedBuild):
+    """Build in a temporary git worktree, in the background.
+
+    Put it right after the step that sets the version. The current commit
+    is checked out in a temporary ``git worktree``, the modified tracked
+    files (the stamped version files) are copied into it and the build
+    command runs there, while the release goes on with the next steps --
+    approving the changelog, checks... It is waited for before a step
+    that needs ``dist``, before any irreversible step and at the end.
+
+    The artifacts are copied to ``dist/`` and kept in the build cache, so,
+    like CachedBuild, a build of the same tree is not done twice. If the
+    release fails meanwhile, the build is stopped before the rollback and
+    its artifacts are thrown away.
+    """
+
+    needs = ("the_version",)
+    background = True
+
+    def describe(self):
+        return "$ {0}  (in a temporary git worktree, in the background)".format(
+            self.COMMAND
+        )
+
+    def __call__(self):  # noqa
+        import shutil
+        from .artifacts import BuildCache
+
+        git = self.releaser.git
+        dist = self.config.get("dist_dir", "dist")
+        cwd = self.config.get("cwd", "")
+        cache = BuildCache(self.config)
+        key = cache.key(git, self.COMMAND, cwd)
+        if self._restore(cache, key, dist):
+            return
+        dirty = git.dirty_files()
+        with git.worktree() as tree:
+            for path in dirty:  # e.g. the new version number
+                source = os.path.join(git.root, path)
+                target = os.path.join(tree, path)
+                if not os.path.lexists(source):
+                    raise StopRelease(
+                        "Cannot copy {0} into the worktree: it does not "
+                        "exist. Commit or restore it first.".format(path)
+                    )
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(source, target)
+            tree_dist = os.path.join(
+                tree, os.path.relpath(os.path.abspath(dist), git.root)
+            )
+            code, _ = self._execute(self.COMMAND, cwd=os.path.join(tree, cwd))
+            if code != 0:
+                self._fail(
+                    "Command failed with code {0}: {1}".format(code, self.COMMAND)
+                )
+                return
+            if self.releaser.stopping.is_set():  # the release failed meanwhile
+                raise StopRelease(
+                    "{0} was stopped with the release; the artifacts "
+                    "were discarded.".format(self)
+                )
+            built = sorted(os.listdir(tree_dist)) if os.path.isdir(tree_dist) else []
+            os.makedirs(dist, exist_ok=True)
+            for name in built:
+                shutil.copy2(os.path.join(tree_dist, name), os.path.join(dist, name))
+            cache.store(key, tree_dist, built)
+        self.log.info("Built " + (", ".join(built) or "nothing"))
+        self._succeed()
+
 
 class CheckRstFiles(ReleaseStep):
     """Helps keep documentation correct by verifying .rst files.
 
     If files are not provided to the constructor, recursively finds
     *.rst files in the current directory and subdirectories.
+
+    Files are checked on a pool of processes. The content hash of each
+    file that passes is remembered in the cache directory, with its path
+    and the docutils version, so unchanged files are not checked again
+    in the next run -- unless docutils was upgraded meanwhile.
     """
 
     ERROR_CODE = 4
+    parallel_safe = True
 
     def __init__(self, *files):  # noqa
         self.paths = files
 
+    def describe(self):
+        if self.paths:
+            return "Check " + ", ".join(self.paths)
+        return "Check every .rst file under the current directory"
+
     def __call__(self):  # noqa
         paths = self.paths or Path(".").walk(filter=lambda p: p.suffix == ".rst")
+        paths = sorted(str(p) for p in paths)
+        cache = JsonCache(os.path.join(cache_dir(self.config), "rst.json"))
+        checker = _docutils_version()
+        records = {path: [file_digest(path), checker] for path in paths}
+        todo = []
         for path in paths:
-            self.log.info(f"Checking {path}")
-            warnings = check_rst_file(str(path))
-            if warnings:
-                raise StopRelease(
-                    "There are errors in {0}:\n{1}".format(
-                        path, "\n".join([str(w) for w in warnings])
+            if cache.get(path) == records[path]:
+                self.log.debug(f"Unchanged, not checking again: {path}")
+            else:
+                todo.append(path)
+        # Forget files that no longer exist in this form
+        good = {p: records[p] for p in paths if cache.get(p) == records[p]}
+        try:
+            for path, warnings in zip(todo, self._check(todo)):
+                self.log.info(f"Checking {path}")
+                if warnings:
+                    raise StopRelease(
+                        "There are errors in {0}:\n{1}".format(
+                            path, "\n".join(warnings)
+                        )
                     )
+                good[path] = records[path]
+        finally:
+            cache.clear()
+            cache.update(good)
+            cache.save()
+        self._succeed()
+
+    def _check(self, paths):
+        """Yield the warnings for each path, in order, as they become known."""
+        if len(paths) < 2:
+            yield from map(_check_rst, paths)
+            return
+        with _process_pool(self.config) as executor:
+            futures = [executor.submit(_check_rst, path) for path in paths]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:  # after the first error, don't start the remaining files
+                for future in futures:
+                    future.cancel()
+
+
+class CompileAndVerifyTranslations(ReleaseStep):
+    """Compile the .po translation catalogs to .mo, checking placeholders.
+
+    If paths are not provided to the constructor, finds every .po file
+    under the current directory (the package directory, in a batch).
+    The .mo file is written next to each catalog.
+
+    Catalogs are compiled on a pool of processes. The content hashes of
+    each catalog and of its .mo file are remembered in the cache
+    directory, so unchanged languages are skipped in the next run.
+    See the *translations* module for what is checked. Placeholders are
+    compared only in messages flagged ``python-format`` or
+    ``python-brace-format``, unless the ``check_unflagged_formats``
+    setting is true.
+    """
+
+    ERROR_CODE = 16
+    per_package = True
+
+    def __init__(self, *paths):  # noqa
+        self.paths = paths
+
+    def describe(self):
+        if self.paths:
+            return "Compile " + ", ".join(self.paths)
+        return "Compile every .po file under the current directory to .mo"
+
+    def __call__(self):  # noqa
+        from .translations import find_catalogs
+
+        paths = self.paths or find_catalogs(self.config.get("cwd") or ".")
+        paths = sorted(str(p) for p in paths)
+        unflagged = bool(self.config.get("check_unflagged_formats", False))
+        cache = JsonCache(os.path.join(cache_dir(self.config), "translations.json"))
+        digests = {path: file_digest(path) for path in paths}
+        todo, fresh = [], {}
+        for path in paths:
+            mo = path[:-3] + ".mo"
+            record = cache.get(path)
+            if (
+                record
+                and record[0] == digests[path]
+                and os.path.exists(mo)
+                and record[1] == file_digest(mo)
+                and record[2:] == [unflagged]  # checked the same way
+            ):
+                fresh[path] = record
+            else:
+                todo.append(path)
+        self.log.info(
+            "{0} catalog(s) to compile, {1} unchanged".format(len(todo), len(fresh))
+        )
+        problems = []
+        try:
+            compiled = self._compile(todo, unflagged)
+            for path, (found, counts) in zip(todo, compiled):
+                if found:
+                    problems.extend(found)
+                    continue
+                self.log.debug(
+                    "{0}: {translated} translated, {fuzzy} fuzzy, "
+                    "{untranslated} untranslated".format(path, **counts)
                 )
+                mo_digest = file_digest(path[:-3] + ".mo")
+                fresh[path] = [digests[path], mo_digest, unflagged]
+        finally:  # Forget catalogs that no longer exist
+            cache.clear()
+            cache.update(fresh)
+            cache.save()
+        if problems:
+            raise StopRelease("Errors in the translations:\n" + "\n".join(problems))
+        self._succeed()
+
+    def _compile(self, paths, unflagged):
+        """Yield (problems, counts) for each catalog, in order."""
+        from .translations import compile_catalog
+
+        if len(paths) < 2:
+            for path in paths:
+                yield compile_catalog(path, path[:-3] + ".mo", unflagged)
+            return
+        with _process_pool(self.config) as executor:
+            futures = [
+                executor.submit(compile_catalog, path, path[:-3] + ".mo", unflagged)
+                for path in paths
+            ]
+            for future in futures:
+                yield future.result()
 
 
 class InteractivelyApprovePackage(ReleaseStep):
     """Ask the user to manually verify source and wheel files."""
 
     ERROR_CODE = 5
+    needs = ("dist",)
+    per_package = True
+    interactive = True
 
     def __call__(self):  # noqa
         # TODO: Optionally xdg-open the archive for convenience
@@ -80,6 +517,52 @@ class InteractivelyApprovePackage(ReleaseStep):
             raise StopRelease("Package content not approved.")
 
 
+class VerifyPackages(ReleaseStep):
+    """Compare the new sdist and wheel in dist/ with the files in git.
+
+    An unattended replacement for InteractivelyApprovePackage: archives
+    are streamed, never extracted, and checked for missing, unexpected,
+    modified and oversized files. See the *verify* module for settings.
+    """
+
+    ERROR_CODE = 12
+    parallel_safe = True
+    needs = ("dist", "the_version")
+    per_package = True
+
+    def __call__(self):  # noqa
+        from concurrent.futures import ThreadPoolExecutor
+
+        from .artifacts import find_artifacts
+        from .verify import PackageVerifier
+
+        version = self.releaser.the_version
+        paths = find_artifacts(self.config.get("dist_dir", "dist"), version)
+        if not paths:
+            raise StopRelease("No artifacts of version {0} in dist/".format(version))
+        git = self.releaser.git
+        root, tracked = git.root, git.tracked_files()
+        subdir = self.config.get("cwd")
+        if subdir:  # a package in a batch: paths are relative to its directory
+            prefix = subdir.strip("/") + "/"
+            root = os.path.join(root, subdir)
+            tracked = [p[len(prefix) :] for p in tracked if p.startswith(prefix)]
+        verifier = PackageVerifier(self.config, root, tracked, self.log)
+        with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+            reports = list(executor.map(verifier.verify, paths))
+        failed = False
+        for path, problems in zip(paths, reports):
+            name = os.path.basename(path)
+            if problems:
+                failed = True
+                self.log.error("{0}:\n    {1}".format(name, "\n    ".join(problems)))
+            else:
+                self.log.info("{0} contains what it should.".format(name))
+        if failed:
+            raise StopRelease("The packages do not contain what they should.")
+        self._succeed()
+
+
 class InteractivelyEnsureChangesDocumented(ReleaseStep):
     """Step that just bugs the user to verify the CHANGES file."""
 
@@ -92,48 +575,208 @@ class InteractivelyEnsureChangesDocumented(ReleaseStep):
             raise StopRelease("One more joeshlabotniked release is avoided.")
 
 
-class CheckTravis(ReleaseStep):
-    """Check the status, on travis-ci.org, of the latest build."""
+class UpdateChangelog(ReleaseStep):
+    """Add the new git commits to the top of CHANGES.rst.
 
-    ERROR_CODE = 91
-    URL = "https://api.travis-ci.org/repos/{github_user}/{github_repository}/builds"
-
-    def __call__(self):  # noqa
-        branch = self.config.get("branch", "master")
-        resp = requests.get(self.URL.format(**self.config))
-        builds = resp.json()
-        onbranch = filter(lambda x: x["branch"] == branch, builds)
-        finished = list(filter(lambda x: x["state"] == "finished", onbranch))
-        if len(finished) == 0:
-            raise StopRelease('Travis has not built branch "{0}" yet.'.format(branch))
-        latest = finished[0]
-        if latest["result"] == 0:
+    Subjects are grouped by their conventional prefix ("feat:", "fix:"...)
+    in an "Unreleased" section, which is titled with the new version if
+    this step runs after the version is known. Also available as the
+    "changelog" subcommand. See the *changelog* module for settings.
+    """
+
+    ERROR_CODE = 13
+    needs = ("the_version",)
+    per_package = True
+
+    def __call__(self):  # noqa
+        from .changelog import update_changelog
+
+        path = self.config.get("changes_file", "CHANGES.rst")
+        with open(path, "rb") as stream:
+            self._original = stream.read()
+        cache = JsonCache(os.path.join(cache_dir(self.config), "changelog.json"))
+        self._cached = dict(cache)
+        releaser = self.releaser
+        update_changelog(
+            releaser.git,
+            self.config,
+            self.log,
+            cache,
+            releaser.the_version,
+            releaser.tag_prefix(),
+        )
+        self._succeed()
+
+    def rollback(self):
+        with open(self.config.get("changes_file", "CHANGES.rst"), "wb") as stream:
+            stream.write(self._original)
+        cache = JsonCache(os.path.join(cache_dir(self.config), "changelog.json"))
+        cache.clear()
+        cache.update(self._cached)
+        cache.save()
+
+
+class CheckCI(ReleaseStep):
+    """Wait for the latest continuous integration build; fail if it failed.
+
+    The service is polled in the background while the following steps
+    run; the release only waits for the result before the first
+    irreversible step. See the *ci* module for the settings.
+    """
+
+    ERROR_CODE = 92
+    parallel_safe = True
+    background = True
+    provider = None  # overrides the "ci_provider" setting
+
+    def describe(self):
+        return 'Wait for the latest {0} build of branch "{1}"{2}'.format(
+            self.provider or self.config.get("ci_provider", "travis"),
+            self.config.get("branch", "master"),
+            " (in the background)" if self.background else "",
+        )
+
+    def __call__(self):  # noqa
+        from .ci import CIPoller  # imports requests
+
+        config = self.config
+        if self.provider:
+            config = dict(config, ci_provider=self.provider)
+        poller = CIPoller.from_config(config, self.log, stopping=self.releaser.stopping)
+        status = poller.wait()
+        name = poller.provider.name
+        if status["passed"]:
             self.log.info(
-                'No problem in latest Travis build: "{0}"'.format(latest.get("message"))
+                'No problem in latest {0} build: "{1}"'.format(
+                    name, status["description"]
+                )
             )
             self._succeed()
         else:
             raise StopRelease(
-                'Last Travis build on branch "{0}" failed.'.format(branch)
+                'Last {0} build on branch "{1}" failed.'.format(
+                    name, poller.provider.branch
+                )
             )
 
 
+class CheckTravis(CheckCI):
+    """Check the status, on travis-ci.org, of the latest build."""
+
+    ERROR_CODE = 91
+    background = False  # runs in its place, as it always did
+    provider = "travis"
+
+
 class SetVersionNumberInteractively(ReleaseStep):
-    """Ask user for the new version number and write it on the source code."""
+    """Ask user for the new version number and write it on the source code.
+
+    The version is written onto all the files in the ``version_files``
+    setting (see the *stamping* module), or onto ``version_file``.
+    """
 
     ERROR_CODE = 6
+    provides = ("old_version", "the_version")
+    per_package = True
+    interactive = True
+
+    def describe(self):
+        paths = VersionStamper.from_config(self.config).paths
+        return "Ask for the new version; write it to " + ", ".join(paths)
 
     def __call__(self):  # noqa
         releaser = self.releaser
-        path = releaser.config["version_file"]
-        keyword = releaser.config.get("version_keyword", "version")
-        releaser.old_version = version_in_python_source_file(path, keyword=keyword)
+        stamper = VersionStamper.from_config(self.config)
+        releaser.old_version = stamper.current()
         print("Current version: {0}".format(releaser.old_version))
+        latest = releaser.tags.latest(include_prereleases=True)
+        if latest is not None:
+            print(
+                "Latest release: {0} (next patch would be {1})".format(
+                    latest, latest.bump("patch")
+                )
+            )
         releaser.the_version = input("What is the new version number? ")
         # Write the new version onto the source code
-        version_in_python_source_file(
-            path, keyword=keyword, replace=releaser.the_version
+        changed = stamper.stamp(releaser.the_version)
+        self.log.debug("Version written to: {0}".format(", ".join(changed)))
+        self._succeed()
+
+
+class CheckVersionConflicts(ReleaseStep):
+    """Check that neither the remote nor the index has the new version yet.
+
+    Put it right after the step that sets the version. It runs in the
+    background: one ``git ls-remote`` looks for the new tags on the
+    remote (the ``remote`` setting) while the package index (the
+    ``index_url`` setting; empty to skip) is asked for files of the new
+    version under the ``package_name`` setting (by default, the
+    ``github_repository``). The release waits for the answer before the
+    first irreversible step. If a service cannot be reached, that is only
+    a warning.
+    """
+
+    ERROR_CODE = 15
+    needs = ("the_version",)
+    parallel_safe = True
+    background = True
+
+    def describe(self):
+        return "Look for the new tags on {0} and the version on {1}".format(
+            self.config.get("remote", "origin"),
+            self.config.get("index_url", "https://pypi.org/pypi") or "no index",
+        )
+
+    def _remote_tags(self, names):
+        """Return those of the tag ``names`` that exist on the remote."""
+        if not names:
+            return []
+        remote = self.config.get("remote", "origin")
+        refs = ["refs/tags/" + name for name in names]
+        result = self.releaser.git.run(
+            "ls-remote", "--tags", remote, *refs, check=False
+        )
+        if result.return_code != 0:
+            self.log.warning(
+                "Could not list the tags on {0}:\n{1}".format(remote, result.text)
+            )
+            return []
+        found = {line.split("\t", 1)[-1] for line in result.stdout.splitlines()}
+        return [name for name in names if "refs/tags/" + name in found]
+
+    def _released_files(self, package):
+        """Return the files of the new version the index already has."""
+        from .upload import Uploader  # imports requests
+
+        config = package.config
+        name = config.get("package_name") or config["github_repository"]
+        uploader = Uploader.from_config(config, self.log)
+        return name, sorted(uploader.existing_files(name, package.the_version))
+
+    def __call__(self):  # noqa
+        from concurrent.futures import ThreadPoolExecutor
+
+        releaser = self.releaser
+        names = [name for name, _ in releaser.new_tags()]
+        # In a batch (see the *monorepo* module), check every package
+        packages = getattr(releaser, "packages", None) or [releaser]
+        with ThreadPoolExecutor(max_workers=len(packages) + 1) as executor:
+            remote = executor.submit(self._remote_tags, names)
+            released = list(executor.map(self._released_files, packages))
+            conflicts = [
+                "The tag {0} exists on the remote.".format(name)
+                for name in remote.result()
+            ]
+        conflicts.extend(
+            "The index already has {0} {1}: {2}".format(
+                name, package.the_version, ", ".join(files)
+            )
+            for package, (name, files) in zip(packages, released)
+            if files
         )
+        if conflicts:
+            raise StopRelease("\n".join(conflicts))
+        self.log.info("No version conflicts on the remote or the index.")
         self._succeed()
 
 
@@ -141,6 +784,9 @@ class TwineUploadSource(CommandStep):
     """Use *twine* to upload a source distribution to pypi."""
 
     ERROR_CODE = 8
+    needs = ("dist", "the_version")
+    irreversible = True
+    per_package = True
     no_rollback = "Cannot roll back the sdist upload to http://pypi.python.org"
 
     def __call__(self):  # noqa
@@ -156,6 +802,9 @@ class TwineUploadWheel(CommandStep):
     """Use *twine* to upload a wheel to pypi."""
 
     ERROR_CODE = 11
+    needs = ("dist", "the_version")
+    irreversible = True
+    per_package = True
     no_rollback = "Cannot roll back the wheel upload to http://pypi.python.org"
 
     def __call__(self):  # noqa
@@ -169,26 +818,63 @@ class TwineUploadWheel(CommandStep):
         return "Server response (200): OK" in command_output
 
 
+class UploadPackages(ReleaseStep):
+    """Upload all the artifacts of the new version in dist/ to the index.
+
+    Uploads run concurrently, are retried on transient errors and skip
+    files the index already has. See the *upload* module for settings.
+    """
+
+    ERROR_CODE = 10
+    needs = ("dist", "the_version")
+    irreversible = True
+    per_package = True
+    no_rollback = "Cannot roll back uploads to the package index."
+
+    def describe(self):
+        return "Upload dist/*-<version>* to " + self.config.get(
+            "repository_url", "https://upload.pypi.org/legacy/"
+        )
+
+    def __call__(self):  # noqa
+        from .artifacts import find_artifacts
+        from .upload import Uploader, read_metadata  # imports requests
+
+        version = self.releaser.the_version
+        paths = find_artifacts(self.config.get("dist_dir", "dist"), version)
+        if not paths:
+            raise StopRelease("No artifacts of version {0} in dist/".format(version))
+        name = read_metadata(paths[0])["name"]
+        uploader = Uploader.from_config(self.config, self.log)
+        results = uploader.upload_all(paths, name, version)
+        for path in paths:
+            self.log.info("{0}: {1}".format(os.path.basename(path), results[path]))
+        self._succeed()
+
+
 class SetFutureVersion(ReleaseStep):
     """Set the development version number in source code after release."""
 
     ERROR_CODE = 9
+    provides = ("future_version",)
+    per_package = True
+
+    def describe(self):
+        paths = VersionStamper.from_config(self.config).paths
+        return "Write the next development version to " + ", ".join(paths)
 
     def __call__(self):  # noqa
         releaser = self.releaser
-        path = releaser.config["version_file"]
-        keyword = releaser.config.get("version_keyword", "version")
+        stamper = VersionStamper.from_config(self.config)
         # If the SetVersionNumberInteractively step is disabled for debugging,
         # we can still execute the current step, by populating the_version:
         if releaser.the_version is None:
-            releaser._the_version = version_in_python_source_file(path, keyword=keyword)
+            releaser._the_version = stamper.current()
         self.log.info(
             "Ready for the next development cycle! Setting version "
             + releaser.future_version
         )
-        version_in_python_source_file(
-            path, keyword=keyword, replace=releaser.future_version
-        )
+        stamper.stamp(releaser.future_version)
         self._succeed()
 
 
@@ -202,9 +888,14 @@ class ErrorStep(CommandStep):
 class Warn(ReleaseStep):
     """Just print a warning on the screen and on the log file."""
 
+    parallel_safe = True
+
     def __init__(self, msg: str):  # noqa
         self.msg = msg
 
+    def describe(self):
+        return "Warn: " + self.msg
+
     def __call__(self):  # noqa
         self.log.warn(self.msg)
         self.success = True
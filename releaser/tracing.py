@@ -0,0 +1,151 @@
+"""Records how long each step and each command takes.
+
+The Releaser keeps a Tracer, which collects spans for steps, rollbacks
+and the commands they run. At the end, spans are written to a JSON file
+in the Chrome trace format -- open it in https://ui.perfetto.dev or in
+chrome://tracing -- and summarized in a table in the log.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+
+class Span:
+    """A named interval of time, with a few measurements attached."""
+
+    def __init__(self, name, category, start, wall, cpu=None, parent=None, **args):
+        self.name = name
+        self.category = category  # "step", "rollback" or "command"
+        self.start = start  # seconds since the tracer was created
+        self.wall = wall  # seconds
+        self.cpu = cpu  # seconds, or None if unknown
+        self.parent = parent  # the enclosing Span, if any
+        self.thread = threading.get_ident()
+        self.args = args  # exit_code, output_bytes etc.
+
+
+class Tracer:
+    """Collects spans from any thread; thread-safe."""
+
+    def __init__(self):  # noqa
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _add(self, span: Span) -> Span:
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    @property
+    def current(self) -> Optional[Span]:
+        """The innermost span open in this thread."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, category: str):
+        """Measure the enclosed block. Yield a dict for extra arguments."""
+        start, cpu = time.perf_counter(), time.thread_time()
+        span = Span(name, category, start - self.origin, 0.0, parent=self.current)
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(span)
+        try:
+            yield span.args
+        finally:
+            stack.pop()
+            span.wall = time.perf_counter() - start
+            span.cpu = time.thread_time() - cpu
+            self._add(span)
+
+    def add_command(self, result) -> Span:
+        """Record a finished command, given its CommandResult."""
+        command = result.command
+        if not isinstance(command, str):
+            command = " ".join(command)
+        return self._add(
+            Span(
+                command,
+                "command",
+                result.started - self.origin,
+                result.duration,
+                result.cpu_time,
+                parent=self.current,
+                exit_code=result.return_code,
+                output_bytes=result.output_bytes,
+            )
+        )
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Return the spans as a Chrome trace (Perfetto) JSON document."""
+        pid = os.getpid()
+        events = []
+        threads = {}
+        for span in self.spans:
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            args = dict(span.args)
+            if span.cpu is not None:
+                args["cpu_ms"] = round(span.cpu * 1000, 3)
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round(span.start * 1e6),
+                    "dur": round(span.wall * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        for tid in threads.values():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": "thread {0}".format(tid)},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as stream:
+            json.dump(self.chrome_trace(), stream)
+
+    def summary(self) -> str:
+        """Return a table with one row per step and per rollback."""
+        commands: Dict[int, List[Span]] = {}
+        for span in self.spans:
+            if span.category == "command":
+                commands.setdefault(id(span.parent), []).append(span)
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            if span.category == "command":
+                continue
+            children = commands.get(id(span), [])
+            cpu = (span.cpu or 0) + sum(c.cpu or 0 for c in children)
+            codes = [c.args["exit_code"] for c in children]
+            label = span.name
+            if span.category == "rollback":
+                label = "ROLLBACK " + label
+            rows.append(
+                "{0:<40} {1:>9.3f} {2:>9.3f} {3:>5} {4:>5} {5:>11}".format(
+                    label[:40],
+                    span.wall,
+                    cpu,
+                    len(children),
+                    codes[-1] if codes else "",
+                    sum(c.args["output_bytes"] for c in children),
+                )
+            )
+        header = "{0:<40} {1:>9} {2:>9} {3:>5} {4:>5} {5:>11}".format(
+            "Step", "Wall (s)", "CPU (s)", "Cmds", "Exit", "Output (B)"
+        )
+        return "\n".join([header, "-" * len(header)] + rows)
@@ -0,0 +1,291 @@
+"""Compiles gettext catalogs (.po) to .mo files, checking placeholders.
+
+This is what ``msgfmt --check-format`` does, without needing gettext
+installed. A translation whose placeholders differ from those of the
+original would raise an exception (or print garbage) at run time, so
+these are errors:
+
+- printf-style placeholders (``%s``, ``%(name)d``) that differ, in
+  messages flagged ``python-format``;
+- brace placeholders (``{0}``, ``{name}``) that differ, in messages
+  flagged ``python-brace-format``.
+
+Extraction tools such as xgettext and Babel set these flags on the
+messages that contain placeholders, so text like "100% sure" or "{}"
+in other messages is left alone. Pass ``unflagged=True`` to check
+every message not flagged ``no-python-format`` (or
+``no-python-brace-format``) as well.
+
+Plural forms may leave out placeholders (as in "One file" for "%d
+files") but must not add any. Fuzzy and untranslated messages are left
+out of the .mo file, like msgfmt does.
+"""
+
+import array
+import codecs
+import os
+import re
+import struct
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .cache import write_atomically
+
+SKIP_DIRS = {".git", ".hg", ".tox", ".nox", "node_modules", "__pycache__"}
+PRINTF_RE = re.compile(
+    r"%(?:\((?P<name>[^)]*)\))?[#0+-]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?"
+    r"(?P<conv>[diouxXeEfFgGcrsa%])"
+)
+BRACE_RE = re.compile(r"\{\{|\}\}|\{([^{}]*)\}")
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\", "a": "\a"}
+ESCAPES.update({"b": "\b", "f": "\f", "v": "\v"})
+ESCAPE_RE = re.compile(r"\\(.)")
+CHARSET_RE = re.compile(r"charset=([\w-]+)", re.IGNORECASE)
+
+
+class CatalogError(ValueError):
+    """The .po file cannot be parsed."""
+
+
+class Message:
+    """One entry of a catalog."""
+
+    __slots__ = ("context", "msgid", "plural", "msgstr", "flags", "line")
+
+    def __init__(self, line: int):  # noqa
+        self.context: Optional[str] = None
+        self.msgid = ""
+        self.plural: Optional[str] = None
+        self.msgstr: Dict[int, str] = {}
+        self.flags: List[str] = []
+        self.line = line
+
+    @property
+    def translated(self) -> bool:
+        return bool(self.msgstr) and all(self.msgstr.values())
+
+
+def find_catalogs(root: str = ".") -> Iterator[str]:
+    """Yield the paths of the .po files under ``root``."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d
+            for d in dirnames
+            if d not in SKIP_DIRS
+            and not d.startswith(".")
+            and not os.path.exists(os.path.join(dirpath, d, "pyvenv.cfg"))
+        )
+        for name in sorted(filenames):
+            if name.endswith(".po"):
+                yield os.path.join(dirpath, name)
+
+
+def _unescape(text: str) -> str:
+    return ESCAPE_RE.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def parse_po(text: str) -> List[Message]:
+    """Return the messages of a catalog, obsolete ones excluded."""
+    messages: List[Message] = []
+    current: Optional[Message] = None
+    flags: List[str] = []
+    field = None  # the keyword whose string continues on the next line
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#~"):
+            field = None
+            continue
+        if line.startswith("#,"):
+            flags.extend(f.strip() for f in line[2:].split(","))
+            continue
+        if line.startswith("#"):
+            continue
+        if line.startswith('"'):
+            keyword, rest = None, line
+        else:
+            keyword, _, rest = line.partition(" ")
+        if keyword == "msgctxt" or (
+            keyword == "msgid" and (current is None or current.msgstr)
+        ):  # a new message begins
+            current = Message(number)
+            current.flags, flags = flags, []
+            messages.append(current)
+        if current is None:
+            raise CatalogError("line {0}: unexpected {1!r}".format(number, line))
+        rest = rest.strip()
+        if len(rest) < 2 or rest[0] != '"' or rest[-1] != '"':
+            raise CatalogError("line {0}: expected a string".format(number))
+        value = _unescape(rest[1:-1])
+        if keyword is not None:
+            field = keyword
+            if keyword == "msgctxt":
+                current.context = ""
+            elif keyword == "msgid_plural":
+                current.plural = ""
+            elif keyword == "msgstr" or keyword.startswith("msgstr["):
+                index = 0 if keyword == "msgstr" else int(keyword[7:-1])
+                field = index
+                current.msgstr[index] = ""
+            elif keyword != "msgid":
+                raise CatalogError("line {0}: unknown {1}".format(number, keyword))
+        if field is None:
+            raise CatalogError("line {0}: unexpected string".format(number))
+        if field == "msgctxt":
+            current.context = (current.context or "") + value
+        elif field == "msgid":
+            current.msgid += value
+        elif field == "msgid_plural":
+            current.plural = (current.plural or "") + value
+        else:
+            current.msgstr[field] += value
+    return messages
+
+
+def placeholders(text: str) -> Tuple[frozenset, Tuple[str, ...], Counter]:
+    """Return the named and positional printf and the brace placeholders."""
+    named, positional = set(), []
+    for match in PRINTF_RE.finditer(text):
+        if match.group("conv") == "%":
+            continue
+        if match.group("name") is not None:
+            named.add(match.group("name"))
+        else:
+            positional.append(match.group("conv"))
+    braces = Counter(
+        m.group(1) for m in BRACE_RE.finditer(text) if m.group(1) is not None
+    )
+    return frozenset(named), tuple(positional), braces
+
+
+def check_message(message: Message, unflagged: bool = False) -> List[str]:
+    """Return the placeholder problems of one translated message.
+
+    Only the formats the message is flagged with are checked, unless
+    ``unflagged`` is true (see the module docs).
+    """
+    flags = message.flags
+    printf = "python-format" in flags or (unflagged and "no-python-format" not in flags)
+    brace = "python-brace-format" in flags or (
+        unflagged and "no-python-brace-format" not in flags
+    )
+    if not (printf or brace):
+        return []
+    originals = [placeholders(message.msgid)]
+    if message.plural is not None:
+        originals.append(placeholders(message.plural))
+    known_names = set()
+    known_braces = set()
+    for o_named, _, o_braces in originals:
+        known_names |= o_named
+        known_braces |= set(o_braces)
+    problems = []
+    for index, text in sorted(message.msgstr.items()):
+        if not text:
+            continue
+        named, positional, braces = placeholders(text)
+        where = "msgstr"
+        if message.plural is not None:
+            where += "[{0}]".format(index)
+        if message.plural is None:  # must match exactly
+            o_named, o_positional, o_braces = originals[0]
+            if printf and (named != o_named or positional != o_positional):
+                problems.append("{0} has different % placeholders".format(where))
+            if brace and braces != o_braces:
+                problems.append("{0} has different {{}} placeholders".format(where))
+        else:  # may leave placeholders out, but not add any
+            if printf and (
+                not named <= known_names
+                or positional not in ((), originals[0][1], originals[1][1])
+            ):
+                problems.append("{0} has unknown % placeholders".format(where))
+            if brace and not set(braces) <= known_braces:
+                problems.append("{0} has unknown {{}} placeholders".format(where))
+    return problems
+
+
+def mo_bytes(messages: List[Message], encoding: str = "utf-8") -> bytes:
+    """Return the contents of the .mo file for these (translated) messages."""
+    catalog = {}
+    for message in messages:
+        key = message.msgid
+        if message.plural is not None:
+            key += "\0" + message.plural
+        if message.context is not None:
+            key = message.context + "\x04" + key
+        forms = [message.msgstr[i] for i in sorted(message.msgstr)]
+        catalog[key.encode(encoding)] = "\0".join(forms).encode(encoding)
+    keys = sorted(catalog)
+    key_offsets: List[int] = []
+    value_offsets: List[int] = []
+    key_start = 7 * 4 + 16 * len(keys)
+    value_start = key_start + sum(len(key) + 1 for key in keys)
+    for key in keys:
+        value = catalog[key]
+        key_offsets += [len(key), key_start]
+        value_offsets += [len(value), value_start]
+        key_start += len(key) + 1
+        value_start += len(value) + 1
+    header = struct.pack(
+        "Iiiiiii", 0x950412DE, 0, len(keys), 7 * 4, 7 * 4 + len(keys) * 8, 0, 0
+    )
+    return b"".join(
+        [header, array.array("i", key_offsets + value_offsets).tobytes()]
+        + [key + b"\0" for key in keys]
+        + [catalog[key] + b"\0" for key in keys]
+    )
+
+
+def compile_catalog(
+    po_path: str, mo_path: str, unflagged: bool = False
+) -> Tuple[List[str], Dict[str, int]]:
+    """Check a .po file and, if it has no errors, write its .mo file.
+
+    Runs in a worker process. Return the problems found and the numbers
+    of translated, fuzzy and untranslated messages. ``unflagged`` is
+    passed to check_message().
+    """
+    with open(po_path, "rb") as stream:
+        data = stream.read()
+    try:
+        # Most catalogs are UTF-8 and parsed once. Others are first decoded
+        # as latin-1, which accepts any byte, only to read their charset.
+        try:
+            text, decoded_as = data.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            text, decoded_as = data.decode("latin-1"), "iso8859-1"
+        messages = parse_po(text)
+        header = next((m for m in messages if not m.msgid and not m.context), None)
+        found = CHARSET_RE.search(header.msgstr.get(0, "")) if header else None
+        encoding = "utf-8"
+        if found and found.group(1).upper() != "CHARSET":  # not a template
+            encoding = codecs.lookup(found.group(1)).name
+        if encoding != decoded_as:
+            messages = parse_po(data.decode(encoding))
+    except (CatalogError, UnicodeDecodeError, LookupError) as e:
+        return ["{0}: {1}".format(po_path, e)], {}
+    counts = {"translated": 0, "fuzzy": 0, "untranslated": 0}
+    problems, kept = [], []
+    for message in messages:
+        if not message.msgid and not message.context:
+            kept.append(message)  # the header, even if fuzzy
+        elif "fuzzy" in message.flags:
+            counts["fuzzy"] += 1
+        elif not message.translated:
+            counts["untranslated"] += 1
+        else:
+            counts["translated"] += 1
+            kept.append(message)
+            problems.extend(
+                "{0}:{1}: {2}".format(po_path, message.line, problem)
+                for problem in check_message(message, unflagged)
+            )
+    if not problems:
+        data = mo_bytes(kept, encoding)
+        try:
+            with open(mo_path, "rb") as stream:
+                unchanged = stream.read() == data
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            write_atomically(mo_path, data)
+    return problems, counts
@@ -0,0 +1,246 @@
+"""Uploads built packages to a package index, such as https://pypi.org.
+
+This speaks the same "legacy" upload API that twine uses. All the
+artifacts are uploaded concurrently through one pooled HTTP session.
+Transient failures (connection errors, HTTP 429 and 5xx) are retried
+with exponential backoff, and files the index already has are skipped.
+
+Settings (all optional):
+
+- ``repository_url``: upload endpoint; default
+  https://upload.pypi.org/legacy/
+- ``index_url``: JSON API used to learn which files already exist;
+  default https://pypi.org/pypi -- set to None to skip the query
+- ``upload_workers``: concurrent uploads; default 4
+- ``upload_retries``: attempts after the first failure; default 4
+- ``upload_backoff``: seconds before the first retry; default 1
+
+Credentials come from the environment variables TWINE_USERNAME
+(default ``__token__``) and TWINE_PASSWORD, as with twine.
+"""
+
+import hashlib
+import os
+import random
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import HeaderParser
+from typing import Dict, List, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import StopRelease
+
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+# Metadata fields that may appear many times, and their form field names
+MULTIPLE_FIELDS = {
+    "classifier": "classifiers",
+    "dynamic": "dynamic",
+    "license_file": "license_file",
+    "obsoletes_dist": "obsoletes_dist",
+    "platform": "platform",
+    "project_url": "project_urls",
+    "provides_dist": "provides_dist",
+    "provides_extra": "provides_extra",
+    "requires_dist": "requires_dist",
+    "requires_external": "requires_external",
+    "supported_platform": "supported_platform",
+}
+
+
+def read_metadata(path: str) -> Dict[str, object]:
+    """Return the core metadata of a wheel or sdist as upload form fields."""
+    raw = None
+    if path.endswith(".whl"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                parts = name.split("/")
+                if len(parts) == 2 and parts[0].endswith(".dist-info"):
+                    if parts[1] == "METADATA":
+                        raw = archive.read(name)
+                        break
+    elif path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.count("/") == 1 and name.endswith("/PKG-INFO"):
+                    raw = archive.read(name)
+                    break
+    else:
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.name.count("/") == 1 and member.name.endswith("/PKG-INFO"):
+                    raw = archive.extractfile(member).read()
+                    break
+    if raw is None:
+        raise StopRelease("No package metadata found in {0}".format(path))
+    message = HeaderParser().parsestr(raw.decode("utf-8"))
+    fields: Dict[str, object] = {}
+    for key, value in message.items():
+        key = key.lower().replace("-", "_")
+        if key in MULTIPLE_FIELDS:
+            fields.setdefault(MULTIPLE_FIELDS[key], []).append(value)
+        else:
+            fields[key] = value
+    body = message.get_payload()
+    if body and body.strip() and "description" not in fields:
+        fields["description"] = body
+    return fields
+
+
+class Uploader:
+    """Uploads files concurrently, with retries; see the module docs."""
+
+    def __init__(
+        self,
+        log,
+        repository_url="https://upload.pypi.org/legacy/",
+        index_url="https://pypi.org/pypi",
+        username=None,
+        password=None,
+        workers=4,
+        retries=4,
+        backoff=1.0,
+        timeout=300,
+    ):  # noqa
+        self.log = log
+        self.repository_url = repository_url
+        self.index_url = index_url
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(workers, 1))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if password:
+            self.session.auth = (username or "__token__", password)
+
+    @classmethod
+    def from_config(cls, config, log):
+        return cls(
+            log,
+            repository_url=config.get(
+                "repository_url", "https://upload.pypi.org/legacy/"
+            ),
+            index_url=config.get("index_url", "https://pypi.org/pypi"),
+            username=os.environ.get("TWINE_USERNAME"),
+            password=os.environ.get("TWINE_PASSWORD"),
+            workers=config.get("upload_workers", 4),
+            retries=config.get("upload_retries", 4),
+            backoff=config.get("upload_backoff", 1.0),
+        )
+
+    def existing_files(self, name: str, version: str) -> Set[str]:
+        """Ask the index which files of this release it already has."""
+        if not self.index_url:
+            return set()
+        url = "{0}/{1}/{2}/json".format(self.index_url.rstrip("/"), name, version)
+        try:
+            resp = self._request("GET", url)
+        except requests.RequestException as e:
+            self.log.warning("Could not query {0}: {1}".format(url, e))
+            return set()
+        if resp.status_code != 200:
+            return set()  # 404 means nothing was released yet
+        try:
+            return {f["filename"] for f in resp.json().get("urls", [])}
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            self.log.warning("Unexpected answer from {0}: {1!r}".format(url, e))
+            return set()
+
+    def _request(self, method, url, **kw):
+        """Send a request, retrying transient failures with backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                if "files" in kw:  # the file must be read from the start
+                    kw["files"]["content"][1].seek(0)
+                resp = self.session.request(method, url, timeout=self.timeout, **kw)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                problem = str(e)
+            else:
+                if resp.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return resp
+                problem = "HTTP {0}".format(resp.status_code)
+            delay = self.backoff * 2**attempt * (1 + random.random() / 2)
+            self.log.warning(
+                "{0} {1}: {2}. Retrying in {3:.1f}s".format(method, url, problem, delay)
+            )
+            time.sleep(delay)
+
+    def upload(self, path: str) -> str:
+        """Upload one file. Return "uploaded" or "skipped"."""
+        fields = read_metadata(path)
+        filename = os.path.basename(path)
+        hashes = {"md5": hashlib.md5(), "sha256": hashlib.sha256()}
+        hashes["blake2_256"] = hashlib.blake2b(digest_size=32)
+        with open(path, "rb") as stream:
+            for block in iter(lambda: stream.read(1 << 20), b""):
+                for hasher in hashes.values():
+                    hasher.update(block)
+        if filename.endswith(".whl"):
+            filetype, pyversion = "bdist_wheel", filename.split("-")[-3]
+        else:
+            filetype, pyversion = "sdist", "source"
+        fields.update(
+            {
+                ":action": "file_upload",
+                "protocol_version": "1",
+                "filetype": filetype,
+                "pyversion": pyversion,
+                "comment": "",
+            }
+        )
+        for algorithm, hasher in hashes.items():
+            fields[algorithm + "_digest"] = hasher.hexdigest()
+        self.log.info("Uploading {0}".format(filename))
+        with open(path, "rb") as stream:
+            resp = self._request(
+                "POST",
+                self.repository_url,
+                data=fields,
+                files={"content": (filename, stream, "application/octet-stream")},
+            )
+        if resp.status_code in (400, 409) and "exist" in resp.text.lower():
+            self.log.info("The index already has {0}".format(filename))
+            return "skipped"
+        if resp.status_code >= 300:
+            raise StopRelease(
+                "Upload of {0} failed with HTTP {1}: {2}".format(
+                    filename, resp.status_code, resp.text[:500]
+                )
+            )
+        return "uploaded"
+
+    def upload_all(self, paths: List[str], name: str, version: str):
+        """Upload ``paths`` concurrently. Return a dict {path: outcome}.
+
+        The first StopRelease raised by an upload is raised again after
+        the uploads already running have finished.
+        """
+        existing = self.existing_files(name, version)
+        results: Dict[str, str] = {}
+        todo = []
+        for path in paths:
+            if os.path.basename(path) in existing:
+                self.log.info("Skipping {0}, already on the index".format(path))
+                results[path] = "skipped"
+            else:
+                todo.append(path)
+        error: Optional[BaseException] = None
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            futures = {executor.submit(self.upload, p): p for p in todo}
+            for future, path in futures.items():
+                try:
+                    results[path] = future.result()
+                except (StopRelease, requests.RequestException) as e:
+                    results[path] = "failed"
+                    error = error or e
+        if error:
+            raise StopRelease(str(error))
+        return results
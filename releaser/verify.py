@@ -0,0 +1,208 @@
+"""Checks the contents of built packages against the git repository.
+
+The members of each sdist (.tar.gz) and wheel (.whl) are streamed one
+block at a time -- nothing is extracted and memory use does not depend
+on the size of the archive. Each archive is compared with the files
+tracked by git, filtered through include and exclude patterns:
+
+- an expected file that is absent from the archive is **missing**;
+- a member that is neither expected nor generated by the build tool
+  (PKG-INFO, the .dist-info directory etc.) is **unexpected**;
+- a member whose sha256 differs from the file in the work tree is
+  **modified** (files the build tool rewrites are exempt);
+- a member larger than ``package_max_file_size`` is **too large**.
+
+Settings (all optional; patterns are fnmatch globs on paths relative to
+the top of the repository, where ``*`` also matches ``/``):
+
+- ``package_dir``: the import package; default: ``github_repository``
+  with dashes replaced by underscores
+- ``sdist_include``: default ``[package_dir + "/*", "pyproject.toml",
+  "README*", "LICENSE*"]``, plus the ``include`` entries of
+  pyproject.toml (see ``pyproject_includes()``)
+- ``wheel_include``: default ``[package_dir + "/*"]``, plus the
+  ``include`` entries of pyproject.toml meant for wheels
+- ``package_exclude``: default: bytecode and ``tests`` directories
+- ``package_generated``: more patterns of members the build creates
+- ``package_rewritten``: files whose content the build may change;
+  default ``["pyproject.toml", "setup.cfg", "setup.py"]``
+- ``package_max_file_size``: bytes; default 10 MiB
+"""
+
+import hashlib
+import os
+from fnmatch import fnmatch
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+BLOCK = 1 << 20
+DEFAULT_EXCLUDE = ("*.pyc", "*/__pycache__/*", "tests/*", "*/tests/*")
+SDIST_GENERATED = ("PKG-INFO", "setup.py", "setup.cfg", "*.egg-info/*")
+WHEEL_GENERATED = ("*.dist-info/*",)
+
+
+def pyproject_includes(root: str, log=None) -> Dict[str, List[str]]:
+    """Read the extra files that the build adds to each kind of archive.
+
+    These are the ``include`` entries of ``[tool.poetry]`` (which go in
+    the sdist only, unless their ``format`` says otherwise) and of
+    ``[tool.hatch.build.targets.sdist]`` in ``root``/pyproject.toml.
+    A directory also stands for everything under it. Nothing is read
+    without a TOML parser (Python 3.11+ or *tomli*); ``log`` is then
+    warned, since files the build adds would be reported as unexpected.
+    """
+    found: Dict[str, List[str]] = {"sdist": [], "wheel": []}
+    path = os.path.join(root, "pyproject.toml")
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            if log is not None and os.path.exists(path):
+                log.warning(
+                    "Cannot read the include entries of {0}: "
+                    "install tomli (or use Python 3.11+).".format(path)
+                )
+            return found
+    try:
+        with open(path, "rb") as stream:
+            data = tomllib.load(stream)
+    except (OSError, ValueError):  # TOMLDecodeError is a ValueError
+        return found
+    tool = data.get("tool", {})
+    entries = list(tool.get("poetry", {}).get("include", []))
+    hatch = tool.get("hatch", {}).get("build", {}).get("targets", {})
+    entries.extend(hatch.get("sdist", {}).get("include", []))
+    for entry in entries:
+        if isinstance(entry, str):
+            pattern, formats = entry, ["sdist"]
+        else:  # e.g. {path = "data", format = ["sdist", "wheel"]}
+            pattern, formats = entry.get("path", ""), entry.get("format", ["sdist"])
+            if isinstance(formats, str):
+                formats = [formats]
+        pattern = pattern.strip("/")
+        for kind in formats:
+            if pattern and kind in found:
+                found[kind].extend((pattern, pattern + "/*"))
+    return found
+
+
+def _matches(path: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatch(path, pattern) for pattern in patterns)
+
+
+def _hash_stream(stream, limit: int) -> Tuple[str, int]:
+    """Return the sha256 and size of ``stream``, reading up to ``limit``+1."""
+    hasher, size = hashlib.sha256(), 0
+    while size <= limit:
+        block = stream.read(BLOCK)
+        if not block:
+            break
+        hasher.update(block)
+        size += len(block)
+    return hasher.hexdigest(), size
+
+
+def iter_sdist(path: str, limit: int) -> Iterator[Tuple[str, int, str]]:
+    """Yield (name, size, sha256) of each file in an sdist, in one pass.
+
+    Names lose their first component, the "name-version/" directory.
+    """
+    import tarfile
+
+    with tarfile.open(path, "r|*") as archive:  # a stream; no random access
+        for member in archive:
+            if not member.isfile():
+                continue
+            name = member.name.split("/", 1)[-1]
+            digest, size = _hash_stream(archive.extractfile(member), limit)
+            yield name, max(size, member.size), digest
+
+
+def iter_wheel(path: str, limit: int) -> Iterator[Tuple[str, int, str]]:
+    """Yield (name, size, sha256) of each file in a wheel.
+
+    Files under "*.data/<scheme>/" are named as if they were at the top.
+    """
+    import zipfile
+
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            name = info.filename
+            first, _, rest = name.partition("/")
+            if first.endswith(".data") and "/" in rest:
+                name = rest.split("/", 1)[1]
+            with archive.open(info) as stream:
+                digest, size = _hash_stream(stream, limit)
+            yield name, max(size, info.file_size), digest
+
+
+class PackageVerifier:
+    """Compares archives with the tracked files; see the module docs."""
+
+    def __init__(self, config, root: str, tracked: Sequence[str], log=None):  # noqa
+        package = config.get("package_dir") or config.get(
+            "github_repository", ""
+        ).replace("-", "_")
+        self.root = root
+        self.tracked = set(tracked)
+        extra = pyproject_includes(root, log)
+        self.include = {
+            "sdist": config.get(
+                "sdist_include",
+                [package + "/*", "pyproject.toml", "README*", "LICENSE*"]
+                + extra["sdist"],
+            ),
+            "wheel": config.get("wheel_include", [package + "/*"] + extra["wheel"]),
+        }
+        self.exclude = config.get("package_exclude", DEFAULT_EXCLUDE)
+        extra = tuple(config.get("package_generated", ()))
+        self.generated = {
+            "sdist": SDIST_GENERATED + extra,
+            "wheel": WHEEL_GENERATED + extra,
+        }
+        self.rewritten = config.get(
+            "package_rewritten", ("pyproject.toml", "setup.cfg", "setup.py")
+        )
+        self.max_file_size = config.get("package_max_file_size", 10 << 20)
+        self._digests: Dict[str, str] = {}
+
+    def expected(self, kind: str) -> List[str]:
+        """The tracked files that an archive of ``kind`` should contain."""
+        return sorted(
+            path
+            for path in self.tracked
+            if _matches(path, self.include[kind]) and not _matches(path, self.exclude)
+        )
+
+    def _worktree_digest(self, path: str) -> str:
+        if path not in self._digests:
+            with open(os.path.join(self.root, path), "rb") as stream:
+                self._digests[path] = _hash_stream(stream, float("inf"))[0]
+        return self._digests[path]
+
+    def verify(self, path: str) -> List[str]:
+        """Check one archive; return a list of problems (empty if fine)."""
+        if path.endswith(".whl"):
+            kind, members = "wheel", iter_wheel(path, self.max_file_size)
+        else:
+            kind, members = "sdist", iter_sdist(path, self.max_file_size)
+        expected = set(self.expected(kind))
+        problems, seen = [], set()
+        for name, size, digest in members:
+            seen.add(name)
+            if size > self.max_file_size:
+                problems.append("too large ({0} bytes): {1}".format(size, name))
+            if name in expected:
+                if name in self.rewritten or not os.path.isfile(
+                    os.path.join(self.root, name)
+                ):
+                    continue
+                if digest != self._worktree_digest(name):
+                    problems.append("modified: " + name)
+            elif not _matches(name, self.generated[kind]):
+                problems.append("unexpected: " + name)
+        problems.extend("missing: " + name for name in sorted(expected - seen))
+        return problems
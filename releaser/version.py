@@ -0,0 +1,281 @@
+"""Version numbers as small comparable values, and an index of release tags.
+
+``parse_version()`` turns a string such as "1.2.3rc1" into a Version,
+which compares like PEP 440 says (1.0.dev1 < 1.0a1 < 1.0 < 1.0.post1)
+and is hashable. Parsing is cached, since the same strings are parsed
+again and again.
+
+The TagIndex holds the release tags ("v1.2.3") sorted by version, so
+finding the latest release, checking whether a version was already
+tagged and suggesting the next version are binary searches. The sorted
+list is kept in ``tags.json`` in the ``cache_dir``; on the next run only
+the tags created (or deleted) since are inserted (or removed), so a
+repository with thousands of tags is not sorted again every time.
+"""
+
+import os
+import re
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+VERSION_RE = re.compile(
+    r"""^
+    (?:(?P<epoch>\d+)!)?
+    (?P<release>\d+(?:\.\d+)*)
+    (?:[-_.]?(?P<pre_l>a|b|c|rc|alpha|beta|pre|preview)[-_.]?(?P<pre_n>\d*))?
+    (?:-(?P<post_n1>\d+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?(?P<post_n2>\d*))?
+    (?:[-_.]?dev[-_.]?(?P<dev>\d*))?
+    (?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?
+    $""",
+    re.VERBOSE | re.IGNORECASE,
+)
+PRE_NAMES = {"alpha": "a", "beta": "b", "c": "rc", "pre": "rc", "preview": "rc"}
+PRE_ORDER = {"a": 0, "b": 1, "rc": 2}
+PARTS = ("major", "minor", "patch")
+
+
+class InvalidVersion(ValueError):
+    """The string is not a version number we can compare."""
+
+
+def _number(text: Optional[str]) -> Optional[int]:
+    return None if text is None else int(text or 0)
+
+
+class Version:
+    """An immutable version number; see the module docs."""
+
+    __slots__ = ("text", "epoch", "release", "pre", "post", "dev", "local", "_key")
+
+    def __init__(self, text: str):  # noqa
+        match = VERSION_RE.match(text.strip())
+        if not match:
+            raise InvalidVersion('"{0}" is not a valid version number.'.format(text))
+        pre_l = match.group("pre_l")
+        post = match.group("post_n1")
+        if post is None and match.group("post_l"):
+            post = match.group("post_n2")  # may be "", meaning 0
+        self.text = text.strip()
+        self.epoch = int(match.group("epoch") or 0)
+        self.release: Tuple[int, ...] = tuple(
+            int(n) for n in match.group("release").split(".")
+        )
+        self.pre: Optional[Tuple[str, int]] = None
+        if pre_l:
+            pre_l = pre_l.lower()
+            self.pre = (PRE_NAMES.get(pre_l, pre_l), int(match.group("pre_n") or 0))
+        self.post: Optional[int] = _number(post)
+        self.dev: Optional[int] = _number(match.group("dev"))
+        self.local: Optional[str] = match.group("local")
+        self._key = self._make_key()
+
+    def _make_key(self):
+        release = list(self.release)
+        while len(release) > 1 and release[-1] == 0:
+            release.pop()  # 1.0 == 1.0.0
+        if self.pre is not None:
+            pre: Tuple[int, int] = (PRE_ORDER[self.pre[0]], self.pre[1])
+        elif self.dev is not None and self.post is None:
+            pre = (-1, 0)  # 1.0.dev1 comes before 1.0a1
+        else:
+            pre = (3, 0)
+        post = -1 if self.post is None else self.post
+        dev = (1, 0) if self.dev is None else (0, self.dev)
+        local: Tuple = ()
+        if self.local:
+            local = tuple(
+                (1, int(p), "") if p.isdigit() else (0, 0, p.lower())
+                for p in re.split(r"[-_.]", self.local)
+            )
+        return (self.epoch, tuple(release), pre, post, dev, local)
+
+    @property
+    def is_dev(self) -> bool:
+        return self.dev is not None
+
+    @property
+    def is_prerelease(self) -> bool:
+        return self.pre is not None or self.dev is not None
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return "Version({0!r})".format(self.text)
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key == other._key
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key < other._key
+
+    def __le__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key <= other._key
+
+    def __gt__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key > other._key
+
+    def __ge__(self, other):
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._key >= other._key
+
+    def _prefix(self) -> str:
+        return "{0}!".format(self.epoch) if self.epoch else ""
+
+    def bump(self, part: str = "patch") -> "Version":
+        """Return the next final release: 1.2.3 -> 1.3.0 for "minor"."""
+        index = PARTS.index(part)
+        release = list(self.release) + [0] * (index + 1 - len(self.release))
+        if self.pre is not None or (self.dev is not None and self.post is None):
+            if not any(release[index + 1 :]):
+                # 1.3.0rc1 -> 1.3.0 for "minor", since 1.3.0 is not out yet
+                return parse_version(self._prefix() + _join(release))
+        release[index] += 1
+        release[index + 1 :] = [0] * len(release[index + 1 :])
+        return parse_version(self._prefix() + _join(release))
+
+    def next_dev(self) -> "Version":
+        """The development version after this release.
+
+        1.2.3 -> 1.2.4.dev1; a pre-release 1.3rc1 -> 1.3rc2.dev1.
+        """
+        if self.pre is not None:
+            letter, number = self.pre
+            text = "{0}{1}{2}{3}.dev1".format(
+                self._prefix(), _join(self.release), letter, number + 1
+            )
+        else:
+            release = list(self.release)
+            release[-1] += 1
+            text = self._prefix() + _join(release) + ".dev1"
+        return parse_version(text)
+
+
+def _join(release: Iterable[int]) -> str:
+    return ".".join(str(n) for n in release)
+
+
+@lru_cache(maxsize=4096)
+def parse_version(text: str) -> Version:
+    """Return the Version for ``text``, reusing a previous parse if any."""
+    return Version(text)
+
+
+class TagIndex:
+    """Release tags sorted by version; see the module docs.
+
+    Tags whose name (without ``prefix``) is not a valid version are
+    ignored.
+    """
+
+    def __init__(self, names: Iterable[str] = (), prefix: str = "v"):  # noqa
+        self.prefix = prefix
+        pairs = sorted(
+            (version, name)
+            for version, name in ((self.version_of(n), n) for n in names)
+            if version is not None
+        )
+        self.names: List[str] = [name for _, name in pairs]  # in version order
+        self.versions: List[Version] = [version for version, _ in pairs]
+
+    @classmethod
+    def load(cls, git, config, prefix: str = "v") -> "TagIndex":
+        """Read the tags of ``git`` in one pass, reusing the cached order."""
+        from .cache import JsonCache, cache_dir
+
+        current = set(
+            name[len("refs/tags/") :]
+            for name in git.refs("refs/tags/")
+            if name.startswith("refs/tags/" + prefix)
+        )
+        cache = JsonCache(os.path.join(cache_dir(config), "tags.json"))
+        cached = cache.get("tags", []) if cache.get("prefix") == prefix else []
+        index = cls(prefix=prefix)
+        for name in cached:  # already sorted, so no insort needed
+            if name in current:
+                version = index.version_of(name)
+                if version is not None:
+                    index.names.append(name)
+                    index.versions.append(version)
+        known = set(index.names)
+        added = [name for name in current if name not in known]
+        for name in added:
+            index.add(name)
+        if added or len(index.names) != len(cached):
+            cache["prefix"] = prefix
+            cache["tags"] = index.names
+            cache.save()
+        return index
+
+    def version_of(self, name: str) -> Optional[Version]:
+        """Parse a tag name such as "v1.2.3"; None if it is no release tag."""
+        if not name.startswith(self.prefix):
+            return None
+        try:
+            return parse_version(name[len(self.prefix) :])
+        except InvalidVersion:
+            return None
+
+    def add(self, name: str) -> None:
+        version = self.version_of(name)
+        if version is None:
+            return
+        position = bisect_right(self.versions, version)
+        self.versions.insert(position, version)
+        self.names.insert(position, name)
+
+    def __len__(self):
+        return len(self.versions)
+
+    def tag_for(self, version) -> Optional[str]:
+        """Return the tag of ``version`` (e.g. "v1.0" for "1.0.0") or None."""
+        if isinstance(version, str):
+            version = parse_version(version)
+        position = bisect_left(self.versions, version)
+        if position < len(self.versions) and self.versions[position] == version:
+            return self.names[position]
+        return None
+
+    def exists(self, version) -> bool:
+        """Whether ``version`` (a Version or string) already has a tag."""
+        return self.tag_for(version) is not None
+
+    def latest(self, include_prereleases: bool = False) -> Optional[Version]:
+        """The highest released version, or None if there are no tags."""
+        for version in reversed(self.versions):
+            if include_prereleases or not version.is_prerelease:
+                return version
+        return None
+
+    def previous(self, version) -> Optional[Version]:
+        """The highest tagged version below ``version``."""
+        if isinstance(version, str):
+            version = parse_version(version)
+        position = bisect_left(self.versions, version)
+        return self.versions[position - 1] if position else None
+
+    def newer_than(self, version) -> List[Version]:
+        """Tagged versions above ``version``, lowest first."""
+        if isinstance(version, str):
+            version = parse_version(version)
+        return self.versions[bisect_right(self.versions, version) :]
+
+    def next_version(self, part: str = "patch") -> Version:
+        """Suggest the release after the latest one; 0.1.0 if none."""
+        latest = self.latest(include_prereleases=True)
+        if latest is None:
+            return parse_version("0.1.0")
+        return latest.bump(part)
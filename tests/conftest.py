@@ -0,0 +1,94 @@
+"""Fixtures shared by the tests: throwaway git repositories and releasers."""
+
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+
+from releaser import Releaser
+
+# The stand-in services (package index, CI) live with the benchmarks
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks")
+)
+
+GIT_ENV = dict(
+    GIT_AUTHOR_NAME="Test",
+    GIT_AUTHOR_EMAIL="test@example.com",
+    GIT_COMMITTER_NAME="Test",
+    GIT_COMMITTER_EMAIL="test@example.com",
+    GIT_CONFIG_NOSYSTEM="1",
+)
+PYPROJECT = """[tool.poetry]
+name = "fixture"
+version = "1.0.0.dev1"
+"""
+
+
+def git(*args, cwd=None) -> str:
+    """Run git and return its output, stripped."""
+    return subprocess.run(
+        ("git",) + args,
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """An empty bare repository."""
+    path = tmp_path / "origin.git"
+    git("init", "--quiet", "--bare", "--initial-branch=master", str(path))
+    return path
+
+
+@pytest.fixture
+def repo(tmp_path, origin, monkeypatch):
+    """A repository with one commit, pushed to ``origin``; it is the cwd."""
+    for name, value in GIT_ENV.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setenv("HOME", str(tmp_path))  # no user configuration
+    work = tmp_path / "work"
+    git("clone", "--quiet", str(origin), str(work))
+    git("checkout", "--quiet", "-B", "master", cwd=work)
+    (work / "pyproject.toml").write_text(PYPROJECT)
+    (work / ".gitignore").write_text(
+        "dist/\n*.tmp\n*.tmp.index.json\n.releaser_cache/\n"
+    )
+    git("add", ".", cwd=work)
+    git("commit", "--quiet", "-m", "Initial", cwd=work)
+    git("push", "--quiet", "origin", "master", cwd=work)
+    monkeypatch.chdir(work)
+    return work
+
+
+@pytest.fixture
+def make_releaser():
+    """Return a function that creates a Releaser with test settings."""
+    made = []
+
+    def make(*steps, cls=Releaser, **settings):
+        config = dict(
+            github_user="test",
+            github_repository="fixture",
+            branch="master",
+            version_file="pyproject.toml",
+            log_file="release.log.utf-8.tmp",
+            trace_file="",
+            verbosity="critical",
+            history=False,
+        )
+        config.update(settings)
+        releaser = cls(config, *steps)
+        made.append(releaser)
+        return releaser
+
+    yield make
+    root = logging.getLogger()  # close the log before the directory goes
+    for handler in root.handlers[:]:
+        handler.close()
+        root.removeHandler(handler)
@@ -0,0 +1,106 @@
+"""Tests of CachedBuild and WorktreeBuild."""
+
+import os
+import time
+
+import pytest
+
+from conftest import git
+from releaser import ReleaseStep, StopRelease
+from releaser.cache import cache_dir
+from releaser.steps import CachedBuild, ErrorStep, WorktreeBuild
+
+BUILD = 'mkdir -p dist && cp "café version.txt" dist/out.txt'
+
+
+@pytest.fixture
+def project(repo):
+    (repo / "café version.txt").write_text("1.0.0.dev1\n")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "A version file with an awkward name")
+    return repo
+
+
+def build(make_releaser, step):
+    releaser = make_releaser(step)
+    step()
+    return releaser
+
+
+@pytest.mark.parametrize("cls", [CachedBuild, WorktreeBuild])
+def test_build_uses_the_stamped_file(project, make_releaser, cls):
+    (project / "café version.txt").write_text("1.0.0\n")
+    step = cls(BUILD)
+    build(make_releaser, step)
+    assert step.success
+    assert (project / "dist" / "out.txt").read_text() == "1.0.0\n"
+
+
+@pytest.mark.parametrize("cls", [CachedBuild, WorktreeBuild])
+def test_cache_follows_the_stamped_file(project, make_releaser, cls):
+    for version in ("1.0.0\n", "1.0.1\n", "1.0.0\n"):
+        (project / "café version.txt").write_text(version)
+        build(make_releaser, cls(BUILD))
+        assert (project / "dist" / "out.txt").read_text() == version
+
+
+def test_worktree_is_removed(project, make_releaser):
+    build(make_releaser, WorktreeBuild(BUILD))
+    assert len(git("worktree", "list").splitlines()) == 1
+    assert git("status", "--porcelain") == ""
+
+
+def test_worktree_build_fails_on_a_missing_dirty_file(project, make_releaser):
+    (project / "café version.txt").unlink()
+    step = WorktreeBuild(BUILD)
+    with pytest.raises(StopRelease, match="café version.txt"):
+        build(make_releaser, step)
+    assert len(git("worktree", "list").splitlines()) == 1
+
+
+def test_worktree_build_failure(project, make_releaser):
+    step = WorktreeBuild("exit 3")
+    with pytest.raises(StopRelease, match="code 3"):
+        build(make_releaser, step)
+
+
+class ProvideVersion(ReleaseStep):
+    provides = ("the_version",)
+
+    def __call__(self):  # noqa
+        self._succeed()
+
+
+class Undo(ReleaseStep):
+    rolled_back = False
+
+    def __call__(self):  # noqa
+        self._succeed()
+
+    def rollback(self):
+        Undo.rolled_back = True
+
+
+def test_a_failed_release_stops_the_background_build(
+    project, make_releaser, monkeypatch, caplog
+):
+    monkeypatch.setattr("releaser.bool_input", lambda *a, **kw: True)
+    releaser = make_releaser(
+        Undo,
+        ProvideVersion,
+        WorktreeBuild("sleep 5 && " + BUILD),
+        ErrorStep,
+        journal=False,
+    )
+    started = time.perf_counter()
+    with pytest.raises(SystemExit) as exit:
+        releaser.release()
+    assert exit.value.code == ErrorStep.ERROR_CODE
+    assert time.perf_counter() - started < 3
+    assert Undo.rolled_back
+    # The build was stopped before the rollback began
+    assert 0 < caplog.text.index("Stopping: sleep 5") < caplog.text.index("ROLLBACK")
+    assert "Built" not in caplog.text
+    assert not (project / "dist").exists()
+    assert not os.listdir(cache_dir(releaser.config, "builds"))
+    assert len(git("worktree", "list").splitlines()) == 1
@@ -0,0 +1,173 @@
+"""Tests of the changelog: commit classification, CHANGES.rst and the cache."""
+
+import logging
+import os
+
+import pytest
+
+from conftest import git
+from releaser.cache import JsonCache, cache_dir
+from releaser.changelog import (
+    BREAKING,
+    OTHER,
+    ChangesDocument,
+    classify,
+    start_point,
+    update_changelog,
+)
+from releaser.git import GitRepository
+from releaser.steps import UpdateChangelog
+
+log = logging.getLogger("test")
+
+CHANGES = """\
+=======
+Changes
+=======
+
+Unreleased
+==========
+
+Bug fixes
+---------
+
+- Old fix
+- A fix explained
+  on two lines
+
+Other changes
+-------------
+
+- Something
+
+
+Version 1.0 (2020-01)
+=====================
+
+- First release
+"""
+
+
+@pytest.mark.parametrize(
+    "subject, expected",
+    [
+        ("fix: crash on start", ("Bug fixes", "crash on start")),
+        ("Feat(parser): read TOML", ("Features", "**parser**: read TOML")),
+        ("refactor!: drop Python 2", (BREAKING, "drop Python 2")),
+        ("oops: not a type", (OTHER, "oops: not a type")),
+        ("Update the README", (OTHER, "Update the README")),
+    ],
+)
+def test_classify(subject, expected):
+    assert classify(subject) == expected
+
+
+def test_round_trip():
+    doc = ChangesDocument(CHANGES)
+    assert doc.groups == {
+        "Bug fixes": ["Old fix", "A fix explained\n  on two lines"],
+        "Other changes": ["Something"],
+    }
+    assert doc.render() == CHANGES
+
+
+def test_add_and_rename():
+    doc = ChangesDocument(CHANGES)
+    doc.add({"Bug fixes": ["New fix"], "Features": ["New feature"]})
+    text = doc.render("Version 1.1 (2020-02)")
+    assert text.index("Features") < text.index("Bug fixes")
+    assert "- New fix\n- Old fix\n" in text
+    assert "Unreleased" not in text
+    assert text.endswith(
+        "Version 1.0 (2020-01)\n=====================\n\n- First release\n"
+    )
+
+
+def test_new_section_goes_below_the_title():
+    doc = ChangesDocument("=======\nChanges\n=======\n\n\nVersion 1.0\n===========\n")
+    assert doc.start is None
+    doc.add({OTHER: ["Something"]})
+    assert doc.render().startswith(
+        "=======\nChanges\n=======\n\n\nUnreleased\n==========\n\n"
+        "Other changes\n-------------\n\n- Something\n\n\nVersion 1.0\n"
+    )
+    assert ChangesDocument("").render() == "\n".join(
+        ["Unreleased", "==========", "", "", ""]
+    )
+
+
+def commit(repo, subject):
+    with open(repo / "code.txt", "a") as stream:
+        stream.write(subject + "\n")
+    git("add", "code.txt")
+    git("commit", "--quiet", "-m", subject)
+    return git("rev-parse", "HEAD")
+
+
+def test_start_point(repo):
+    repository = GitRepository(log)
+    first = commit(repo, "fix: one")
+    assert start_point(repository, None) is None
+    git("tag", "v1.0")
+    assert start_point(repository, None) == "v1.0"
+    assert start_point(repository, None, tag_prefix="foo-v") is None
+    commit(repo, "fix: two")
+    assert start_point(repository, first) == first
+    # A commit that is not in the history any more, e.g. after a rebase
+    git("checkout", "--quiet", "-b", "other", "HEAD~2")
+    assert start_point(repository, first) is None
+
+
+class Cache(JsonCache):
+    def __init__(self, path):  # noqa
+        super().__init__(path)
+        self.saved = 0
+
+    def save(self):
+        self.saved += 1
+        super().save()
+
+
+def test_update_changelog_remembers_the_last_commit(repo, monkeypatch):
+    (repo / "CHANGES.rst").write_text(CHANGES)
+    git("add", "CHANGES.rst")
+    git("commit", "--quiet", "-m", "Version 1.0")
+    git("tag", "v1.0")
+    commit(repo, "fix: new fix")
+    head = commit(repo, "Bump version to 1.1.dev1")  # skipped
+    repository = GitRepository(log)
+    cache = Cache(str(repo / "changelog.json.tmp"))
+    assert update_changelog(repository, {}, log, cache) == 1
+    assert cache["last_commit"] == head
+    text = (repo / "CHANGES.rst").read_text()
+    assert "- new fix\n- Old fix\n" in text
+
+    # The next run only reads the commits made since
+    streamed = []
+    original = repository.stream
+    monkeypatch.setattr(
+        repository, "stream", lambda *a: streamed.append(a) or original(*a)
+    )
+    assert update_changelog(repository, {}, log, cache) == 0
+    assert streamed[-1][-1] == head + "..HEAD"
+    assert (repo / "CHANGES.rst").read_text() == text
+    head = commit(repo, "feat: more")
+    assert update_changelog(repository, {}, log, cache, "1.1") == 1
+    assert cache["last_commit"] == head
+    text = (repo / "CHANGES.rst").read_text()
+    assert "Unreleased" not in text and "Version 1.1 (" in text
+    assert cache.saved == 2  # not when there was nothing new
+
+
+def test_rollback_restores_the_file_and_the_cache(repo, make_releaser):
+    (repo / "CHANGES.rst").write_text(CHANGES)
+    commit(repo, "fix: new fix")
+    step = UpdateChangelog()
+    releaser = make_releaser(step)
+    step()
+    assert "new fix" in (repo / "CHANGES.rst").read_text()
+    path = os.path.join(cache_dir(releaser.config), "changelog.json")
+    assert JsonCache(path)["last_commit"] == git("rev-parse", "HEAD")
+    step.rollback()
+    assert (repo / "CHANGES.rst").read_text() == CHANGES
+    assert JsonCache(path) == {}
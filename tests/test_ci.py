@@ -0,0 +1,117 @@
+"""Tests of the CI poller and CheckCI, against a stand-in CI service."""
+
+import logging
+import threading
+import time
+
+import pytest
+
+from fake_ci import FakeCI
+from releaser import StopRelease
+from releaser.ci import CIPoller
+from releaser.steps import CheckCI
+
+log = logging.getLogger("test")
+
+
+@pytest.fixture
+def ci():
+    servers = []
+
+    def start(**kw):
+        servers.append(FakeCI(**kw).start())
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def poller(server, provider="github", stopping=None, **kw):
+    config = dict(
+        ci_provider=provider,
+        ci_api_url=server.url,
+        github_user="test",
+        github_repository="fixture",
+        branch=server.branch,
+        ci_interval=0.1,
+        ci_max_interval=0.2,
+    )
+    config.update(kw)
+    return CIPoller.from_config(config, log, stopping=stopping)
+
+
+@pytest.mark.parametrize("provider", ["github", "travis"])
+def test_waits_for_the_build_with_conditional_requests(ci, provider):
+    server = ci(pending=0.7)
+    status = poller(server, provider).wait()
+    assert status["finished"] and status["passed"]
+    assert server.not_modified >= 1  # the unchanged answers cost nothing
+    assert server.requests >= 3
+
+
+def test_failed_build(ci):
+    status = poller(ci(passed=False)).wait()
+    assert status["finished"] and not status["passed"]
+
+
+class FakeClock:
+    """Stands for the time module in releaser.ci: sleeping takes no time."""
+
+    def __init__(self):  # noqa
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_backoff_until_the_deadline(ci, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("releaser.ci.time", clock)
+    p = poller(ci(pending=60), ci_interval=1, ci_max_interval=4, ci_deadline=20)
+    with pytest.raises(StopRelease, match="still building.*Gave up waiting"):
+        p.wait()
+    assert clock.sleeps == [1, 2, 4, 4, 4, 4, 1]
+
+
+def test_deadline(ci):
+    started = time.monotonic()
+    with pytest.raises(StopRelease, match="Gave up waiting"):
+        poller(ci(pending=60), ci_deadline=0.5).wait()
+    assert time.monotonic() - started < 2
+
+
+def test_stopping_ends_the_wait(ci):
+    stopping = threading.Event()
+    threading.Timer(0.3, stopping.set).start()
+    started = time.monotonic()
+    with pytest.raises(StopRelease, match="Stopped waiting"):
+        poller(ci(pending=60), stopping=stopping, ci_interval=30).wait()
+    assert time.monotonic() - started < 2
+
+
+def test_unreachable_service(ci):
+    server = ci()
+    server.stop()
+    with pytest.raises(StopRelease, match="Could not reach GitHub Actions"):
+        poller(server, ci_deadline=0.3).wait()
+
+
+def test_check_ci_step(repo, make_releaser, ci, caplog):
+    server = ci(passed=False)
+    releaser = make_releaser(
+        CheckCI,
+        journal=False,
+        ci_provider="github",
+        ci_api_url=server.url,
+        ci_interval=0.1,
+    )
+    with pytest.raises(SystemExit) as exit:
+        releaser.release()
+    assert exit.value.code == CheckCI.ERROR_CODE
+    assert 'Last GitHub Actions build on branch "master" failed.' in caplog.text
@@ -0,0 +1,95 @@
+"""Tests of CheckVersionConflicts, with a bare origin and a stub index."""
+
+import socket
+
+import pytest
+
+from conftest import git
+from fake_index import FakeIndex
+from releaser import ReleaseStep
+from releaser.steps import CheckVersionConflicts, Shell
+
+
+class SetTheVersion(ReleaseStep):
+    provides = ("the_version",)
+
+    def __call__(self):  # noqa
+        self.releaser.the_version = "1.0.0"
+        self._succeed()
+
+
+class Publish(ReleaseStep):
+    """Stands for an upload: the first irreversible step."""
+
+    irreversible = True
+    ran = False
+
+    def __call__(self):  # noqa
+        Publish.ran = True
+        self._succeed()
+
+
+@pytest.fixture
+def index():
+    Publish.ran = False
+    server = FakeIndex().start()
+    yield server
+    server.stop()
+
+
+def release(make_releaser, index, **settings):
+    config = dict(
+        journal=False,
+        repository_url=index.url + "/legacy/",
+        index_url=index.url + "/pypi",
+    )
+    config.update(settings)
+    releaser = make_releaser(
+        SetTheVersion,
+        CheckVersionConflicts,
+        Shell("sleep 0.2"),  # runs while the check is in the background
+        Publish,
+        **config
+    )
+    try:
+        releaser.release()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_no_conflicts(repo, make_releaser, index):
+    assert release(make_releaser, index) == 0
+    assert Publish.ran
+
+
+def test_tag_on_the_remote(repo, make_releaser, index, caplog):
+    git("tag", "v1.0.0")
+    git("push", "--quiet", "origin", "v1.0.0")
+    git("tag", "-d", "v1.0.0")  # so only the remote has it
+    assert release(make_releaser, index) == CheckVersionConflicts.ERROR_CODE
+    assert not Publish.ran
+    assert "The tag v1.0.0 exists on the remote." in caplog.text
+
+
+def test_version_on_the_index(repo, make_releaser, index, caplog):
+    index.releases[("fixture", "1.0.0")] = {"fixture-1.0.0.tar.gz": "0" * 64}
+    assert release(make_releaser, index) == CheckVersionConflicts.ERROR_CODE
+    assert not Publish.ran
+    assert "The index already has fixture 1.0.0" in caplog.text
+
+
+def test_unreachable_services_only_warn(repo, make_releaser, index, caplog):
+    git("remote", "set-url", "origin", str(repo / "nowhere"))
+    url = "http://127.0.0.1:{0}/pypi".format(closed_port())
+    code = release(make_releaser, index, index_url=url, upload_retries=0)
+    assert code == 0
+    assert Publish.ran
+    assert "Could not list the tags" in caplog.text
+    assert "Could not query " + url in caplog.text
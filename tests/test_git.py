@@ -0,0 +1,117 @@
+"""Tests of the *git* module, which reads and runs git for the steps."""
+
+import logging
+import os
+
+import pytest
+
+from conftest import git
+from releaser.artifacts import BuildCache
+from releaser.git import GitError, GitRepository, parse_status
+
+log = logging.getLogger("test")
+
+
+@pytest.fixture
+def repository(repo):
+    for name in ("café.txt", "my file.txt", "old name.txt", "plain.txt"):
+        (repo / name).write_text("original\n")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "Files with awkward names")
+    return GitRepository(log)
+
+
+def test_parse_status():
+    output = (
+        "1 .M N... 100644 100644 100644 abc abc my file.txt\0"
+        "2 R. N... 100644 100644 100644 abc abc R100 new name.txt\0old name.txt\0"
+        "u UU N... 100644 100644 100644 100644 a b c conflict.txt\0"
+    )
+    assert parse_status(output) == ["my file.txt", "new name.txt", "conflict.txt"]
+
+
+def test_dirty_files_are_real_paths(repository, repo):
+    assert repository.dirty_files() == []
+    (repo / "café.txt").write_text("changed\n")
+    (repo / "my file.txt").write_text("changed\n")
+    git("mv", "old name.txt", "new name.txt")
+    assert sorted(repository.dirty_files()) == [
+        "café.txt",
+        "my file.txt",
+        "new name.txt",
+    ]
+
+
+def test_build_key_follows_awkward_names(repository, repo):
+    (repo / "café.txt").write_text("changed\n")
+    first = BuildCache.key(repository, "poetry build")
+    (repo / "café.txt").write_text("changed again\n")
+    assert BuildCache.key(repository, "poetry build") != first
+
+
+def test_refs_and_tags(repository):
+    git("tag", "v1.0")
+    git("tag", "-a", "v1.1", "-m", "Version 1.1")
+    assert repository.tags() == ["v1.0", "v1.1"]
+    assert repository.current_branch() == "master"
+    assert repository.head_commit() == git("rev-parse", "HEAD")
+    repository.delete_tags(["v1.0", "v1.1"])
+    assert repository.tags() == []
+
+
+def test_packed_refs(repository):
+    git("tag", "v1.0")
+    git("tag", "v1.1")
+    git("pack-refs", "--all")
+    git("tag", "-f", "v1.1", "HEAD~1")  # a loose ref shadows the packed one
+    refs = repository.refs("refs/tags/")
+    assert refs == {
+        "refs/tags/v1.0": git("rev-parse", "HEAD"),
+        "refs/tags/v1.1": git("rev-parse", "HEAD~1"),
+    }
+    assert repository.head_commit() == git("rev-parse", "HEAD")
+
+
+def test_detached_head(repository):
+    git("checkout", "--quiet", "--detach", "HEAD~1")
+    assert repository.symbolic_ref() is None
+    assert repository.current_branch() is None
+    assert repository.head_commit() == git("rev-parse", "HEAD")
+
+
+def test_update_refs_is_atomic(repository):
+    git("tag", "v1.0")
+    head = git("rev-parse", "HEAD")
+    instructions = ["create refs/tags/v2.0 " + head, "create refs/tags/v1.0 " + head]
+    with pytest.raises(GitError, match="update-ref"):  # v1.0 already exists
+        repository.update_refs(instructions)
+    assert repository.tags() == ["v1.0"]
+
+
+def test_tracked_files_and_tree(repository):
+    assert "café.txt" in repository.tracked_files()
+    assert repository.tree_id() == git("rev-parse", "HEAD^{tree}")
+
+
+def test_worktree(repository, repo):
+    (repo / "plain.txt").write_text("uncommitted\n")
+    with repository.worktree() as path:
+        with open(os.path.join(path, "plain.txt")) as stream:
+            assert stream.read() == "original\n"
+        assert os.path.isfile(os.path.join(path, ".git"))
+        assert GitRepository(log, path).common_dir == repository.common_dir
+    assert not os.path.exists(path)
+    assert "releaser-worktree" not in git("worktree", "list")
+
+
+def test_stream(repository):
+    lines = repository.stream("log", "--format=%s")
+    assert next(lines) == "Files with awkward names"
+    lines.close()  # git is stopped early
+    with pytest.raises(GitError, match="git log"):
+        list(repository.stream("log", "no-such-branch"))
+
+
+def test_not_a_repository(tmp_path):
+    with pytest.raises(GitError, match="Not inside a git repository"):
+        GitRepository(log, str(tmp_path))
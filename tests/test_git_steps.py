@@ -0,0 +1,129 @@
+"""Tests of the git steps, against a local bare repository as origin."""
+
+import pytest
+
+from conftest import git
+from releaser.git_steps import GitPush, GitPushTags, GitTag
+
+
+def remote_refs(origin):
+    output = git("ls-remote", str(origin))
+    return {line.split("\t")[1]: line.split("\t")[0] for line in output.splitlines()}
+
+
+@pytest.fixture
+def releaser(repo, make_releaser):
+    """A releaser whose version is set, with a new commit to push."""
+    (repo / "pyproject.toml").write_text('[tool.poetry]\nversion = "1.0.0"\n')
+    git("commit", "--quiet", "-am", "Version 1.0.0")
+    releaser = make_releaser()
+    releaser._the_version = "1.0.0"
+    releaser.rewindable, releaser.non_rewindable = [], []  # as in release()
+    return releaser
+
+
+def run(releaser, step):
+    releaser._bind(step)()
+    return step
+
+
+def count_git_runs(releaser, monkeypatch):
+    calls = []
+    run_git = releaser.git.run
+
+    def counting(*args, **kw):
+        calls.append(args)
+        return run_git(*args, **kw)
+
+    monkeypatch.setattr(releaser.git, "run", counting)
+    return calls
+
+
+def test_tag_and_rollback_in_one_process(releaser, monkeypatch):
+    tag = run(releaser, GitTag())
+    assert releaser.created_tags == ["v1.0.0"]
+    assert git("tag") == "v1.0.0"
+    calls = count_git_runs(releaser, monkeypatch)
+    tag.rollback()
+    assert git("tag") == ""
+    assert calls == [("update-ref", "--stdin")]
+
+
+def test_push_branch_and_tags_at_once(releaser, origin):
+    run(releaser, GitTag())
+    git("tag", "extra")
+    releaser.created_tags.append("extra")
+    push = run(releaser, GitPush())
+    assert push.success
+    assert push.last_result.command == [
+        "git",
+        "push",
+        "--atomic",
+        "origin",
+        "refs/heads/master",
+        "refs/tags/v1.0.0",
+        "refs/tags/extra",
+    ]
+    refs = remote_refs(origin)
+    assert refs["refs/heads/master"] == git("rev-parse", "HEAD")
+    assert refs["refs/tags/v1.0.0"] == git("rev-parse", "v1.0.0")
+    assert "refs/tags/extra" in refs
+    assert releaser.pushed_tags == ["v1.0.0", "extra"]
+
+
+def test_push_is_atomic(releaser, origin):
+    git("tag", "v1.0.0", "HEAD^")  # a conflicting tag reaches the remote
+    git("push", "--quiet", "origin", "v1.0.0")
+    git("tag", "-d", "v1.0.0")
+    run(releaser, GitTag())
+    push = run(releaser, GitPush())  # does not stop the release
+    assert push.success is False
+    refs = remote_refs(origin)
+    assert refs["refs/heads/master"] == git("rev-parse", "HEAD^")  # not moved
+    assert releaser.pushed_tags == []
+
+
+def test_push_tags_skips_those_pushed(releaser, origin):
+    run(releaser, GitTag())
+    run(releaser, GitPush())
+    git("tag", "later")
+    releaser.created_tags.append("later")
+    push_tags = run(releaser, GitPushTags())
+    assert push_tags.pushed == ["later"]
+    assert push_tags.last_result.command == [
+        "git",
+        "push",
+        "--atomic",
+        "origin",
+        "refs/tags/later",
+    ]
+    assert "refs/tags/later" in remote_refs(origin)
+
+
+def test_nothing_left_to_push(releaser):
+    run(releaser, GitTag())
+    run(releaser, GitPush())
+    push_tags = run(releaser, GitPushTags())
+    assert push_tags.success
+    assert push_tags.last_result is None  # ran nothing
+
+
+def test_push_tags_rollback_in_one_push(releaser, origin):
+    run(releaser, GitTag())
+    git("tag", "other")
+    releaser.created_tags.append("other")
+    push_tags = run(releaser, GitPushTags())
+    assert {"refs/tags/v1.0.0", "refs/tags/other"} <= set(remote_refs(origin))
+    push_tags.rollback()
+    assert push_tags.last_result.command == [
+        "git",
+        "push",
+        "--atomic",
+        "origin",
+        "--delete",
+        "refs/tags/v1.0.0",
+        "refs/tags/other",
+    ]
+    refs = remote_refs(origin)
+    assert "refs/tags/v1.0.0" not in refs and "refs/tags/other" not in refs
+    assert releaser.pushed_tags == []
@@ -0,0 +1,135 @@
+"""Tests of the *history* module and of Releaser.plan(), which reads it."""
+
+import sqlite3
+
+import pytest
+
+from releaser import ReleaseStep, StopRelease
+from releaser.history import Estimate, History, keys
+from releaser.tracing import Span, Tracer
+
+
+class Step(ReleaseStep):
+    fail = False
+
+    def __init__(self, name, **attributes):  # noqa
+        self.name = name
+        self.__dict__.update(attributes)
+
+    def __call__(self):  # noqa
+        if self.fail:
+            raise StopRelease("Failing on purpose")
+        self._succeed()
+
+    def __str__(self):
+        return self.name
+
+    def describe(self):
+        return "Do " + self.name
+
+
+def test_keys():
+    assert keys(["a", "b", "a", "a"]) == [("a", 1), ("b", 1), ("a", 2), ("a", 3)]
+
+
+@pytest.mark.parametrize(
+    "estimate, regressed",
+    [
+        (Estimate(10.0, 3, 16.0), True),
+        (Estimate(10.0, 3, 14.0), False),  # less than 50% slower
+        (Estimate(1.0, 3, 1.9), False),  # less than 1 s slower
+        (Estimate(10.0, 2, 30.0), False),  # too few runs to tell
+    ],
+)
+def test_regressed(estimate, regressed):
+    assert estimate.regressed is regressed
+
+
+def tracer_with(*spans):
+    """A Tracer holding step spans given as (position, start, wall)."""
+    tracer = Tracer()
+    for position, start, wall in spans:
+        tracer.spans.append(
+            Span("step", "step", start, wall, position=position, success=True)
+        )
+    return tracer
+
+
+def test_record_and_estimate(tmp_path):
+    history = History({"history_runs": 3}, path=str(tmp_path / "h.sqlite3"))
+    names = ["step", "other", "step"]
+    assert history.estimates(names) == [None] * 3  # no database yet
+    # Occurrences follow the order of the steps, not the order they ran in
+    for wall in (1.0, 2.0, 3.0, 9.0):
+        history.record(tracer_with((2, 0.0, wall), (0, 5.0, 0.5)), names, "1.0", True)
+    first, other, second = history.estimates(names)
+    assert first == Estimate(0.5, 3, 0.5)
+    assert other is None
+    assert second == Estimate(3.0, 3, 9.0)  # the median of the latest 3 runs
+    assert second.regressed
+
+
+def test_failed_steps_are_not_estimates(tmp_path):
+    history = History({}, path=str(tmp_path / "h.sqlite3"))
+    tracer = tracer_with((0, 0.0, 1.0))
+    tracer.spans[0].args["error"] = "Failing on purpose"
+    history.record(tracer, ["step"], None, False)
+    assert history.estimates(["step"]) == [None]
+
+
+def occurrences(releaser):
+    """Return the occurrences of the step "twice" recorded by each run."""
+    db = sqlite3.connect(History(releaser.config).path)
+    try:
+        rows = db.execute(
+            "SELECT run_id, occurrence FROM step_times WHERE step = 'twice'"
+            " ORDER BY run_id, occurrence"
+        ).fetchall()
+    finally:
+        db.close()
+    result = {}
+    for run_id, occurrence in rows:
+        result.setdefault(run_id, []).append(occurrence)
+    return list(result.values())
+
+
+def test_resumed_release_keeps_occurrences(repo, make_releaser):
+    flaky = Step("flaky", fail=True)
+    steps = [Step("twice"), flaky, Step("twice")]
+    releaser = make_releaser(*steps, history=True)
+    with pytest.raises(SystemExit):
+        releaser.release()
+    flaky.fail = False
+    releaser = make_releaser(*steps, history=True)
+    releaser.release(resume=True)  # runs flaky and the second "twice"
+    assert occurrences(releaser) == [[1], [2]]
+
+
+def test_plan(repo, make_releaser, caplog):
+    steps = [
+        Step("slow"),
+        Step("check", parallel_safe=True),
+        Step("lint", parallel_safe=True),
+        Step("ci", parallel_safe=True, background=True),
+        Step("upload", irreversible=True),
+    ]
+    releaser = make_releaser(*steps, history=True)
+    assert releaser.plan() == 0
+    assert "Estimated duration: 0.0s (plus 5 step(s) never measured)" in caplog.text
+    names = [str(s) for s in steps]
+    tracer = tracer_with(*[(i, 0.0, 2.0) for i in range(5)])
+    for _ in range(2):
+        History(releaser.config).record(tracer, names, "1.0", True)
+    tracer.spans[0].wall = 5.0  # the latest run of "slow" regressed
+    History(releaser.config).record(tracer, names, "1.0", True)
+    caplog.clear()
+    # slow, then check and lint together; ci runs in the background
+    assert releaser.plan() == pytest.approx(2.0 + 2.0 + 2.0)
+    lines = caplog.text.splitlines()
+    assert any("slow" in line and "SLOWER last time: 5.00s" in line for line in lines)
+    assert any("check" in line and "concurrent" in line for line in lines)
+    assert any("ci" in line and "background" in line for line in lines)
+    assert any("upload" in line and "irreversible" in line for line in lines)
+    assert "       Do upload" in caplog.text
+    assert "Estimated duration: 6.0s" in caplog.text
+    assert "never measured" not in caplog.text
@@ -0,0 +1,7 @@
+"""Importing releaser must stay cheap; see benchmarks/check_import_time.py."""
+
+import check_import_time
+
+
+def test_import_time_and_lazy_imports(capsys):
+    assert check_import_time.main([]) == 0, capsys.readouterr().out
@@ -0,0 +1,128 @@
+"""Tests of the *journal* module: resuming a release that failed."""
+
+import pytest
+
+from releaser import ReleaseStep, StopRelease
+
+
+class Ok(ReleaseStep):
+    def __init__(self, name="Ok"):  # noqa
+        self.name = name
+
+    def __call__(self):  # noqa
+        self.releaser.ran.append(self.name)
+        self._succeed()
+
+    def __str__(self):
+        return self.name
+
+
+class Fail(Ok):
+    fail = True
+
+    def __call__(self):  # noqa
+        self.releaser.ran.append(self.name)
+        if Fail.fail:
+            raise StopRelease("Failing on purpose")
+        self._succeed()
+
+
+class Background(Ok):
+    """While Fail fails, finishes only when the release is stopping."""
+
+    background = True
+
+    def __call__(self):  # noqa
+        self.releaser.ran.append(self.name)
+        if Fail.fail:  # like a slow CI check
+            self.releaser.stopping.wait(10)
+        self._succeed()
+
+
+class QuickBackground(Ok):
+    background = True
+
+
+def release(releaser, resume=False):
+    releaser.ran = []
+    try:
+        releaser.release(resume=resume)
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+@pytest.fixture
+def fail_once():
+    Fail.fail = True
+    yield
+    Fail.fail = True
+
+
+def steps():
+    return [Ok("First"), Fail("Fail"), Ok("Last")]
+
+
+def test_resume_after_the_last_completed_step(repo, make_releaser, fail_once):
+    assert release(make_releaser(*steps())) == 1
+    Fail.fail = False
+    releaser = make_releaser(*steps())
+    assert release(releaser, resume=True) == 0
+    assert releaser.ran == ["Fail", "Last"]
+
+
+def test_nothing_to_resume(repo, make_releaser):
+    releaser = make_releaser(*steps())
+    assert release(releaser, resume=True) == 1
+    assert releaser.ran == []
+
+
+def test_nothing_to_resume_after_a_successful_release(repo, make_releaser):
+    assert release(make_releaser(Ok("First"), Ok("Last"))) == 0
+    releaser = make_releaser(Ok("First"), Ok("Last"))
+    assert release(releaser, resume=True) == 1
+    assert releaser.ran == []
+
+
+def test_resume_refuses_different_steps(repo, make_releaser, fail_once):
+    assert release(make_releaser(*steps())) == 1
+    releaser = make_releaser(Ok("Other"), Fail("Fail"), Ok("Last"))
+    assert release(releaser, resume=True) == 1
+    assert releaser.ran == []
+
+
+def test_resume_refuses_a_changed_repository(repo, make_releaser, fail_once):
+    from conftest import git
+
+    assert release(make_releaser(*steps())) == 1
+    (repo / "new.txt").write_text("new")
+    git("add", "new.txt")
+    git("commit", "--quiet", "-m", "Moved HEAD")
+    releaser = make_releaser(*steps())
+    assert release(releaser, resume=True) == 1
+    assert releaser.ran == []
+
+
+def test_unfinished_background_step_runs_again(repo, make_releaser, fail_once):
+    def background_steps():
+        return [Ok("First"), Background("Bg"), Ok("Ok"), Fail("Fail"), Ok("Ok2")]
+
+    releaser = make_releaser(*background_steps())
+    assert release(releaser) == 1
+    assert releaser.ran == ["First", "Bg", "Ok", "Fail"]
+    Fail.fail = False
+    releaser = make_releaser(*background_steps())
+    assert release(releaser, resume=True) == 0
+    assert releaser.ran[0] == "Bg"  # not skipped
+    assert sorted(releaser.ran) == ["Bg", "Fail", "Ok", "Ok2"]
+
+
+def test_finished_background_step_is_recorded(repo, make_releaser, fail_once):
+    def background_steps():
+        return [Ok("First"), QuickBackground("Bg"), Ok("Ok"), Fail("Fail")]
+
+    assert release(make_releaser(*background_steps())) == 1
+    Fail.fail = False
+    releaser = make_releaser(*background_steps())
+    assert release(releaser, resume=True) == 0
+    assert releaser.ran == ["Fail"]
@@ -0,0 +1,77 @@
+"""Tests of the *logs* module: the release log and its per-step index."""
+
+import logging
+
+import pytest
+
+from releaser import ReleaseStep, StopRelease
+from releaser.logs import step_log
+
+LOG = "release.log.utf-8.tmp"
+
+
+class Talk(ReleaseStep):
+    def __call__(self):  # noqa
+        self.log.info("Talking to the log")
+        self._execute("echo from a command")
+        self._succeed()
+
+
+class Fail(ReleaseStep):
+    def __call__(self):  # noqa
+        self.log.info("About to fail")
+        raise StopRelease("Failing on purpose")
+
+
+def close_log():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        handler.close()
+        root.removeHandler(handler)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_step_log(repo, make_releaser, compress):
+    releaser = make_releaser(Talk, Fail, journal=False, log_compress=compress)
+    with pytest.raises(SystemExit):
+        releaser.release()
+    close_log()  # writes the index
+    path = LOG + ".gz" if compress else LOG
+    talk = step_log(path, "Talk")
+    assert "Talking to the log" in talk
+    assert "from a command" in talk  # logged by another thread
+    assert "About to fail" not in talk
+    assert "About to fail" in step_log(path, "Fail")
+    with pytest.raises(KeyError):
+        step_log(path, "Nothing")
+
+
+@pytest.mark.parametrize("command", [["plan"], ["log", "Fail"]])
+def test_other_commands_keep_the_log(repo, make_releaser, command, capsys):
+    with pytest.raises(SystemExit):
+        make_releaser(Talk, Fail, journal=False).release()
+    close_log()
+    make_releaser(Talk, Fail, journal=False).run(command)
+    close_log()
+    assert "About to fail" in step_log(LOG, "Fail")
+    make_releaser(Talk, Fail, journal=False).run(["log", "Fail"])
+    assert "About to fail" in capsys.readouterr().out
+
+
+def test_synchronous_log(repo, make_releaser):
+    releaser = make_releaser(Talk, journal=False, log_async=False)
+    releaser.release()
+    close_log()
+    with open(LOG, encoding="utf-8") as stream:
+        assert "from a command" in stream.read()
+
+
+@pytest.mark.parametrize("settings", [{}, {"log_async": False}, {"log_max_bytes": 1e6}])
+def test_each_release_starts_a_new_log(repo, make_releaser, settings):
+    (repo / LOG).write_text("From an older release\n")
+    make_releaser(Talk, journal=False, **settings).release()
+    close_log()
+    with open(LOG, encoding="utf-8") as stream:
+        text = stream.read()
+    assert "Talking to the log" in text
+    assert "From an older release" not in text
@@ -0,0 +1,139 @@
+"""Tests of BatchReleaser, ForEachPackage and the settings of each package."""
+
+import pytest
+
+from conftest import git
+from releaser import ReleaseStep, StopRelease
+from releaser.monorepo import BatchReleaser, ForEachPackage, package_config
+
+PACKAGES = [
+    dict(name="foo", path="packages/foo"),
+    dict(name="bar", path="packages/bar"),
+]
+
+
+def test_package_config():
+    config = dict(
+        branch="master",
+        version_file="pyproject.toml",
+        version_files=["setup.py", ("docs/conf.py", "release")],
+        packages=PACKAGES,
+    )
+    result = package_config(config, dict(PACKAGES[0], dist_dir="build/dist"))
+    assert "packages" not in result
+    assert result["branch"] == "master"
+    assert result["cwd"] == "packages/foo"
+    assert result["version_file"] == "packages/foo/pyproject.toml"
+    assert result["dist_dir"] == "packages/foo/build/dist"
+    assert result["changes_file"] == "packages/foo/CHANGES.rst"
+    assert result["version_files"] == [
+        "packages/foo/setup.py",
+        ("packages/foo/docs/conf.py", "release"),
+    ]
+    assert result["cache_dir"] == ".releaser_cache/packages/foo"
+    assert result["github_repository"] == "foo"
+    assert result["tag_format"] == "{name}-v{version}"
+    # The shared config is left alone
+    assert config["version_file"] == "pyproject.toml"
+
+
+def test_package_config_overrides():
+    config = dict(tag_format="v{version}", github_repository="mono")
+    package = dict(PACKAGES[1], github_repository="bar-py", version_file=None)
+    result = package_config(config, package)
+    assert result["github_repository"] == "bar-py"
+    assert result["tag_format"] == "v{version}"
+    assert result["version_file"] is None
+
+
+class Step(ReleaseStep):
+    """Records what it did and undid, in a list shared by its copies."""
+
+    per_package = True
+    ERROR_CODE = 7
+
+    def __init__(self, name, events):  # noqa
+        self.name = name
+        self.events = events
+
+    def __str__(self):
+        return self.name
+
+    def __call__(self):  # noqa
+        if self.name in self.config.get("fail", ()):
+            raise StopRelease("{0} failed".format(self.name))
+        self.events.append("{0} {1}".format(self.name, self.releaser.name))
+        self._succeed()
+
+    def rollback(self):
+        self.events.append("undo {0} {1}".format(self.name, self.releaser.name))
+
+
+def batch(make_releaser, *steps, **settings):
+    return make_releaser(
+        *steps, cls=BatchReleaser, packages=PACKAGES, journal=False, **settings
+    )
+
+
+def test_batch_releaser(repo, make_releaser):
+    with pytest.raises(ValueError, match="packages"):
+        make_releaser(cls=BatchReleaser)
+    shared = Step("shared", [])
+    shared.per_package = False
+    releaser = batch(make_releaser, shared, Step("each", []))
+    assert releaser.instances[0] is shared
+    assert isinstance(releaser.instances[1], ForEachPackage)
+    assert str(releaser.instances[1]) == "each (each package)"
+    assert [p.name for p in releaser.packages] == ["foo", "bar"]
+    assert releaser.tag_name("1.0") == "<name>-v1.0"
+    assert releaser.packages[1].tag_prefix() == "bar-v"
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_a_step_failing_for_one_package(repo, make_releaser, monkeypatch, parallel):
+    monkeypatch.setattr("releaser.bool_input", lambda *a, **kw: True)
+    events = []
+    packages = [PACKAGES[0], dict(PACKAGES[1], fail=["second"])]
+    releaser = make_releaser(
+        Step("first", events),
+        Step("second", events),
+        Step("third", events),
+        cls=BatchReleaser,
+        packages=packages,
+        journal=False,
+        parallel_steps=parallel,
+    )
+    with pytest.raises(SystemExit) as exit:
+        releaser.release()
+    assert exit.value.code == Step.ERROR_CODE
+    assert sorted(events[:2]) == ["first bar", "first foo"]
+    # "second" is undone for foo at once, then the release rolls back
+    assert events[2:] == [
+        "second foo",
+        "undo second foo",
+        "undo first bar",
+        "undo first foo",
+    ]
+    assert "third" not in " ".join(events)
+
+
+def test_changelog_of_each_package(repo, make_releaser):
+    for package in PACKAGES:
+        directory = repo / package["path"]
+        directory.mkdir(parents=True)
+        (directory / "CHANGES.rst").write_text("Changes\n=======\n")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "Add the packages")
+    git("tag", "foo-v1.0")
+    git("tag", "bar-v1.0")
+    for package, subject in (("foo", "feat: foo can fly"), ("bar", "fix: bar")):
+        (repo / "packages" / package / "code.txt").write_text(subject)
+        git("add", ".")
+        git("commit", "--quiet", "-m", subject)
+    batch(make_releaser).run(["changelog"])
+    foo = (repo / "packages/foo/CHANGES.rst").read_text()
+    assert "Features\n--------\n\n- foo can fly\n" in foo
+    assert "bar" not in foo and "Add the packages" not in foo
+    bar = (repo / "packages/bar/CHANGES.rst").read_text()
+    assert "Bug fixes\n---------\n\n- bar\n" in bar
+    assert "foo" not in bar and "Add the packages" not in bar
@@ -0,0 +1,107 @@
+"""Tests of ParallelShell and run_concurrently."""
+
+import logging
+import time
+
+import pytest
+
+from releaser import StepTimeout, StopRelease
+from releaser.process import run_concurrently
+from releaser.steps import ParallelShell
+
+log = logging.getLogger("test")
+IGNORES_TERM = "trap '' TERM; sleep 8"
+
+
+def test_jobs_expand_shards_and_get_unique_names():
+    step = ParallelShell(
+        "flake8 .", ("tests", "pytest --splits {shards} --group {shard}"), "flake8 x"
+    )
+    step.shards = 3
+    assert step.jobs() == [
+        ("flake8", "flake8 ."),
+        ("tests#1", "pytest --splits 3 --group 1"),
+        ("tests#2", "pytest --splits 3 --group 2"),
+        ("tests#3", "pytest --splits 3 --group 3"),
+        ("flake8(2)", "flake8 x"),
+    ]
+
+
+def test_results_in_order():
+    results = run_concurrently(
+        [("[a] ", "sleep 0.2; echo a"), ("[b] ", "echo b; exit 3")],
+        log,
+        max_workers=2,
+        fail_fast=False,
+    )
+    assert [(r.return_code, r.stdout) for r in results] == [(0, "a"), (3, "b")]
+    assert not any(r.stopped or r.timed_out for r in results)
+
+
+@pytest.mark.parametrize("workers, minimum, maximum", [(1, 0.6, 5), (3, 0, 0.55)])
+def test_max_workers(workers, minimum, maximum):
+    started = time.perf_counter()
+    results = run_concurrently([("", "sleep 0.2")] * 3, log, max_workers=workers)
+    assert minimum <= time.perf_counter() - started < maximum
+    assert [r.return_code for r in results] == [0, 0, 0]
+
+
+def test_fail_fast_stops_the_others():
+    started = time.perf_counter()
+    results = run_concurrently(
+        [("", "sleep 0.2; exit 1"), ("", "sleep 8"), ("", "echo never")],
+        log,
+        max_workers=2,
+    )
+    assert time.perf_counter() - started < 3
+    assert results[0].return_code == 1 and not results[0].stopped
+    assert results[1].stopped
+    assert results[2] is None  # did not start
+
+
+def test_fail_fast_kills_a_command_that_ignores_sigterm():
+    started = time.perf_counter()
+    results = run_concurrently(
+        [("", "sleep 0.2; exit 1"), ("", IGNORES_TERM)], log, max_workers=2, grace=0.5
+    )
+    assert time.perf_counter() - started < 3
+    assert results[1].stopped
+    assert results[1].return_code == -9
+
+
+def test_timeout_kills_a_command_that_ignores_sigterm():
+    started = time.perf_counter()
+    results = run_concurrently([("", IGNORES_TERM)], log, timeout=0.3, grace=0.5)
+    assert time.perf_counter() - started < 3
+    assert results[0].timed_out and not results[0].stopped
+
+
+def run(make_releaser, step, **settings):
+    releaser = make_releaser(**settings)
+    releaser._bind(step)()
+    return step
+
+
+def test_step_reports_the_stopped_commands(repo, make_releaser, caplog):
+    step = ParallelShell(
+        ("fails", "sleep 0.2; exit 1"), ("stubborn", IGNORES_TERM), max_workers=2
+    )
+    with pytest.raises(StopRelease, match=r"Failed: fails \(then stopped: stubborn\)"):
+        run(make_releaser, step, kill_grace=0.5)
+    assert "[stubborn] was stopped" in caplog.text
+    assert "[stubborn] passed" not in caplog.text
+
+
+def test_step_passes(repo, make_releaser, caplog):
+    step = run(make_releaser, ParallelShell("true", "echo hi", shards=2))
+    assert step.success
+    assert "[true] passed" in caplog.text
+    assert "[echo] passed" in caplog.text
+
+
+def test_step_timeout(repo, make_releaser):
+    step = ParallelShell(("slow", IGNORES_TERM), timeout=0.3)
+    step.deadline = time.perf_counter() + 0.3
+    with pytest.raises(StepTimeout, match="stopped: slow"):
+        releaser = make_releaser(kill_grace=0.5)
+        releaser._bind(step)()
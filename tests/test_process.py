@@ -0,0 +1,126 @@
+"""Tests of the *process* module, which streams the output of commands."""
+
+import sys
+import threading
+import time
+
+from releaser.process import MAX_LINE, run_command
+
+PYTHON = '"{0}" -c'.format(sys.executable)
+
+
+class Log:
+    """Counts what a command logs, instead of keeping megabytes of it."""
+
+    def __init__(self):  # noqa
+        self.records = {"debug": 0, "error": 0}
+        self.lines = {"debug": [], "error": []}
+
+    def _emit(self, level, text):
+        self.records[level] += 1
+        if len(self.lines[level]) < 100:
+            self.lines[level].extend(text.split("\n"))
+
+    def debug(self, text):
+        self._emit("debug", text)
+
+    def error(self, text):
+        self._emit("error", text)
+
+
+def python(code, **kw):
+    return run_command("{0} '{1}'".format(PYTHON, code), Log(), **kw)
+
+
+def test_output_and_tails():
+    log = Log()
+    result = run_command(
+        "for i in 1 2 3 4 5; do echo out $i; echo err $i >&2; done; exit 3",
+        log,
+        tail_lines=2,
+    )
+    assert result.return_code == 3
+    assert result.stdout == "out 4\nout 5"
+    assert result.stderr == "err 4\nerr 5"
+    assert result.text == "out 4\nout 5err 4\nerr 5"
+    assert result.truncated
+    assert result.stdout_bytes == result.stderr_bytes == 30
+    assert result.output_bytes == 60
+    assert log.lines["debug"] == ["out {0}".format(i) for i in range(1, 6)]
+    assert log.lines["error"] == ["err {0}".format(i) for i in range(1, 6)]
+    assert not run_command("echo hi", log).truncated
+
+
+def test_large_output_on_both_streams():
+    # Far more than a pipe buffer on each stream, written alternately:
+    # reading one pipe after the other would deadlock.
+    code = (
+        "import sys\n"
+        "for i in range(20000):\n"
+        '    sys.stdout.write(100 * "o" + "\\n")\n'
+        '    sys.stderr.write(100 * "e" + "\\n")\n'
+    )
+    started = time.perf_counter()
+    result = python(code, tail_lines=3)
+    assert time.perf_counter() - started < 20
+    assert result.return_code == 0
+    assert result.stdout_bytes == result.stderr_bytes == 20000 * 101
+    assert result.stdout.splitlines() == ["o" * 100] * 3
+    assert result.truncated
+
+
+def test_logging_is_per_chunk():
+    log = Log()
+    run_command("seq 1 10000", log)
+    assert 0 < log.records["debug"] < 10000
+
+
+def test_long_lines_are_split():
+    result = python(
+        'import sys; sys.stdout.write("x" * {0} + "\\r\\n")'.format(MAX_LINE * 2 + 10)
+    )
+    lines = result.stdout.splitlines()
+    assert [len(line) for line in lines] == [MAX_LINE, MAX_LINE, 10]
+    assert result.stdout_bytes == MAX_LINE * 2 + 12
+
+
+def test_input():
+    result = run_command("tr a-z A-Z", Log(), input="hello\n")
+    assert result.stdout == "HELLO"
+    # A command that does not read its input must not block the feeder
+    result = run_command("true", Log(), input="x" * 10_000_000)
+    assert result.return_code == 0
+
+
+def test_stats():
+    result = python("sum(range(3000000))")
+    assert result.duration > 0
+    assert result.cpu_time > 0
+    assert result.started <= time.perf_counter() - result.duration
+
+
+def test_timeout():
+    log = Log()
+    started = time.perf_counter()
+    result = run_command("echo started; sleep 10", log, timeout=0.5, grace=1)
+    assert time.perf_counter() - started < 3
+    assert result.timed_out and not result.stopped
+    assert result.return_code < 0  # ended by a signal
+    assert result.stdout == "started"
+    assert any("Timed out after 0.5s" in line for line in log.lines["error"])
+
+
+def test_stop_event():
+    stop = threading.Event()
+    threading.Timer(0.3, stop.set).start()
+    started = time.perf_counter()
+    result = run_command("sleep 10", Log(), stop=stop, grace=1)
+    assert time.perf_counter() - started < 3
+    assert result.stopped and not result.timed_out
+    assert result.return_code < 0
+
+
+def test_unused_stop_event():
+    result = run_command("exit 4", Log(), stop=threading.Event())
+    assert result.return_code == 4
+    assert not result.stopped
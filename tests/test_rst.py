@@ -0,0 +1,63 @@
+"""Tests of CheckRstFiles, whose worker processes start from a thread."""
+
+import json
+
+import pytest
+
+from releaser.git_steps import EnsureGitBranch
+from releaser.steps import CheckRstFiles, _process_pool
+
+GOOD = "Title\n=====\n\nSome text.\n"
+BAD = "Title\n=====\n\nA `broken link_.\n"
+
+
+def release(make_releaser, *steps):
+    releaser = make_releaser(*steps, journal=False)
+    try:
+        releaser.release()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def test_workers_are_not_forked():
+    with _process_pool({"max_workers": 1}) as executor:
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+
+
+def test_check_alongside_another_step(repo, make_releaser):
+    names = ["a.rst", "b.rst", "c.rst"]
+    for name in names:
+        (repo / name).write_text(GOOD)
+    # Both steps are parallel_safe, so the pool starts from a worker thread
+    assert release(make_releaser, CheckRstFiles(*names), EnsureGitBranch) == 0
+    with open(".releaser_cache/rst.json") as stream:
+        cache = json.load(stream)
+    assert sorted(cache) == names  # the same content, but 3 paths
+    assert cache["a.rst"] == cache["b.rst"] == cache["c.rst"]
+
+
+def test_cache_key(repo, make_releaser, monkeypatch, caplog):
+    (repo / "a.rst").write_text(GOOD)
+    assert release(make_releaser, CheckRstFiles("a.rst")) == 0
+    caplog.clear()
+    assert release(make_releaser, CheckRstFiles("a.rst")) == 0
+    assert "Unchanged, not checking again: a.rst" in caplog.text
+    # The same content elsewhere is checked: an include may resolve differently
+    (repo / "b.rst").write_text(GOOD)
+    caplog.clear()
+    assert release(make_releaser, CheckRstFiles("b.rst")) == 0
+    assert "Checking b.rst" in caplog.text
+    # So is everything after an upgrade of docutils
+    monkeypatch.setattr("releaser.steps._docutils_version", lambda: "99.0")
+    caplog.clear()
+    assert release(make_releaser, CheckRstFiles("b.rst")) == 0
+    assert "Checking b.rst" in caplog.text
+
+
+@pytest.mark.parametrize("names", [["bad.rst"], ["a.rst", "bad.rst"]])
+def test_errors_stop_the_release(repo, make_releaser, caplog, names):
+    (repo / "a.rst").write_text(GOOD)
+    (repo / "bad.rst").write_text(BAD)
+    assert release(make_releaser, CheckRstFiles(*names), EnsureGitBranch) == 4
+    assert "There are errors in bad.rst" in caplog.text
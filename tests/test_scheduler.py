@@ -0,0 +1,71 @@
+"""Tests of plan_batches, which groups steps that may run concurrently."""
+
+from releaser.scheduler import plan_batches
+
+
+class Step:
+    def __init__(self, name, parallel_safe=True, needs=(), provides=()):  # noqa
+        self.name = name
+        self.parallel_safe = parallel_safe
+        self.needs = needs
+        self.provides = provides
+
+    def __repr__(self):
+        return self.name
+
+
+def names(batches):
+    return [[step.name for step in batch] for batch in batches]
+
+
+def test_barriers_run_alone():
+    steps = [
+        Step("a"),
+        Step("b"),
+        Step("shell", parallel_safe=False),
+        Step("c"),
+        Step("ask", parallel_safe=False),
+        Step("shell2", parallel_safe=False),
+    ]
+    assert names(plan_batches(steps)) == [
+        ["a", "b"],
+        ["shell"],
+        ["c"],
+        ["ask"],
+        ["shell2"],
+    ]
+
+
+def test_a_step_never_runs_with_what_it_needs():
+    steps = [
+        Step("version", provides=("the_version",)),
+        Step("conflicts", needs=("the_version",)),
+        Step("other"),
+        Step("version2", provides=("the_version",)),
+    ]
+    assert names(plan_batches(steps)) == [
+        ["version"],
+        ["conflicts", "other", "version2"],
+    ]
+    steps.insert(3, Step("build", provides=("dist",), needs=("the_version",)))
+    steps.append(Step("verify", needs=("dist",)))
+    assert names(plan_batches(steps)) == [
+        ["version"],
+        ["conflicts", "other", "build", "version2"],
+        ["verify"],
+    ]
+
+
+def test_serial():
+    steps = [Step("a"), Step("b"), Step("c")]
+    assert names(plan_batches(steps, parallel=False)) == [["a"], ["b"], ["c"]]
+
+
+def test_order_is_kept():
+    steps = [
+        Step(str(n), parallel_safe=n % 3 != 0, provides=("x",) if n % 4 else ())
+        for n in range(20)
+    ]
+    batches = plan_batches(steps)
+    assert [step for batch in batches for step in batch] == steps
+    assert all(batches)
@@ -0,0 +1,136 @@
+"""Tests of finding and writing the version number in several files."""
+
+import os
+
+import pytest
+
+from releaser import StopRelease
+from releaser.regex import find_version
+from releaser.stamping import (
+    JsonLocator,
+    PythonLocator,
+    SphinxConfLocator,
+    TomlLocator,
+    VersionStamper,
+    locator_for,
+)
+
+PYPROJECT = """[build-system]
+requires = ["poetry-core"]
+
+[tool.black]
+target_version = "py38"
+
+[tool.poetry]
+name = "x"
+version = "1.0.0.dev1"
+"""
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('__version__ = "1.2.3"\n', "1.2.3"),
+        ("version='2.0rc1'", "2.0rc1"),
+        ('python_version = "3.8"\nversion = "0.1"', "0.1"),
+        ('_version  =  "1.0.post1"', "1.0.post1"),
+        ('version = "2"', None),  # at least X.Y
+        ("version = 1.0", None),  # not quoted
+    ],
+)
+def test_find_version(text, expected):
+    match = find_version(text)
+    assert (match.group(1) if match else None) == expected
+
+
+def test_find_version_in_a_slice():
+    text = 'version = "1.0"\nversion = "2.0"\n'
+    assert find_version(text, pos=1).group(1) == "2.0"
+    assert find_version(text, endpos=10) is None
+
+
+def test_locator_for():
+    assert isinstance(locator_for("pyproject.toml"), TomlLocator)
+    assert isinstance(locator_for("frontend/package.json"), JsonLocator)
+    assert isinstance(locator_for("docs/conf.py"), SphinxConfLocator)
+    assert isinstance(locator_for("x/__init__.py"), PythonLocator)
+    assert locator_for("pyproject.toml", "release").keyword == "release"
+
+
+def test_toml_locator_reads_the_right_table():
+    locator = TomlLocator()
+    assert locator.find(PYPROJECT) == "1.0.0.dev1"
+    new = locator.replace(PYPROJECT, "1.0.0")
+    assert new == PYPROJECT.replace("1.0.0.dev1", "1.0.0")
+
+
+def test_sphinx_locator():
+    text = 'version = "1.0"\nrelease = "1.0.0"\n'
+    locator = SphinxConfLocator()
+    assert locator.find(text) == "1.0.0"
+    assert locator.replace(text, "1.1.2") == 'version = "1.1"\nrelease = "1.1.2"\n'
+
+
+def test_json_locator():
+    assert JsonLocator().replace('{"version": "1.0"}', "2.0") == '{"version": "2.0"}'
+    with pytest.raises(StopRelease):
+        JsonLocator().find("{}")
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+    (tmp_path / "package.json").write_bytes(b'{\r\n  "version": "1.0.0.dev1"\r\n}\r\n')
+    (tmp_path / "__init__.py").write_text('__version__ = "1.0.0.dev1"\n')
+    os.chmod(tmp_path / "__init__.py", 0o600)
+    return VersionStamper.from_config(
+        {
+            "version_files": [
+                "pyproject.toml",
+                "package.json",
+                ("__init__.py", "version"),
+            ]
+        }
+    )
+
+
+def test_stamp(files, tmp_path):
+    assert files.current() == "1.0.0.dev1"
+    assert files.stamp("1.0.0") == ["pyproject.toml", "package.json", "__init__.py"]
+    assert set(files.read().values()) == {"1.0.0"}
+    assert (tmp_path / "package.json").read_bytes() == (
+        b'{\r\n  "version": "1.0.0"\r\n}\r\n'  # line endings are kept
+    )
+    assert os.stat(tmp_path / "__init__.py").st_mode & 0o777 == 0o600
+    assert files.stamp("1.0.0") == []
+
+
+def test_nothing_is_written_unless_all_files_have_the_version(files, tmp_path):
+    (tmp_path / "__init__.py").write_text("# no version here\n")
+    with pytest.raises(StopRelease, match="__init__.py: Could not find"):
+        files.stamp("1.0.0")
+    assert "1.0.0.dev1" in (tmp_path / "pyproject.toml").read_text()
+    assert sorted(os.listdir(tmp_path)) == [
+        "__init__.py",
+        "package.json",
+        "pyproject.toml",
+    ]
+
+
+def test_files_are_restored_when_a_rename_fails(files, tmp_path, monkeypatch):
+    replace = os.replace
+    calls = []
+
+    def failing(source, target):
+        calls.append(target)
+        if len(calls) == 3:  # after two files were replaced
+            raise OSError("disk full")
+        replace(source, target)
+
+    monkeypatch.setattr(os, "replace", failing)
+    with pytest.raises(OSError):
+        files.stamp("1.0.0")
+    monkeypatch.setattr(os, "replace", replace)
+    assert set(files.read().values()) == {"1.0.0.dev1"}
+    assert not [n for n in os.listdir(tmp_path) if n.startswith(".tmp-version-")]
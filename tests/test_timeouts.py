@@ -0,0 +1,120 @@
+"""Tests of the step and release timeouts, which stop commands and the release."""
+
+import time
+
+import pytest
+
+from releaser import ReleaseStep, StepTimeout
+from releaser.steps import Shell
+
+
+def alive(pid):
+    """Tell whether a process exists and is not a zombie."""
+    try:
+        with open("/proc/{0}/stat".format(pid)) as stream:
+            return stream.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def release(make_releaser, *steps, **settings):
+    """Run a release; return its exit code and how long it took."""
+    releaser = make_releaser(*steps, journal=False, kill_grace=1, **settings)
+    started = time.perf_counter()
+    try:
+        releaser.release()
+    except SystemExit as e:
+        return e.code, time.perf_counter() - started
+    return 0, time.perf_counter() - started
+
+
+class Sleep(ReleaseStep):
+    def __init__(self, seconds):  # noqa
+        self.seconds = seconds
+
+    def __call__(self):  # noqa
+        time.sleep(self.seconds)
+        self._succeed()
+
+
+class SlowUndo(ReleaseStep):
+    """Its rollback runs a command, which needs some time of its own."""
+
+    timeout = 10
+
+    def __call__(self):  # noqa
+        self._succeed()
+
+    def rollback(self):
+        self._execute_or_complain("sleep 0.5 && touch undone.tmp")
+
+
+@pytest.fixture
+def confirm(monkeypatch):
+    monkeypatch.setattr("releaser.bool_input", lambda *a, **kw: True)
+
+
+def test_a_command_ignoring_sigterm_is_killed(repo, make_releaser, caplog):
+    command = "trap '' TERM; sleep 20 & echo $! > sleep.pid.tmp; wait"
+    code, duration = release(make_releaser, Shell(command, timeout=1))
+    assert code == Shell.ERROR_CODE
+    assert duration < 4  # 1s of timeout, 1s of grace, then SIGKILL
+    assert "ran out of time" in caplog.text
+    # The whole process group is killed, not only the shell
+    pid = int((repo / "sleep.pid.tmp").read_text())
+    for _ in range(20):
+        if not alive(pid):
+            break
+        time.sleep(0.1)
+    assert not alive(pid)
+
+
+def test_step_timeout_setting(repo, make_releaser, caplog):
+    code, duration = release(make_releaser, Shell("sleep 10"), step_timeout=1)
+    assert code == Shell.ERROR_CODE
+    assert duration < 4
+    assert "[sleep 10] ran out of time (1s left)" in caplog.text
+
+
+def test_step_timeout_spares_interactive_steps(repo, make_releaser):
+    releaser = make_releaser(step_timeout=1)
+    step = Shell("true")
+    assert releaser._deadline_for(step) is not None
+    step.interactive = True
+    assert releaser._deadline_for(step) is None
+    step.timeout = 5  # its own timeout still applies
+    assert releaser._deadline_for(step) is not None
+
+
+def test_release_timeout_stops_the_running_command(repo, make_releaser, caplog):
+    steps = (Shell("sleep 0.5"), Shell("sleep 10"))
+    code, duration = release(make_releaser, *steps, release_timeout=2)
+    assert code == Shell.ERROR_CODE
+    assert duration < 5
+    assert "[sleep 10] ran out of time" in caplog.text
+
+
+def test_no_step_starts_after_the_release_deadline(repo, make_releaser, caplog):
+    steps = (Sleep(1.2), Shell("touch started.tmp"))
+    code, _ = release(make_releaser, *steps, release_timeout=1)
+    assert code == Shell.ERROR_CODE
+    assert "[touch started.tmp] ran out of time." in caplog.text
+    assert not (repo / "started.tmp").exists()
+
+
+def test_step_timeout_is_a_stop_release(repo, make_releaser):
+    step = Shell("sleep 10", timeout=0.5)
+    make_releaser(step, kill_grace=1)
+    step.deadline = time.perf_counter() + step.timeout
+    with pytest.raises(StepTimeout):
+        step()
+    assert step.last_result.timed_out
+
+
+def test_a_rollback_gets_its_own_time(repo, make_releaser, confirm, caplog):
+    steps = (SlowUndo, Shell("sleep 10"))
+    code, _ = release(make_releaser, *steps, release_timeout=1)
+    assert code == Shell.ERROR_CODE
+    # The release was out of time, but the rollback could still run
+    assert (repo / "undone.tmp").exists()
+    assert "Could not roll back" not in caplog.text
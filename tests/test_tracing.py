@@ -0,0 +1,91 @@
+"""Tests of the Tracer, its Chrome trace output and its summary."""
+
+import json
+import threading
+
+from releaser.process import CommandResult
+from releaser.steps import Shell
+from releaser.tracing import Tracer
+
+
+def command(tracer, text, code=0, cpu=0.25, output=100):
+    result = CommandResult(
+        text,
+        code,
+        "",
+        "",
+        started=tracer.origin + 0.5,
+        duration=1.5,
+        cpu_time=cpu,
+        stdout_bytes=output,
+    )
+    return tracer.add_command(result)
+
+
+def test_spans_nest():
+    tracer = Tracer()
+    with tracer.span("step", "step") as args:
+        args["success"] = True
+        first = command(tracer, "make")
+        assert tracer.current.name == "step"
+    second = command(tracer, ["git", "push"])
+    step = [s for s in tracer.spans if s.category == "step"][0]
+    assert first.parent is step and second.parent is None
+    assert second.name == "git push"
+    assert step.args == {"success": True}
+    assert step.wall >= 0 and step.cpu >= 0
+    assert tracer.current is None
+
+
+def test_chrome_trace(tmp_path):
+    tracer = Tracer()
+    with tracer.span("step", "step"):
+        command(tracer, "make", code=2)
+    thread = threading.Thread(target=command, args=(tracer, "elsewhere"))
+    thread.start()
+    thread.join()
+    path = tmp_path / "trace.json"
+    tracer.write(str(path))
+    trace = json.loads(path.read_text())
+    assert trace["displayTimeUnit"] == "ms"
+    events = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+    make = events["make"]
+    assert make["cat"] == "command"
+    assert (make["ts"], make["dur"]) == (500000, 1500000)  # microseconds
+    assert make["args"] == {"exit_code": 2, "output_bytes": 100, "cpu_ms": 250.0}
+    assert events["step"]["tid"] == make["tid"] != events["elsewhere"]["tid"]
+    names = [e for e in trace["traceEvents"] if e["ph"] == "M"]
+    assert sorted(e["tid"] for e in names) == [1, 2]
+
+
+def test_summary():
+    tracer = Tracer()
+    with tracer.span("[make]", "step"):
+        command(tracer, "make", cpu=0.5, output=30)
+        command(tracer, "make install", code=2, cpu=None, output=12)
+    with tracer.span("[make]", "rollback"):
+        pass
+    lines = tracer.summary().splitlines()
+    assert lines[0].startswith("Step ") and lines[0].endswith("Output (B)")
+    assert set(lines[1]) == {"-"}
+    step = lines[2].split()
+    assert step[0] == "[make]"
+    assert float(step[2]) >= 0.5  # the CPU time of the commands is included
+    assert step[3:] == ["2", "2", "42"]
+    assert lines[3].split()[:2] == ["ROLLBACK", "[make]"]
+    assert len(lines) == 4  # commands have no rows of their own
+
+
+def test_release_writes_a_trace(repo, make_releaser):
+    releaser = make_releaser(
+        Shell("echo hello"), trace_file="trace.json.tmp", journal=False
+    )
+    releaser.release()
+    with open("trace.json.tmp") as stream:
+        events = json.load(stream)["traceEvents"]
+    step = [e for e in events if e.get("cat") == "step"]
+    assert [e["name"] for e in step] == ["[echo hello]"]
+    assert step[0]["args"]["success"] is True
+    commands = [e for e in events if e.get("cat") == "command"]
+    assert commands[0]["name"] == "echo hello"
+    assert commands[0]["args"]["output_bytes"] == 6
@@ -0,0 +1,192 @@
+"""Tests of the .po parser, the placeholder checks and the .mo writer."""
+
+import gettext
+import io
+
+import pytest
+
+from releaser.steps import CompileAndVerifyTranslations
+from releaser.translations import (
+    CatalogError,
+    check_message,
+    compile_catalog,
+    mo_bytes,
+    parse_po,
+)
+
+CATALOG = r"""# A comment
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\n"
+"Plural-Forms: nplurals=2; plural=(n != 1);\n"
+
+#, python-format
+msgid "Hello %(name)s"
+msgstr "Olá %(name)s"
+
+msgctxt "menu"
+msgid "File"
+msgstr "Arquivo"
+
+#, python-format
+msgid "One file"
+msgid_plural "%d files"
+msgstr[0] "Um arquivo"
+msgstr[1] "%d arquivos"
+
+msgid "Long "
+"text\t!"
+msgstr ""
+"Texto "
+"longo\t!"
+
+#, fuzzy
+msgid "Maybe"
+msgstr "Talvez"
+
+msgid "Untranslated"
+msgstr ""
+
+#~ msgid "Obsolete"
+#~ msgstr "Obsoleto"
+"""
+
+
+def message(text):
+    return parse_po(text)[0]
+
+
+def test_parse_po():
+    messages = parse_po(CATALOG)
+    assert [m.msgid for m in messages] == [
+        "",
+        "Hello %(name)s",
+        "File",
+        "One file",
+        "Long text\t!",
+        "Maybe",
+        "Untranslated",
+    ]
+    assert messages[1].flags == ["python-format"]
+    assert messages[2].context == "menu"
+    assert messages[3].plural == "%d files"
+    assert messages[3].msgstr == {0: "Um arquivo", 1: "%d arquivos"}
+    assert messages[4].msgstr == {0: "Texto longo\t!"}
+    assert messages[4].line == 21
+    assert not messages[6].translated
+
+
+def test_parse_po_errors():
+    with pytest.raises(CatalogError, match="line 1"):
+        parse_po('msgstr "orphan"\n')
+    with pytest.raises(CatalogError, match="expected a string"):
+        parse_po("msgid hello\n")
+
+
+@pytest.mark.parametrize(
+    "entry, problems",
+    [
+        ('#, python-format\nmsgid "%(a)s"\nmsgstr "%(b)s"', ["% placeholders"]),
+        ('#, python-format\nmsgid "%s %d"\nmsgstr "%d %s"', ["% placeholders"]),
+        ('#, python-format\nmsgid "100%% %s"\nmsgstr "%s 100%%"', []),
+        ('#, python-brace-format\nmsgid "{0}"\nmsgstr "{1}"', ["{} placeholders"]),
+        ('#, python-brace-format\nmsgid "{a}"\nmsgstr "{{a}}"', ["{} placeholders"]),
+        # Not flagged: the text may have anything
+        ('msgid "100% sure"\nmsgstr "100 % certo"', []),
+        ('msgid "Use {}"\nmsgstr "Use {} ou []"', []),
+    ],
+)
+def test_check_message(entry, problems):
+    found = check_message(message(entry))
+    assert len(found) == len(problems)
+    for problem, expected in zip(found, problems):
+        assert expected in problem
+
+
+def test_check_unflagged_messages():
+    assert check_message(message('msgid "{0}"\nmsgstr "{1}"'), unflagged=True)
+    entry = '#, no-python-brace-format\nmsgid "{0}"\nmsgstr "{1}"'
+    assert check_message(message(entry), unflagged=True) == []
+
+
+def test_plural_forms_may_leave_placeholders_out():
+    entry = (
+        '#, python-format\nmsgid "One file"\nmsgid_plural "%d files"\n'
+        'msgstr[0] "Um arquivo"\nmsgstr[1] "%d arquivos"'
+    )
+    assert check_message(message(entry)) == []
+    entry = entry.replace("Um arquivo", "Um arquivo de %(user)s")
+    assert check_message(message(entry)) == ["msgstr[0] has unknown % placeholders"]
+
+
+def test_mo_bytes_read_by_gettext():
+    kept = [m for m in parse_po(CATALOG) if m.translated and "fuzzy" not in m.flags]
+    catalog = gettext.GNUTranslations(io.BytesIO(mo_bytes(kept)))
+    assert catalog.gettext("Hello %(name)s") == "Olá %(name)s"
+    assert catalog.pgettext("menu", "File") == "Arquivo"
+    assert catalog.ngettext("One file", "%d files", 1) == "Um arquivo"
+    assert catalog.ngettext("One file", "%d files", 3) == "%d arquivos"
+    assert catalog.gettext("Long text\t!") == "Texto longo\t!"
+
+
+def test_compile_catalog(tmp_path):
+    po = tmp_path / "pt.po"
+    po.write_text(CATALOG, encoding="utf-8")
+    mo = tmp_path / "pt.mo"
+    problems, counts = compile_catalog(str(po), str(mo))
+    assert problems == []
+    assert counts == {"translated": 4, "fuzzy": 1, "untranslated": 1}
+    catalog = gettext.GNUTranslations(io.BytesIO(mo.read_bytes()))
+    assert catalog.gettext("Maybe") == "Maybe"  # fuzzy messages are left out
+    assert catalog.gettext("File") == "File"  # only with its context
+
+
+@pytest.mark.parametrize("charset", ["ISO-8859-1", "cp1252"])
+def test_compile_latin_1_catalog(tmp_path, charset):
+    po = tmp_path / "pt.po"
+    po.write_bytes(CATALOG.replace("UTF-8", charset).encode("latin-1"))
+    mo = tmp_path / "pt.mo"
+    problems, counts = compile_catalog(str(po), str(mo))
+    assert problems == []
+    assert counts["translated"] == 4
+    catalog = gettext.GNUTranslations(io.BytesIO(mo.read_bytes()))
+    assert catalog.gettext("Hello %(name)s") == "Olá %(name)s"
+
+
+def test_compile_catalog_with_a_wrong_charset(tmp_path):
+    po = tmp_path / "pt.po"
+    po.write_bytes(CATALOG.encode("latin-1"))  # but the header says UTF-8
+    problems, _ = compile_catalog(str(po), str(tmp_path / "pt.mo"))
+    assert len(problems) == 1 and "codec can't decode" in problems[0]
+
+
+def test_compile_catalog_with_problems(tmp_path):
+    po = tmp_path / "pt.po"
+    po.write_text(CATALOG.replace('"Olá %(name)s"', '"Olá %(nome)s"'), encoding="utf-8")
+    mo = tmp_path / "pt.mo"
+    problems, _ = compile_catalog(str(po), str(mo))
+    assert problems == [str(po) + ":8: msgstr has different % placeholders"]
+    assert not mo.exists()
+
+
+def run_step(make_releaser, **settings):
+    releaser = make_releaser(CompileAndVerifyTranslations, journal=False, **settings)
+    try:
+        releaser.release()
+    except SystemExit as e:
+        return e.code
+    return 0
+
+
+def test_step(repo, make_releaser, caplog):
+    for language in ("pt", "es"):  # 2 catalogs: compiled by worker processes
+        (repo / (language + ".po")).write_text(CATALOG, encoding="utf-8")
+    (repo / "fr.po").write_text('msgid "{0} ok"\nmsgstr "{1} ok"\n')
+    assert run_step(make_releaser) == 0
+    assert (repo / "pt.mo").exists() and (repo / "es.mo").exists()
+    caplog.clear()
+    assert run_step(make_releaser) == 0
+    assert "0 catalog(s) to compile, 3 unchanged" in caplog.text
+    # A stricter check does not trust the previous runs
+    assert run_step(make_releaser, check_unflagged_formats=True) == 16
+    assert "fr.po:1: msgstr has different {} placeholders" in caplog.text
@@ -0,0 +1,145 @@
+"""Tests of the uploader and UploadPackages, against a stand-in index."""
+
+import logging
+import os
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from fake_index import FakeIndex
+from releaser import ReleaseStep, StopRelease
+from releaser.steps import UploadPackages
+from releaser.upload import Uploader, read_metadata
+
+log = logging.getLogger("test")
+META = "Metadata-Version: 2.1\nName: fixture\nVersion: 1.0.0\nClassifier: A\n"
+
+
+def make_wheels(directory, count=1, version="1.0.0"):
+    paths = []
+    for i in range(count):
+        path = os.path.join(
+            str(directory), "fixture-{0}-cp3{1}-none-any.whl".format(version, i)
+        )
+        with zipfile.ZipFile(path, "w") as whl:
+            whl.writestr("fixture-{0}.dist-info/METADATA".format(version), META)
+            whl.writestr("fixture/data", os.urandom(1000))
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def index():
+    server = FakeIndex().start()
+    yield server
+    server.stop()
+
+
+def uploader(index, **kw):
+    kw.setdefault("backoff", 0.01)
+    return Uploader(
+        log, repository_url=index.url + "/legacy/", index_url=index.url + "/pypi", **kw
+    )
+
+
+def test_read_metadata(tmp_path):
+    (path,) = make_wheels(tmp_path)
+    fields = read_metadata(path)
+    assert fields["name"] == "fixture"
+    assert fields["classifiers"] == ["A"]
+
+
+def test_upload_and_skip_existing(index, tmp_path):
+    paths = make_wheels(tmp_path, 2)
+    results = uploader(index).upload_all(paths, "fixture", "1.0.0")
+    assert set(results.values()) == {"uploaded"}
+    assert sorted(index.releases[("fixture", "1.0.0")]) == [
+        os.path.basename(p) for p in paths
+    ]
+    paths = make_wheels(tmp_path, 3)  # the same 2 files and a new one
+    results = uploader(index).upload_all(paths, "fixture", "1.0.0")
+    assert [results[p] for p in paths] == ["skipped", "skipped", "uploaded"]
+    assert index.attempts[os.path.basename(paths[0])] == 1  # not sent again
+
+
+def test_a_file_the_index_reports_as_existing_is_skipped(index, tmp_path):
+    (path,) = make_wheels(tmp_path)
+    uploader(index).upload(path)
+    assert uploader(index, retries=0).upload(path) == "skipped"
+
+
+def test_transient_errors_are_retried(index, tmp_path, caplog):
+    index.flaky = 2
+    paths = make_wheels(tmp_path, 2)
+    results = uploader(index).upload_all(paths, "fixture", "1.0.0")
+    assert set(results.values()) == {"uploaded"}
+    assert set(index.attempts.values()) == {3}
+    assert "HTTP 503. Retrying" in caplog.text
+
+
+def test_retries_run_out(index, tmp_path):
+    index.flaky = 5
+    with pytest.raises(StopRelease, match="HTTP 503"):
+        uploader(index, retries=1).upload_all(make_wheels(tmp_path), "fixture", "1.0.0")
+
+
+@pytest.mark.parametrize("workers, minimum, maximum", [(1, 1.2, 10), (4, 0, 0.9)])
+def test_concurrent_uploads(index, tmp_path, workers, minimum, maximum):
+    index.delay = 0.3
+    paths = make_wheels(tmp_path, 4)
+    started = time.perf_counter()
+    uploader(index, workers=workers).upload_all(paths, "fixture", "1.0.0")
+    assert minimum <= time.perf_counter() - started < maximum
+    assert len(index.releases[("fixture", "1.0.0")]) == 4
+
+
+class NotJson(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa
+        self.send_response(200)
+        self.send_header("Content-Length", "9")
+        self.end_headers()
+        self.wfile.write(b"<!DOCTYPE")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_an_invalid_answer_from_the_index_is_a_warning(caplog):
+    server = HTTPServer(("127.0.0.1", 0), NotJson)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = "http://127.0.0.1:{0}/pypi".format(server.server_address[1])
+        found = Uploader(log, index_url=url).existing_files("fixture", "1.0.0")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert found == set()
+    assert "Unexpected answer from " + url in caplog.text
+
+
+class SetTheVersion(ReleaseStep):
+    provides = ("the_version",)
+
+    def __call__(self):  # noqa
+        self.releaser.the_version = "1.0.0"
+        self._succeed()
+
+
+def test_upload_packages_step(repo, make_releaser, index, caplog):
+    os.makedirs("dist")
+    make_wheels("dist", 2)
+    make_wheels("dist", 1, version="0.9.0")  # not this release
+    releaser = make_releaser(
+        SetTheVersion,
+        UploadPackages,
+        journal=False,
+        repository_url=index.url + "/legacy/",
+        index_url=index.url + "/pypi",
+    )
+    releaser.release()
+    assert len(index.releases[("fixture", "1.0.0")]) == 2
+    assert ("fixture", "0.9.0") not in index.releases
+    assert "fixture-1.0.0-cp30-none-any.whl: uploaded" in caplog.text
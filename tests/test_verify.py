@@ -0,0 +1,151 @@
+"""Tests of the *verify* module, which checks the contents of archives."""
+
+import io
+import logging
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+from releaser.verify import PackageVerifier, pyproject_includes
+
+PYPROJECT = """[tool.poetry]
+name = "releaser"
+version = "3.0.0"
+include = ["README.rst", "CHANGES.rst"]
+"""
+FILES = {
+    "releaser/__init__.py": "VERSION = 1\n",
+    "pyproject.toml": PYPROJECT,
+    "README.rst": "Read me\n",
+    "CHANGES.rst": "Changes\n",
+    "LICENSE.rst": "MIT\n",
+    "ROADMAP.rst": "Later\n",
+}
+CONFIG = {"github_repository": "releaser"}
+
+try:
+    import tomllib  # noqa: F401
+except ImportError:  # Python < 3.11
+    pytest.importorskip("tomli")
+
+
+@pytest.fixture
+def project(tmp_path):
+    for path, content in FILES.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(content)
+    return tmp_path
+
+
+def make_sdist(directory, members):
+    path = os.path.join(str(directory), "releaser-3.0.0.tar.gz")
+    with tarfile.open(path, "w:gz") as archive:
+        for name, content in members.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo("releaser-3.0.0/" + name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return path
+
+
+def make_wheel(directory, members):
+    path = os.path.join(str(directory), "releaser-3.0.0-py3-none-any.whl")
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return path
+
+
+def sdist_like_poetry(directory):
+    """An sdist laid out as poetry builds this repository's."""
+    members = {
+        name: content for name, content in FILES.items() if name != "ROADMAP.rst"
+    }
+    members["PKG-INFO"] = "Metadata-Version: 2.1\n"
+    return make_sdist(directory, members)
+
+
+def test_pyproject_includes(project):
+    assert pyproject_includes(str(project)) == {
+        "sdist": ["README.rst", "README.rst/*", "CHANGES.rst", "CHANGES.rst/*"],
+        "wheel": [],
+    }
+
+
+def test_pyproject_includes_with_formats(tmp_path):
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.poetry]\n"
+        'include = [{path = "data/", format = ["sdist", "wheel"]},'
+        ' {path = "x.txt", format = "wheel"}]\n'
+    )
+    found = pyproject_includes(str(tmp_path))
+    assert found["sdist"] == ["data", "data/*"]
+    assert found["wheel"] == ["data", "data/*", "x.txt", "x.txt/*"]
+
+
+def test_pyproject_includes_without_pyproject(tmp_path):
+    assert pyproject_includes(str(tmp_path)) == {"sdist": [], "wheel": []}
+
+
+def test_pyproject_includes_without_a_toml_parser(project, monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "tomllib", None)  # import fails
+    monkeypatch.setitem(sys.modules, "tomli", None)
+    log = logging.getLogger("test")
+    assert pyproject_includes(str(project), log) == {"sdist": [], "wheel": []}
+    assert "install tomli" in caplog.text
+
+
+def test_sdist_with_pyproject_includes(project, tmp_path_factory):
+    dist = tmp_path_factory.mktemp("dist")
+    verifier = PackageVerifier(CONFIG, str(project), list(FILES))
+    assert verifier.verify(sdist_like_poetry(dist)) == []
+
+
+def test_sdist_without_includes_reports_them(project, tmp_path_factory):
+    dist = tmp_path_factory.mktemp("dist")
+    config = dict(CONFIG, sdist_include=["releaser/*", "pyproject.toml", "README*"])
+    verifier = PackageVerifier(config, str(project), list(FILES))
+    assert verifier.verify(sdist_like_poetry(dist)) == [
+        "unexpected: CHANGES.rst",
+        "unexpected: LICENSE.rst",
+    ]
+
+
+def test_sdist_problems(project, tmp_path_factory):
+    dist = tmp_path_factory.mktemp("dist")
+    members = {
+        "releaser/__init__.py": "VERSION = 2\n",
+        "pyproject.toml": "rewritten by the build",
+        "README.rst": "Read me\n",
+        "CHANGES.rst": "Changes\n",
+        "secrets.txt": "oops",
+        "PKG-INFO": "",
+    }
+    verifier = PackageVerifier(CONFIG, str(project), list(FILES))
+    assert verifier.verify(make_sdist(dist, members)) == [
+        "modified: releaser/__init__.py",
+        "unexpected: secrets.txt",
+        "missing: LICENSE.rst",
+    ]
+
+
+def test_wheel(project, tmp_path_factory):
+    dist = tmp_path_factory.mktemp("dist")
+    members = {
+        "releaser/__init__.py": "VERSION = 1\n",
+        "releaser-3.0.0.dist-info/METADATA": "",
+    }
+    verifier = PackageVerifier(CONFIG, str(project), list(FILES))
+    assert verifier.verify(make_wheel(dist, members)) == []
+
+
+def test_too_large(project, tmp_path_factory):
+    dist = tmp_path_factory.mktemp("dist")
+    members = {"releaser/__init__.py": "VERSION = 1\n"}
+    config = dict(CONFIG, package_max_file_size=4)
+    verifier = PackageVerifier(config, str(project), list(FILES))
+    problems = verifier.verify(make_wheel(dist, members))
+    assert problems[0].startswith("too large")
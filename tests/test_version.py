@@ -0,0 +1,128 @@
+"""Tests of version numbers, the tag index and the validation of the_version."""
+
+import pytest
+
+from conftest import git
+from releaser import StopRelease
+from releaser.regex import error_in_version
+from releaser.version import InvalidVersion, TagIndex, parse_version
+
+
+def test_order_follows_pep_440():
+    texts = ["1.0.dev1", "1.0a1", "1.0b2", "1.0rc1", "1.0", "1.0.post1", "1.1"]
+    versions = [parse_version(t) for t in texts]
+    assert sorted(reversed(versions)) == versions
+    assert parse_version("1.0") == parse_version("1.0.0")
+    assert parse_version("1.0alpha1") == parse_version("1.0a1")
+
+
+def test_invalid_version():
+    with pytest.raises(InvalidVersion):
+        parse_version("one.two")
+
+
+@pytest.mark.parametrize(
+    "text, part, expected",
+    [
+        ("1.2.3", "patch", "1.2.4"),
+        ("1.2.3", "minor", "1.3.0"),
+        ("1.2.3", "major", "2.0.0"),
+        ("1.3.0rc1", "minor", "1.3.0"),
+        ("1.2", "patch", "1.2.1"),
+    ],
+)
+def test_bump(text, part, expected):
+    assert str(parse_version(text).bump(part)) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected", [("1.2.3", "1.2.4.dev1"), ("1.3rc1", "1.3rc2.dev1")]
+)
+def test_next_dev(text, expected):
+    assert str(parse_version(text).next_dev()) == expected
+
+
+def test_tag_index():
+    index = TagIndex(["v1.0", "v0.9", "v1.1rc1", "other", "vx"])
+    assert index.names == ["v0.9", "v1.0", "v1.1rc1"]
+    assert index.tag_for("1.0.0") == "v1.0"
+    assert index.latest() == parse_version("1.0")
+    assert index.latest(include_prereleases=True) == parse_version("1.1rc1")
+    assert index.previous("1.0") == parse_version("0.9")
+    assert index.newer_than("0.9") == [parse_version("1.0"), parse_version("1.1rc1")]
+    assert str(index.next_version()) == "1.1.0"
+    index.add("v1.0.1")
+    assert index.names == ["v0.9", "v1.0", "v1.0.1", "v1.1rc1"]
+
+
+def test_tag_index_is_cached(repo, make_releaser):
+    git("tag", "v0.2")
+    git("tag", "v0.1")
+    assert make_releaser().tags.names == ["v0.1", "v0.2"]
+    git("tag", "v0.3")
+    git("tag", "-d", "v0.1")
+    assert make_releaser().tags.names == ["v0.2", "v0.3"]
+
+
+@pytest.fixture
+def releaser(repo, make_releaser):
+    git("tag", "v0.9")
+    releaser = make_releaser()
+    releaser.old_version = "1.0.0.dev1"
+    return releaser
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ("1.0.dev2", "development version"),
+        ("1.0.0+local", "local version label"),
+        ("2", "at least MAJOR.MINOR"),
+        ("1!2.0", "cannot be written"),
+        ("0.9.5", "must be higher"),
+        ("one", "not a valid version"),
+    ],
+)
+def test_the_version_is_rejected(releaser, text, message):
+    with pytest.raises(StopRelease, match=message):
+        releaser.the_version = text
+    assert releaser.the_version is None
+
+
+def test_the_version_already_tagged(releaser):
+    releaser.old_version = "0.8"
+    with pytest.raises(StopRelease, match="the tag v0.9 exists"):
+        releaser.the_version = "0.9.0"
+
+
+def test_the_version(releaser):
+    releaser.the_version = " 1.0.0 "
+    assert releaser.the_version == "1.0.0"
+    assert releaser.future_version == "1.0.1.dev1"
+
+
+def test_the_version_without_old_version(releaser):
+    releaser.old_version = None
+    releaser.the_version = "1.0"
+    assert releaser.the_version == "1.0"
+
+
+@pytest.mark.parametrize(
+    "text, allow_dev, message",
+    [
+        ("1.0", True, None),
+        ("1.2.3rc1", False, None),
+        ("1.0.dev2", True, None),
+        ("1.0.dev2", False, "development version"),
+        ("1.0.0+local", True, "local version label"),
+        ("2", True, "at least MAJOR.MINOR"),
+        ("1!2.0", True, "cannot be written"),
+        ("one", True, "not a valid version"),
+    ],
+)
+def test_error_in_version(text, allow_dev, message):
+    error = error_in_version(text, allow_dev=allow_dev)
+    if message is None:
+        assert error is None
+    else:
+        assert message in error